@@ -1,6 +1,8 @@
 import unittest
 
 from tests.misc.lengthratios import *
+from tests.misc.propertyset import *
+from tests.misc.transitivity import *
 
 from tests.scene.midpoint import *
 
@@ -30,6 +32,8 @@ from tests.placement.triangle_points import *
 from tests.placement.morley import *
 from tests.placement.pentagon import *
 from tests.placement.parallel import *
+from tests.placement.gradient import *
+from tests.placement.multistart import *
 
 if __name__ == '__main__':
     unittest.main()
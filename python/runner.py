@@ -5,6 +5,7 @@ from sandbox import iterative_placement
 from sandbox.core import CoreScene
 from sandbox.explainer import Explainer
 from sandbox.hunter import Hunter
+from sandbox.placement import placement_stats
 from sandbox.propertyset import PropertySet
 
 def run_sample(scene, *props):
@@ -12,7 +13,11 @@ def run_sample(scene, *props):
     parser.add_argument('--max-layer', default='user', choices=CoreScene.layers)
     parser.add_argument('--dump', nargs='+', choices=('scene', 'constraints', 'stats', 'result', 'properties', 'explanation'), default=('stats', 'result'))
     parser.add_argument('--run-hunter', action='store_true')
+    parser.add_argument('--placement-processes', type=int, default=1)
+    parser.add_argument('--placement-seed', type=int)
+    parser.add_argument('--placement-cache', metavar='DIRECTORY')
     parser.add_argument('--extra-rules', nargs='+', choices=('advanced', 'circles', 'trigonometric'), default=())
+    parser.add_argument('--adaptive-scheduling', action='store_true')
     parser.add_argument('--profile', action='store_true')
     args = parser.parse_args()
 
@@ -20,7 +25,13 @@ def run_sample(scene, *props):
         scene.dump(include_constraints='constraints' in args.dump, max_layer=args.max_layer)
 
     if args.run_hunter:
-        placement = iterative_placement(scene)
+        attempts = []
+        placement = iterative_placement(
+            scene, processes=args.placement_processes, attempts=attempts,
+            seed=args.placement_seed, cache=args.placement_cache
+        )
+        if 'stats' in args.dump:
+            placement_stats(attempts).dump()
         hunter = Hunter(placement)
         hunter.hunt()
         properties = hunter.properties
@@ -30,6 +41,8 @@ def run_sample(scene, *props):
     options = { 'max_layer': args.max_layer }
     for extra in args.extra_rules:
         options[extra] = True
+    if args.adaptive_scheduling:
+        options['adaptive_scheduling'] = True
     explainer = Explainer(scene, options=options)
 
     if args.profile:
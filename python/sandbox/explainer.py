@@ -22,12 +22,35 @@ from .scene import Scene
 from .stats import Stats
 from .util import LazyComment, Comment
 
+class RuleStats:
+    def __init__(self):
+        self.runs = 0
+        self.time = 0
+        self.useful = 0
+        self.idle = 0 # number of the recent runs with no useful results
+        self.next_run = 0 # generation number
+
+    def record(self, duration, useful):
+        self.runs += 1
+        self.time += duration
+        self.useful += useful
+        self.idle = 0 if useful else self.idle + 1
+
+    @property
+    def rate(self):
+        return self.useful / self.time if self.time > 0 else 0
+
 class Explainer:
     def __init__(self, scene, options={}):
         self.scene = scene
         self.__options = options
-        self.context = PropertySet(self.scene.points(max_layer=self.__max_layer))
+        self.context = PropertySet(
+            self.scene.points(max_layer=self.__max_layer),
+            line_level_perpendiculars=options.get('line_level_perpendiculars', False)
+        )
         self.__explanation_time = None
+        self.__rule_stats = None
+        self.__deferred_rule_calls = 0
         self.__iteration_step_count = -1
         self.__rules = [
             SegmentWithEndpointsOnAngleSidesRule(self.context),
@@ -61,16 +84,14 @@ class Explainer:
             PerpendicularSegmentsRule(self.context),
             Degree90ToPerpendicularSegmentsRule(self.context),
             Degree90ToPerpendicularSegmentsRule2(self.context),
-            PerpendicularTransitivityRule(self.context),
+            ParallelAndPerpendicularTransitivityRule(self.context),
             PerpendicularToEquidistantRule(self.context),
             EquidistantToPerpendicularRule(self.context),
             PointsSeparatedByLineAreNotCoincidentRule(self.context),
             PointInsideSegmentRelativeToLineRule(self.context),
             SameSidePointInsideSegmentRule(self.context),
             TwoPerpendicularsRule(self.context),
-            TwoPerpendicularsRule2(self.context),
             ParallelSameSideRule(self.context),
-            CommonPerpendicularRule(self.context),
             SideProductsInSimilarTrianglesRule(self.context),
             CorrespondingAnglesInCongruentTrianglesRule(self.context),
             CorrespondingAnglesInSimilarTrianglesRule(self.context),
@@ -175,7 +196,8 @@ class Explainer:
             prop.reason = reason
             prop.reason.obsolete = False
             insert(prop)
-        elif reason.cost < existing.reason.cost:
+            return True
+        if reason.cost < existing.reason.cost:
             #### +++ HACK +++
             # TODO: move this hack outside of explainer
             if isinstance(prop, AngleRatioProperty) and prop.same:
@@ -191,6 +213,8 @@ class Explainer:
             # add the property to a transitivity set
             if self.context.index_of(existing) is None:
                 insert(existing)
+            return True
+        return False
 
     def explain(self):
         start = time.time()
@@ -203,16 +227,18 @@ class Explainer:
         self.__explanation_time = time.time() - start
 
     def __explain_all(self):
+        def rule_reasons(rule):
+            for prop, comment, premises in rule.generate():
+                prop.rule = rule
+                yield (prop, comment, premises)
+
         def iteration():
             for rule in self.__rules:
-                for prop, comment, premises in rule.generate():
-                    prop.rule = rule
-                    yield (prop, comment, premises)
-
-            angle_values = [prop for prop in self.context.angle_value_properties() \
-                if prop.angle.vertex is not None]
+                yield from rule_reasons(rule)
+            yield from extra_reasons()
 
-            for av in [av for av in angle_values if av.degree == 0]:
+        def extra_reasons():
+            for av in self.context.angle_value_properties_for_degree(0, lambda angle: angle.vertex):
                 av_is_too_old = av.reason.obsolete
                 vertex = av.angle.vertex
                 pt0 = av.angle.vectors[0].end
@@ -379,7 +405,7 @@ class Explainer:
 #                            [ncl, zero, ne]
 #                        )
 
-            for zero in [p for p in self.context.list(AngleValueProperty) if p.angle.vertex is None and p.degree == 0]:
+            for zero in self.context.zero_angle_value_properties(None):
                 ang = zero.angle
                 ncl = self.context.collinearity_property(*ang.vectors[0].points, ang.vectors[1].points[0])
                 if ncl is None or ncl.collinear:
@@ -417,21 +443,73 @@ class Explainer:
                     comment, premises
                 )
 
-        for prop, comment in enumerate_predefined_properties(self.scene, max_layer=self.__max_layer):
+        for prop, comment in enumerate_predefined_properties(
+            self.scene, max_layer=self.__max_layer,
+            expand_perpendiculars=not self.__options.get('line_level_perpendiculars')
+        ):
             prop.rule = PredefinedPropertyRule.instance()
             self.__reason(prop, comment, [])
 
         self.__iteration_step_count = 0
+        if self.__options.get('adaptive_scheduling'):
+            self.__explain_all_adaptive(rule_reasons, extra_reasons)
+            return
         while itertools.count():
             explained_size = len(self.context)
             for prop, comment, premises in iteration():
                 self.__reason(prop, comment, premises)
-            for prop in self.context.all:
-                prop.reason.obsolete = prop.reason.generation < self.__iteration_step_count - 1
+            self.__update_obsolete_flags()
             self.__iteration_step_count += 1
             if len(self.context) == explained_size:
                 break
 
+    def __update_obsolete_flags(self):
+        for prop in self.context.all:
+            prop.reason.obsolete = prop.reason.generation < self.__iteration_step_count - 1
+
+    def __explain_all_adaptive(self, rule_reasons, extra_reasons):
+        # A rule that produced nothing new (or cheaper) is deferred for
+        # 2, 4, ... generations, up to 2 ** MAX_IDLE_EXPONENT; expensive rules
+        # are deferred twice longer. Rules run in the order of their yield per second.
+        # The loop stops only after a generation where every rule was called.
+        MAX_IDLE_EXPONENT = 4
+        stats = {rule: RuleStats() for rule in self.__rules}
+        self.__rule_stats = stats
+        full_pass = False
+        while itertools.count():
+            explained_size = len(self.context)
+            step = self.__iteration_step_count
+            scheduled = [r for r in self.__rules if full_pass or r.generation_sensitive or stats[r].next_run <= step]
+            scheduled.sort(key=lambda r: -stats[r].rate)
+            deferred = len(scheduled) < len(self.__rules)
+            self.__deferred_rule_calls += len(self.__rules) - len(scheduled)
+            mean_time = sum(st.time for st in stats.values()) / max(1, sum(st.runs for st in stats.values()))
+            for rule in scheduled:
+                st = stats[rule]
+                start = time.time()
+                useful = 0
+                for prop, comment, premises in rule_reasons(rule):
+                    if self.__reason(prop, comment, premises):
+                        useful += 1
+                st.record(time.time() - start, useful)
+                if useful:
+                    st.next_run = step + 1
+                else:
+                    exponent = min(st.idle, MAX_IDLE_EXPONENT)
+                    if st.runs > 1 and st.time / st.runs > mean_time:
+                        exponent += 1
+                    st.next_run = step + 2 ** exponent
+            for prop, comment, premises in extra_reasons():
+                self.__reason(prop, comment, premises)
+            self.__update_obsolete_flags()
+            self.__iteration_step_count += 1
+            if len(self.context) != explained_size:
+                full_pass = False
+            elif deferred:
+                full_pass = True
+            else:
+                break
+
     def dump(self, properties_to_explain=[]):
         def to_string(reason):
             if reason.premises:
@@ -475,7 +553,18 @@ class Explainer:
             Stats(unexplained_by_kind),
             ('Iterations', self.__iteration_step_count),
             ('Explanation time', '%.3f sec' % self.__explanation_time),
-        ], 'Explainer stats')
+        ] + self.__rule_stats_items(), 'Explainer stats')
+
+    def __rule_stats_items(self):
+        if self.__rule_stats is None:
+            return []
+        rules = sorted(self.__rule_stats.items(), key=lambda pair: -pair[1].useful)
+        return [
+            ('Deferred rule calls', self.__deferred_rule_calls),
+            Stats([
+                (type(rule).__name__, '%d useful of %d calls, %.3f sec' % (st.useful, st.runs, st.time)) for rule, st in rules
+            ], 'Rules')
+        ]
 
     def explained(self, obj):
         if isinstance(obj, Property):
@@ -1,8 +1,16 @@
+import hashlib
 import itertools
+import json
+import multiprocessing
+import os
+import time
 import numpy as np
-from scipy.optimize import minimize
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from scipy.optimize import least_squares, minimize
+from scipy.sparse import csr_matrix
 
 from .core import CoreScene, Constraint
+from .stats import Stats
 
 class TwoDCoordinates:
     def __init__(self, x, y):
@@ -46,6 +54,292 @@ class IncompletePlacementError(Exception):
 class PlacementFailedError(Exception):
     """Cannot place to meet all the conditions"""
 
+class ConstructionPlan:
+    """
+    Scene points in the order of construction, with resolved operands.
+    The order is the same as in the former placement loop: the points are scanned
+    in the scene order, and a point is taken as soon as its operands are taken.
+    A point is referred by its index in the construction order.
+    """
+    def __init__(self, scene: CoreScene):
+        self.scene = scene
+        self.points = []
+        self.index = {} # point => index in self.points
+        self.steps = [] # (point, origin, operand indices)
+        not_placed = [(p, ConstructionPlan.operands(p)) for p in scene.points()]
+        while not_placed:
+            remaining = []
+            for p, operands in not_placed:
+                if all(op in self.index for op in operands):
+                    self.steps.append((p, p.origin, tuple(self.index[op] for op in operands)))
+                    self.index[p] = len(self.points)
+                    self.points.append(p)
+                else:
+                    remaining.append((p, operands))
+            if len(remaining) == len(not_placed):
+                raise PlacementFailedError('Cyclic dependencies in the scene')
+            not_placed = remaining
+        self.__compile_parameters()
+        self.__compile_adjustment_constraints()
+        self.__compile_validation_constraints()
+
+    def __compile_parameters(self):
+        # free parameters in the placement order, and the parameters
+        # each point depends on, as a boolean (points, parameters) array
+        self.parameters = []
+        own = []
+        for p, origin, _ in self.steps:
+            if origin == CoreScene.Point.Origin.free:
+                labels = [p.label + suffix for suffix, attr in (('.x', 'x'), ('.y', 'y')) if not hasattr(p, attr)]
+            elif origin == CoreScene.Point.Origin.circle:
+                labels = [p.label + '.angle']
+            elif origin == CoreScene.Point.Origin.line:
+                labels = [p.label + '.coef']
+            else:
+                labels = []
+            own.append(range(len(self.parameters), len(self.parameters) + len(labels)))
+            self.parameters += labels
+        self.parameter_index = {label: index for index, label in enumerate(self.parameters)}
+        self.parameter_steps = np.array([step for step, rng in enumerate(own) for _ in rng], dtype=np.int64)
+        self.dependencies = np.zeros((len(self.steps), len(self.parameters)), dtype=bool)
+        for index, (_, _, operands) in enumerate(self.steps):
+            deps = self.dependencies[index]
+            deps[list(own[index])] = True
+            for op in operands:
+                deps |= self.dependencies[op]
+
+    def __compile_adjustment_constraints(self):
+        def pairs(lst):
+            return np.array(lst, dtype=np.int64).reshape((len(lst), 2))
+
+        index = self.index
+        angles = {} # (index, index, index, index) => angle number
+        def angle_number(vec0, vec1):
+            key = (index[vec0.start], index[vec0.end], index[vec1.start], index[vec1.end])
+            return angles.setdefault(key, len(angles))
+
+        distances, distance_values = [], []
+        ratios0, ratios1, ratio_values = [], [], []
+        collinear0, collinear1 = [], []
+        perpendicular0, perpendicular1 = [], []
+        angle_values, angle_degrees = [], []
+        angles0, angles1, angle_ratios = [], [], []
+        parallels = []
+        self.has_distance_constraint = False
+        for cnstr in self.scene.adjustment_constraints:
+            if hasattr(cnstr, 'guaranteed') and cnstr.guaranteed:
+                continue
+
+            if cnstr.kind == Constraint.Kind.distance:
+                self.has_distance_constraint = True
+                distances.append([index[pt] for pt in cnstr.params[0].points])
+                distance_values.append(np.float64(cnstr.params[1]))
+            elif cnstr.kind == Constraint.Kind.length_ratio:
+                ratios0.append([index[pt] for pt in cnstr.params[0].points])
+                ratios1.append([index[pt] for pt in cnstr.params[1].points])
+                ratio_values.append(np.float64(cnstr.params[2]))
+            elif cnstr.kind == Constraint.Kind.equilateral:
+                sides = cnstr.params[0].sides
+                for side0, side1 in ((sides[0], sides[1]), (sides[1], sides[2])):
+                    ratios0.append([index[pt] for pt in side0.points])
+                    ratios1.append([index[pt] for pt in side1.points])
+                    ratio_values.append(np.float64(1))
+            elif cnstr.kind == Constraint.Kind.collinear:
+                pt = index[cnstr.params[0]]
+                collinear0.append([pt, index[cnstr.params[1]]])
+                collinear1.append([pt, index[cnstr.params[2]]])
+            elif cnstr.kind == Constraint.Kind.perpendicular:
+                self.has_distance_constraint = True
+                perpendicular0.append([index[pt] for pt in cnstr.params[0].points])
+                perpendicular1.append([index[pt] for pt in cnstr.params[1].points])
+            elif cnstr.kind == Constraint.Kind.angle_value:
+                angle_values.append(angle_number(*cnstr.params[0].vectors))
+                angle_degrees.append(np.float64(cnstr.params[1] * np.pi / 180))
+            elif cnstr.kind == Constraint.Kind.angles_ratio:
+                angles0.append(angle_number(*cnstr.params[0].vectors))
+                angles1.append(angle_number(*cnstr.params[1].vectors))
+                angle_ratios.append(np.float64(cnstr.params[2]))
+            elif cnstr.kind == Constraint.Kind.parallel_vectors:
+                parallels.append(angle_number(cnstr.params[0], cnstr.params[1]))
+            else:
+                assert False, 'Constraint `%s` not supported in adjustment' % cnstr.kind
+
+        self.distances = pairs(distances)
+        self.distance_values = np.array(distance_values, dtype=np.float64)
+        self.ratios0 = pairs(ratios0)
+        self.ratios1 = pairs(ratios1)
+        self.ratio_values = np.array(ratio_values, dtype=np.float64)
+        self.collinear0 = pairs(collinear0)
+        self.collinear1 = pairs(collinear1)
+        self.perpendicular0 = pairs(perpendicular0)
+        self.perpendicular1 = pairs(perpendicular1)
+        self.angles = np.array(list(angles.keys()), dtype=np.int64).reshape((len(angles), 4))
+        self.angle_values = np.array(angle_values, dtype=np.int64)
+        self.angle_degrees = np.array(angle_degrees, dtype=np.float64)
+        self.angles0 = np.array(angles0, dtype=np.int64)
+        self.angles1 = np.array(angles1, dtype=np.int64)
+        self.angle_ratios = np.array(angle_ratios, dtype=np.float64)
+        self.parallels = np.array(parallels, dtype=np.int64)
+        user_points = [index[pt] for pt in self.scene.points(max_layer='user')]
+        self.user_pairs = pairs(list(itertools.combinations(user_points, 2)))
+
+    def __compile_validation_constraints(self):
+        # validation[i] is the list of (point indices, checker) for the constraints
+        # that become decidable when the i-th point is placed
+        self.validation = [[] for _ in self.steps]
+        for cnstr in self.scene.validation_constraints:
+            if hasattr(cnstr, 'guaranteed') and cnstr.guaranteed:
+                continue
+            points, checker = _validation_checker(cnstr)
+            indexes = np.array([self.index[pt] for pt in points], dtype=np.int64)
+            self.validation[max(indexes)].append((indexes, checker))
+
+    def random_parameters(self, count):
+        """
+        (count, parameters) array of random parameter vectors,
+        distributed as in a Placement without predefined parameters
+        """
+        data = np.random.random((count, len(self.parameters)))
+        angles = [index for index, label in enumerate(self.parameters) if label.endswith('.angle')]
+        others = [index for index, label in enumerate(self.parameters) if not label.endswith('.angle')]
+        data[:, angles] *= 2 * np.pi
+        data[:, others] = np.tan((data[:, others] - 0.5) * np.pi)
+        return data
+
+    def clusters(self):
+        """
+        Decomposition of the residuals into clusters solved one after another.
+        A residual goes to the cluster of its lead point, the last point
+        (in the construction order) that owns a parameter the residual depends on;
+        the cluster varies the parameters of the lead point only. The residuals
+        of a cluster do not depend on the parameters of the subsequent clusters.
+        Returns a list of (residual indices, parameter indices) in the construction order;
+        the residuals that do not depend on any parameter are not included.
+        """
+        sparsity = self.jacobian_sparsity()
+        by_step = {}
+        for row, deps in enumerate(sparsity):
+            columns = np.nonzero(deps)[0]
+            if len(columns) > 0:
+                by_step.setdefault(self.parameter_steps[columns[-1]], []).append(row)
+        return [
+            (np.array(rows, dtype=np.int64), np.nonzero(self.parameter_steps == step)[0])
+            for step, rows in sorted(by_step.items())
+        ]
+
+    def residual_points(self):
+        """
+        Point indices of each residual, a list of (residuals, points) arrays
+        in the order of Placement.residuals()
+        """
+        angles = self.angles
+        groups = [
+            self.distances,
+            np.concatenate((self.perpendicular0, self.perpendicular1), axis=1),
+            np.concatenate((self.ratios0, self.ratios1), axis=1),
+            np.concatenate((self.collinear0, self.collinear1), axis=1),
+            angles[self.angle_values],
+            np.concatenate((angles[self.angles0], angles[self.angles1]), axis=1),
+            np.repeat(angles[self.parallels], 2, axis=0)
+        ]
+        return [group for group in groups if len(group) > 0]
+
+    def jacobian_sparsity(self):
+        """
+        Boolean (residuals, parameters) array, True if the residual
+        may depend on the parameter
+        """
+        rows = [np.any(self.dependencies[group], axis=1) for group in self.residual_points()]
+        if not rows:
+            return np.zeros((0, len(self.parameters)), dtype=bool)
+        return np.concatenate(rows)
+
+    @staticmethod
+    def operands(p: CoreScene.Point):
+        if p.origin == CoreScene.Point.Origin.free:
+            return ()
+        if p.origin == CoreScene.Point.Origin.circle:
+            return (p.circle.centre, *p.circle.radius.points)
+        if p.origin == CoreScene.Point.Origin.line:
+            return (p.line.point0, p.line.point1)
+        if p.origin == CoreScene.Point.Origin.translated:
+            return (p.base, p.delta.start, p.delta.end)
+        if p.origin == CoreScene.Point.Origin.perp:
+            return (p.point, p.line.point0, p.line.point1)
+        if p.origin == CoreScene.Point.Origin.line_x_line:
+            return (p.line0.point0, p.line0.point1, p.line1.point0, p.line1.point1)
+        if p.origin == CoreScene.Point.Origin.circle_x_line:
+            return (p.circle.centre, *p.circle.radius.points, p.line.point0, p.line.point1)
+        if p.origin == CoreScene.Point.Origin.circle_x_circle:
+            return (p.circle0.centre, *p.circle0.radius.points, p.circle1.centre, *p.circle1.radius.points)
+        assert False, 'Origin `%s` not supported in placement' % p.origin
+
+def _validation_checker(constraint):
+    # Returns (points, checker) for the validation constraint; the checker takes
+    # the point locations as (batch, 2) arrays and returns a boolean (batch,) array;
+    # Placement passes single (2,) locations and gets a boolean
+    def clockwise(pt0, pt1, pt2):
+        vec0 = pt0 - pt1
+        vec1 = pt0 - pt2
+        return np.sign(vec0[..., 0] * vec1[..., 1] - vec0[..., 1] * vec1[..., 0])
+    def scalar_product(start0, end0, start1, end1):
+        return np.sum((end0 - start0) * (end1 - start1), axis=-1)
+
+    kind = constraint.kind
+    params = constraint.params
+    if kind == Constraint.Kind.not_equal:
+        return (params[0], params[1]), \
+            lambda pt0, pt1: np.any(np.fabs(pt0 - pt1) >= 5e-6, axis=-1)
+    if kind == Constraint.Kind.not_collinear:
+        return (params[0], params[1], params[2]), \
+            lambda pt0, pt1, pt2: clockwise(pt0, pt1, pt2) != 0
+    if kind == Constraint.Kind.opposite_side:
+        def opposite_side(pt0, pt1, start, end):
+            clo0 = clockwise(start, end, pt0)
+            clo1 = clockwise(start, end, pt1)
+            return (clo0 != 0) & (clo1 != 0) & (clo0 != clo1)
+        return (params[0], params[1], params[2].point0, params[2].point1), opposite_side
+    if kind == Constraint.Kind.same_side:
+        def same_side(pt0, pt1, start, end):
+            clo0 = clockwise(start, end, pt0)
+            clo1 = clockwise(start, end, pt1)
+            return (clo0 != 0) & (clo0 == clo1)
+        return (params[0], params[1], params[2].point0, params[2].point1), same_side
+    if kind == Constraint.Kind.inside_angle:
+        def inside_angle(pt, vertex, side_pt0, side_pt1):
+            clo0 = clockwise(vertex, side_pt0, pt)
+            clo1 = clockwise(vertex, pt, side_pt1)
+            clo2 = clockwise(vertex, side_pt0, side_pt1)
+            return (clo0 != 0) & (clo0 == clo1) & (clo0 == clo2)
+        angle = params[1]
+        return (params[0], angle.vertex, angle.vectors[0].end, angle.vectors[1].end), inside_angle
+    if kind == Constraint.Kind.quadrilateral:
+        def quadrilateral(pt0, pt1, pt2, pt3):
+            clockwise_list = [clockwise(x, y, z) for (x, y, z) in
+                [(pt0, pt1, pt2), (pt1, pt2, pt3), (pt2, pt3, pt0), (pt3, pt0, pt1)]]
+            nonzero = np.all([clo != 0 for clo in clockwise_list], axis=0)
+            return nonzero & (sum(clockwise_list) != 0)
+        return tuple(params[0:4]), quadrilateral
+    if kind == Constraint.Kind.convex_polygon:
+        def convex_polygon(*points):
+            orientations = [clockwise(*triple) for triple in itertools.combinations(points, 3)]
+            return np.all([(clo != 0) & (clo == orientations[0]) for clo in orientations], axis=0)
+        return tuple(params[0]), convex_polygon
+    if kind == Constraint.Kind.same_direction:
+        return (params[0], params[1], params[2]), \
+            lambda pt, pt0, pt1: scalar_product(pt, pt0, pt, pt1) >= 0
+    if kind == Constraint.Kind.inside_segment:
+        return (params[0], *params[1].points), \
+            lambda pt, pt0, pt1: scalar_product(pt, pt0, pt, pt1) < 0
+    if kind in (Constraint.Kind.acute_angle, Constraint.Kind.obtuse_angle):
+        vec0, vec1 = params[0].vectors
+        if kind == Constraint.Kind.acute_angle:
+            checker = lambda start0, end0, start1, end1: scalar_product(start0, end0, start1, end1) > 0
+        else:
+            checker = lambda start0, end0, start1, end1: scalar_product(start0, end0, start1, end1) < 0
+        return (vec0.start, vec0.end, vec1.start, vec1.end), checker
+    assert False, 'Constraint `%s` not supported in placement' % kind
+
 class BasePlacement:
     def length(self, vector):
         start = self.location(vector.points[0])
@@ -91,318 +385,240 @@ class BasePlacement:
         return np.arccos(cos)
 
 class Placement(BasePlacement):
-    class TempPlacement(BasePlacement):
-        def __init__(self, placement, point, coords):
-            self._coordinates = dict(placement._coordinates)
-            self._coordinates[point] = coords
-
-        def location(self, point: CoreScene.Point) -> TwoDCoordinates:
-            loca = self._coordinates.get(point)
-            if loca is None:
-                raise IncompletePlacementError
-            return loca
-
-        def clockwise(self, p0: TwoDCoordinates, p1: TwoDCoordinates, p2: TwoDCoordinates) -> int:
-            clo = TwoDVector(p1, p0).vector_product(TwoDVector(p2, p0))
-            if clo == 0:
-                return 0
-            return 1 if clo > 0 else -1
-
-        def validate(self, constraint):
-            if hasattr(constraint, 'guaranteed') and constraint.guaranteed:
-                return True
-
-            if constraint.kind == Constraint.Kind.not_equal:
-                pt0 = self.location(constraint.params[0])
-                pt1 = self.location(constraint.params[1])
-                return np.fabs(pt0.x - pt1.x) >= 5e-6 or np.fabs(pt0.y - pt1.y) >= 5e-6
-            if constraint.kind == Constraint.Kind.not_collinear:
-                pt0 = self.location(constraint.params[0])
-                pt1 = self.location(constraint.params[1])
-                pt2 = self.location(constraint.params[2])
-                return self.clockwise(pt0, pt1, pt2) != 0
-            if constraint.kind == Constraint.Kind.opposite_side:
-                pt0 = self.location(constraint.params[0])
-                pt1 = self.location(constraint.params[1])
-                line = constraint.params[2]
-                start = self.location(line.point0)
-                end = self.location(line.point1)
-                clo0 = self.clockwise(start, end, pt0)
-                clo1 = self.clockwise(start, end, pt1)
-                return clo0 != 0 and clo1 != 0 and clo0 != clo1
-            if constraint.kind == Constraint.Kind.same_side:
-                pt0 = self.location(constraint.params[0])
-                pt1 = self.location(constraint.params[1])
-                line = constraint.params[2]
-                start = self.location(line.point0)
-                end = self.location(line.point1)
-                clo0 = self.clockwise(start, end, pt0)
-                clo1 = self.clockwise(start, end, pt1)
-                return clo0 != 0 and clo0 == clo1
-            if constraint.kind == Constraint.Kind.inside_angle:
-                pt = self.location(constraint.params[0])
-                angle = constraint.params[1]
-                vertex = self.location(angle.vertex)
-                side_pt0 = self.location(angle.vectors[0].end)
-                side_pt1 = self.location(angle.vectors[1].end)
-                clo0 = self.clockwise(vertex, side_pt0, pt)
-                clo1 = self.clockwise(vertex, pt, side_pt1)
-                clo2 = self.clockwise(vertex, side_pt0, side_pt1)
-                return clo0 != 0 and clo0 == clo1 and clo0 == clo2
-            if constraint.kind == Constraint.Kind.quadrilateral:
-                pt0 = self.location(constraint.params[0])
-                pt1 = self.location(constraint.params[1])
-                pt2 = self.location(constraint.params[2])
-                pt3 = self.location(constraint.params[3])
-                clockwise = [self.clockwise(x, y, z) for (x, y, z) in
-                             [(pt0, pt1, pt2), (pt1, pt2, pt3), (pt2, pt3, pt0), (pt3, pt0, pt1)]]
-                return 0 not in clockwise and sum(clockwise) != 0
-            if constraint.kind == Constraint.Kind.convex_polygon:
-                points = [self.location(pt) for pt in constraint.params[0]]
-                orientation = None
-                for pt0, pt1, pt2 in itertools.combinations(points, 3):
-                    clockwise = self.clockwise(pt0, pt1, pt2)
-                    if clockwise == 0:
-                        return False
-                    if orientation is None:
-                        orientation = clockwise
-                    elif orientation != clockwise:
-                        return False
-                return True
-            if constraint.kind == Constraint.Kind.same_direction:
-                pt = constraint.params[0]
-                vec0 = pt.vector(constraint.params[1])
-                vec1 = pt.vector(constraint.params[2])
-                return self.scalar_product(vec0, vec1) >= 0
-            if constraint.kind == Constraint.Kind.inside_segment:
-                pt = constraint.params[0]
-                vec0 = pt.vector(constraint.params[1].points[0])
-                vec1 = pt.vector(constraint.params[1].points[1])
-                return self.scalar_product(vec0, vec1) < 0
-            if constraint.kind == Constraint.Kind.acute_angle:
-                angle = constraint.params[0]
-                return self.scalar_product(*angle.vectors) > 0
-            if constraint.kind == Constraint.Kind.obtuse_angle:
-                angle = constraint.params[0]
-                return self.scalar_product(*angle.vectors) < 0
-
-            assert False, 'Constraint `%s` not supported in placement' % constraint.kind
-
-    def __init__(self, scene: CoreScene, params=None):
+    def __init__(self, scene: CoreScene, params=None, plan=None):
         self.scene = scene
-        self._coordinates = {}
         self.params = params if params else {}
         self.__deviation = None
 
         frozen = scene.is_frozen
         if not frozen:
             scene.freeze()
+        self.plan = plan if plan else ConstructionPlan(scene)
+        self.__locations = [] # TwoDCoordinates, in the plan order
+        self.__xy = np.empty((len(self.plan.points), 2), dtype=np.float64)
         self.__place()
         if not frozen:
             scene.unfreeze()
 
     def __place(self):
-        not_placed = list(self.scene.points())
-        passed_constraints = set()
+        xy = self.__xy
         def add(p: CoreScene.Point, *coords):
             if hasattr(p, 'x') and hasattr(p, 'y'):
                 coords = sorted(coords, key=lambda coo: np.hypot(coo.x - p.x, coo.y - p.y))
+            index = len(self.__locations)
+            # only the constraints that become decidable with this point are checked,
+            # on the views of the shared coordinates array
+            checks = self.plan.validation[index]
             for candidate in coords:
-                temp = Placement.TempPlacement(self, p, candidate)
-                for cs in self.scene.validation_constraints:
-                    if cs in passed_constraints:
-                        continue
-                    try:
-                        if temp.validate(cs):
-                            passed_constraints.add(cs)
-                        else:
-                            break
-                    except IncompletePlacementError:
-                        continue
-                else:
-                    self._coordinates[p] = candidate
-                    not_placed.remove(p)
+                xy[index] = (candidate.x, candidate.y)
+                if all(checker(*(xy[i] for i in indexes)) for indexes, checker in checks):
+                    self.__locations.append(candidate)
                     return
             raise PlacementFailedError('Cannot meet the constraints')
 
-        while len(not_placed) > 0:
-            for p in list(not_placed):
-                try:
-                    if p.origin == CoreScene.Point.Origin.free:
-                        add(p, TwoDCoordinates(
-                            np.float64(p.x) if hasattr(p, 'x') else self.__get_coord(p.label + '.x'),
-                            np.float64(p.y) if hasattr(p, 'y') else self.__get_coord(p.label + '.y')
-                        ))
-                    elif p.origin == CoreScene.Point.Origin.circle:
-                        o = self.location(p.circle.centre)
-                        r = self.radius(p.circle)
-                        angle = self.__get_angle(p.label + '.angle')
-                        add(p, TwoDCoordinates(
-                            o.x + np.sin(angle) * r,
-                            o.y + np.cos(angle) * r
-                        ))
-                    elif p.origin == CoreScene.Point.Origin.line:
-                        loc0 = self.location(p.line.point0)
-                        loc1 = self.location(p.line.point1)
-                        coef = self.__get_coord(p.label + '.coef')
-                        add(p, TwoDCoordinates(
-                            0.5 * (loc0.x + loc1.x) + coef * (loc0.x - loc1.x),
-                            0.5 * (loc0.y + loc1.y) + coef * (loc0.y - loc1.y)
-                        ))
-                    elif p.origin == CoreScene.Point.Origin.translated:
-                        base = self.location(p.base)
-                        start = self.location(p.delta.start)
-                        end = self.location(p.delta.end)
-                        coef = np.float64(p.coef)
-                        add(p, TwoDCoordinates(
-                            base.x + coef * (end.x - start.x),
-                            base.y + coef * (end.y - start.y)
-                        ))
-                    elif p.origin == CoreScene.Point.Origin.perp:
-                        p0 = self.location(p.point)
-                        p1 = self.location(p.line.point0)
-                        p2 = self.location(p.line.point1)
-                        add(p, TwoDCoordinates(
-                            p0.x + p1.y - p2.y,
-                            p0.y + p2.x - p1.x
-                        ))
-                    elif p.origin == CoreScene.Point.Origin.line_x_line:
-                        p0 = self.location(p.line0.point0)
-                        p1 = self.location(p.line0.point1)
-                        p2 = self.location(p.line1.point0)
-                        p3 = self.location(p.line1.point1)
-                        # x = a * p0.x + (1-a) * p1.x
-                        # y = a * p0.y + (1-a) * p1.y
-                        # x = b * p2.x + (1-b) * p3.x
-                        # y = b * p2.y + (1-b) * p3.y
-
-                        # x = p1.x + a * (p0.x - p1.x) | *(p0.y - p1.y)
-                        # y = p1.y + a * (p0.y - p1.y) | *(p0.x - p1.x)
-                        # (p0.y - p1.y) * x + (p1.x - p0.x) * y = p1.x * p0.y - p1.y * p0.x
-                        # (p2.y - p3.y) * x + (p3.x - p2.x) * y = p3.x * p2.y - p3.y * p2.x
-                        cx0 = p0.y - p1.y
-                        cy0 = p1.x - p0.x
-                        cx1 = p2.y - p3.y
-                        cy1 = p3.x - p2.x
-                        discr = cx0 * cy1 - cx1 * cy0
-                        if np.fabs(discr) < 1e-8:
-                            raise PlacementFailedError('Lines have no intersection points')
-                        s0 = p1.x * p0.y - p1.y * p0.x
-                        s1 = p3.x * p2.y - p3.y * p2.x
-                        add(p, TwoDCoordinates(
-                            (s0 * cy1 - s1 * cy0) / discr,
-                            (s1 * cx0 - s0 * cx1) / discr,
-                        ))
-                    elif p.origin == CoreScene.Point.Origin.circle_x_line:
-                        c = self.location(p.circle.centre)
-                        r2 = self.radius2(p.circle)
-                        p0 = self.location(p.line.point0)
-                        p1 = self.location(p.line.point1)
-                        # (x - c.x)^2 + (y - c.y)^2 == r2
-                        # x = a * p0.x + (1-a) * p1.x
-                        # y = a * p0.y + (1-a) * p1.y
-                        # (p0.y - p1.y) * x + (p1.x - p0.x) * y = p1.x * p0.y - p1.y * p0.x
-                        if np.fabs(p1.x - p0.x) >= 5e-6:
-                            # y = ((p0.y - p1.y) * x - (p1.x * p0.y - p1.y * p0.x)) / (p0.x - p1.x)
-                            coef_x = (p0.y - p1.y) / (p0.x - p1.x)
-                            coef = (p1.x * p0.y - p1.y * p0.x) / (p1.x - p0.x)
-                            # y = coef_x * x + coef
-                            # (x - c.x)^2 + (coef_x * x + coef - c.y)^2 = r2
-                            # (1 + coef_x^2) * x^2 + 2 * (coef_x * (coef - c.y) - c.x) * x + c.x^2 + (coef - c.y)^2 - r2 = 0
-                            qa = 1 + coef_x ** 2
-                            qb = coef_x * (coef - c.y) - c.x
-                            qc = c.x ** 2 + (coef - c.y) ** 2 - r2
-                            discr = qb * qb - qa * qc
-                            if discr < 0:
-                                if discr > -1e-8:
-                                    discr = 0
-                                else:
-                                    raise PlacementFailedError('The line and the circle have no intersection points')
-                            # y = (-qb +- sqrt(discr)) / qa
-                            sqrt = np.sqrt(discr)
-                            x_1 = (-qb + sqrt) / qa
-                            x_2 = (-qb - sqrt) / qa
-                            y_1 = coef + coef_x * x_1
-                            y_2 = coef + coef_x * x_2
-                        elif np.fabs(p1.y - p0.y) >= 5e-6:
-                            coef_y = (p0.x - p1.x) / (p0.y - p1.y)
-                            coef = (p1.y * p0.x - p1.x * p0.y) / (p1.y - p0.y)
-                            qa = 1 + coef_y ** 2
-                            qb = coef_y * (coef - c.x) - c.y
-                            qc = c.y ** 2 + (coef - c.x) ** 2 - r2
-                            discr = qb * qb - qa * qc
-                            if discr < 0:
-                                if discr > -1e-8:
-                                    discr = 0
-                                else:
-                                    raise PlacementFailedError('The line and the circle have no intersection points')
-                            sqrt = np.sqrt(discr)
-                            y_1 = (-qb + discr) / qa
-                            y_2 = (-qb - discr) / qa
-                            x_1 = coef + coef_y * y_1
-                            x_2 = coef + coef_y * y_2
-                        else:
-                            raise PlacementFailedError
-                        add(p, TwoDCoordinates(x_1, y_1), TwoDCoordinates(x_2, y_2))
-                    elif p.origin == CoreScene.Point.Origin.circle_x_circle:
-                        c0 = self.location(p.circle0.centre)
-                        c1 = self.location(p.circle1.centre)
-                        r02 = self.radius2(p.circle0)
-                        r12 = self.radius2(p.circle1)
-                        # (x - c0.x)^2 + (y - c0.y)^2 == r02
-                        # (x - c1.x)^2 + (y - c1.y)^2 == r12
-                        # 2x(c1.x - c0.x) + c0.x^2 - c1.x^2 + 2y(c1.y - c0.y) + c0.y^2 - c1.y^2 = r02 - r12
-                        if np.fabs(c1.x - c0.x) > 5e-6:
-                            # 2x(c1.x - c0.x) = r02 - r12 - c0.x^2 - c0.y^2 + c1.x^2 + c1.y^2 + 2y(c0.y - c1.y)
-                            x_coef = 2 * (c1.x - c0.x)
-                            y_coef = 2 * (c0.y - c1.y) / x_coef
-                            const = (r02 - r12 - c0.x * c0.x - c0.y * c0.y + c1.x * c1.x + c1.y * c1.y) / x_coef
-                            # x = const + y_coef * y
-                            # (const + y_coef * y - c0.x)^2 + (y - c0.y)^2 == r02
-                            # (1 + y_coef^2) * y^2 + 2 (const * y_coef - c0.x * y_coef - c0.y) * y + (const - c0.x)^2 + c0.y^2 - r02
-                            a = 1 + y_coef * y_coef
-                            b = (const - c0.x) * y_coef - c0.y
-                            c = (const - c0.x) ** 2 + c0.y ** 2 - r02
-                            # a y^2 + 2b y + c = 0
-                            discr = b * b - a * c
-                            if discr < 0:
-                                if discr > -1e-8:
-                                    discr = 0
-                                else:
-                                    raise PlacementFailedError('The circles have no intersection points')
-                            # y = (-b +- sqrt(discr)) / a
-                            #print("%.3f y^2 + %.3f y + %.3f = 0" % (a, 2 * b, c))
-                            sqrt = np.sqrt(discr)
-                            y_1 = (-b + sqrt) / a
-                            y_2 = (-b - sqrt) / a
-                            x_1 = const + y_coef * y_1
-                            x_2 = const + y_coef * y_2
-                        elif np.fabs(c1.y - c0.y) > 5e-6:
-                            y_coef = 2 * (c1.y - c0.y)
-                            x_coef = 2 * (c0.x - c1.x) / y_coef
-                            const = (r02 - r12 - c0.y * c0.y - c0.x * c0.x + c1.y * c1.y + c1.x * c1.x) / y_coef
-                            a = 1 + x_coef * x_coef
-                            b = (const - c0.y) * x_coef - c0.x
-                            c = (const - c0.y) ** 2 + c0.x ** 2 - r02
-                            discr = b * b - a * c
-                            if discr < 0:
-                                if discr > -1e-8:
-                                    discr = 0
-                                else:
-                                    raise PlacementFailedError('The circles have no intersection points')
-                            #print("%.3f x^2 + %.3f x + %.3f = 0" % (a, 2 * b, c))
-                            sqrt = np.sqrt(discr)
-                            x_1 = (-b + sqrt) / a
-                            x_2 = (-b - sqrt) / a
-                            y_1 = const + x_coef * x_1
-                            y_2 = const + x_coef * x_2
-                        else:
-                            raise PlacementFailedError
-                        add(p, TwoDCoordinates(x_1, y_1), TwoDCoordinates(x_2, y_2))
-                    else:
-                        assert False, 'Origin `%s` not supported in placement' % p.origin
-                except IncompletePlacementError:
-                    pass
+        placers = {
+            CoreScene.Point.Origin.free: self.__free,
+            CoreScene.Point.Origin.circle: self.__on_circle,
+            CoreScene.Point.Origin.line: self.__on_line,
+            CoreScene.Point.Origin.translated: self.__translated,
+            CoreScene.Point.Origin.perp: self.__perpendicular,
+            CoreScene.Point.Origin.line_x_line: self.__line_x_line,
+            CoreScene.Point.Origin.circle_x_line: self.__circle_x_line,
+            CoreScene.Point.Origin.circle_x_circle: self.__circle_x_circle,
+        }
+        for p, origin, operands in self.plan.steps:
+            add(p, *placers[origin](p, *operands))
+
+    def __loc(self, index):
+        # the plan guarantees that the operands are placed before use
+        return self.__locations[index]
+
+    def __free(self, p):
+        return (TwoDCoordinates(
+            np.float64(p.x) if hasattr(p, 'x') else self.__get_coord(p.label + '.x'),
+            np.float64(p.y) if hasattr(p, 'y') else self.__get_coord(p.label + '.y')
+        ),)
+
+    def __on_circle(self, p, centre, r0, r1):
+        o = self.__loc(centre)
+        start = self.__loc(r0)
+        end = self.__loc(r1)
+        r = np.hypot(end.x - start.x, end.y - start.y)
+        angle = self.__get_angle(p.label + '.angle')
+        return (TwoDCoordinates(
+            o.x + np.sin(angle) * r,
+            o.y + np.cos(angle) * r
+        ),)
+
+    def __on_line(self, p, pt0, pt1):
+        loc0 = self.__loc(pt0)
+        loc1 = self.__loc(pt1)
+        coef = self.__get_coord(p.label + '.coef')
+        return (TwoDCoordinates(
+            0.5 * (loc0.x + loc1.x) + coef * (loc0.x - loc1.x),
+            0.5 * (loc0.y + loc1.y) + coef * (loc0.y - loc1.y)
+        ),)
+
+    def __translated(self, p, base, start, end):
+        base = self.__loc(base)
+        start = self.__loc(start)
+        end = self.__loc(end)
+        coef = np.float64(p.coef)
+        return (TwoDCoordinates(
+            base.x + coef * (end.x - start.x),
+            base.y + coef * (end.y - start.y)
+        ),)
+
+    def __perpendicular(self, p, pt, pt0, pt1):
+        p0 = self.__loc(pt)
+        p1 = self.__loc(pt0)
+        p2 = self.__loc(pt1)
+        return (TwoDCoordinates(
+            p0.x + p1.y - p2.y,
+            p0.y + p2.x - p1.x
+        ),)
+
+    def __line_x_line(self, p, pt0, pt1, pt2, pt3):
+        p0 = self.__loc(pt0)
+        p1 = self.__loc(pt1)
+        p2 = self.__loc(pt2)
+        p3 = self.__loc(pt3)
+        # x = a * p0.x + (1-a) * p1.x
+        # y = a * p0.y + (1-a) * p1.y
+        # x = b * p2.x + (1-b) * p3.x
+        # y = b * p2.y + (1-b) * p3.y
+
+        # x = p1.x + a * (p0.x - p1.x) | *(p0.y - p1.y)
+        # y = p1.y + a * (p0.y - p1.y) | *(p0.x - p1.x)
+        # (p0.y - p1.y) * x + (p1.x - p0.x) * y = p1.x * p0.y - p1.y * p0.x
+        # (p2.y - p3.y) * x + (p3.x - p2.x) * y = p3.x * p2.y - p3.y * p2.x
+        cx0 = p0.y - p1.y
+        cy0 = p1.x - p0.x
+        cx1 = p2.y - p3.y
+        cy1 = p3.x - p2.x
+        discr = cx0 * cy1 - cx1 * cy0
+        if np.fabs(discr) < 1e-8:
+            raise PlacementFailedError('Lines have no intersection points')
+        s0 = p1.x * p0.y - p1.y * p0.x
+        s1 = p3.x * p2.y - p3.y * p2.x
+        return (TwoDCoordinates(
+            (s0 * cy1 - s1 * cy0) / discr,
+            (s1 * cx0 - s0 * cx1) / discr,
+        ),)
+
+    def __circle_x_line(self, p, centre, r0, r1, pt0, pt1):
+        c = self.__loc(centre)
+        start = self.__loc(r0)
+        end = self.__loc(r1)
+        r2 = (end.x - start.x) ** 2 + (end.y - start.y) ** 2
+        p0 = self.__loc(pt0)
+        p1 = self.__loc(pt1)
+        # (x - c.x)^2 + (y - c.y)^2 == r2
+        # x = a * p0.x + (1-a) * p1.x
+        # y = a * p0.y + (1-a) * p1.y
+        # (p0.y - p1.y) * x + (p1.x - p0.x) * y = p1.x * p0.y - p1.y * p0.x
+        if np.fabs(p1.x - p0.x) >= 5e-6:
+            # y = ((p0.y - p1.y) * x - (p1.x * p0.y - p1.y * p0.x)) / (p0.x - p1.x)
+            coef_x = (p0.y - p1.y) / (p0.x - p1.x)
+            coef = (p1.x * p0.y - p1.y * p0.x) / (p1.x - p0.x)
+            # y = coef_x * x + coef
+            # (x - c.x)^2 + (coef_x * x + coef - c.y)^2 = r2
+            # (1 + coef_x^2) * x^2 + 2 * (coef_x * (coef - c.y) - c.x) * x + c.x^2 + (coef - c.y)^2 - r2 = 0
+            qa = 1 + coef_x ** 2
+            qb = coef_x * (coef - c.y) - c.x
+            qc = c.x ** 2 + (coef - c.y) ** 2 - r2
+            discr = qb * qb - qa * qc
+            if discr < 0:
+                if discr > -1e-8:
+                    discr = 0
+                else:
+                    raise PlacementFailedError('The line and the circle have no intersection points')
+            # y = (-qb +- sqrt(discr)) / qa
+            sqrt = np.sqrt(discr)
+            x_1 = (-qb + sqrt) / qa
+            x_2 = (-qb - sqrt) / qa
+            y_1 = coef + coef_x * x_1
+            y_2 = coef + coef_x * x_2
+        elif np.fabs(p1.y - p0.y) >= 5e-6:
+            coef_y = (p0.x - p1.x) / (p0.y - p1.y)
+            coef = (p1.y * p0.x - p1.x * p0.y) / (p1.y - p0.y)
+            qa = 1 + coef_y ** 2
+            qb = coef_y * (coef - c.x) - c.y
+            qc = c.y ** 2 + (coef - c.x) ** 2 - r2
+            discr = qb * qb - qa * qc
+            if discr < 0:
+                if discr > -1e-8:
+                    discr = 0
+                else:
+                    raise PlacementFailedError('The line and the circle have no intersection points')
+            sqrt = np.sqrt(discr)
+            y_1 = (-qb + sqrt) / qa
+            y_2 = (-qb - sqrt) / qa
+            x_1 = coef + coef_y * y_1
+            x_2 = coef + coef_y * y_2
+        else:
+            raise PlacementFailedError
+        return (TwoDCoordinates(x_1, y_1), TwoDCoordinates(x_2, y_2))
+
+    def __circle_x_circle(self, p, centre0, r00, r01, centre1, r10, r11):
+        c0 = self.__loc(centre0)
+        c1 = self.__loc(centre1)
+        start = self.__loc(r00)
+        end = self.__loc(r01)
+        r02 = (end.x - start.x) ** 2 + (end.y - start.y) ** 2
+        start = self.__loc(r10)
+        end = self.__loc(r11)
+        r12 = (end.x - start.x) ** 2 + (end.y - start.y) ** 2
+        # (x - c0.x)^2 + (y - c0.y)^2 == r02
+        # (x - c1.x)^2 + (y - c1.y)^2 == r12
+        # 2x(c1.x - c0.x) + c0.x^2 - c1.x^2 + 2y(c1.y - c0.y) + c0.y^2 - c1.y^2 = r02 - r12
+        if np.fabs(c1.x - c0.x) > 5e-6:
+            # 2x(c1.x - c0.x) = r02 - r12 - c0.x^2 - c0.y^2 + c1.x^2 + c1.y^2 + 2y(c0.y - c1.y)
+            x_coef = 2 * (c1.x - c0.x)
+            y_coef = 2 * (c0.y - c1.y) / x_coef
+            const = (r02 - r12 - c0.x * c0.x - c0.y * c0.y + c1.x * c1.x + c1.y * c1.y) / x_coef
+            # x = const + y_coef * y
+            # (const + y_coef * y - c0.x)^2 + (y - c0.y)^2 == r02
+            # (1 + y_coef^2) * y^2 + 2 (const * y_coef - c0.x * y_coef - c0.y) * y + (const - c0.x)^2 + c0.y^2 - r02
+            a = 1 + y_coef * y_coef
+            b = (const - c0.x) * y_coef - c0.y
+            c = (const - c0.x) ** 2 + c0.y ** 2 - r02
+            # a y^2 + 2b y + c = 0
+            discr = b * b - a * c
+            if discr < 0:
+                if discr > -1e-8:
+                    discr = 0
+                else:
+                    raise PlacementFailedError('The circles have no intersection points')
+            # y = (-b +- sqrt(discr)) / a
+            #print("%.3f y^2 + %.3f y + %.3f = 0" % (a, 2 * b, c))
+            sqrt = np.sqrt(discr)
+            y_1 = (-b + sqrt) / a
+            y_2 = (-b - sqrt) / a
+            x_1 = const + y_coef * y_1
+            x_2 = const + y_coef * y_2
+        elif np.fabs(c1.y - c0.y) > 5e-6:
+            y_coef = 2 * (c1.y - c0.y)
+            x_coef = 2 * (c0.x - c1.x) / y_coef
+            const = (r02 - r12 - c0.y * c0.y - c0.x * c0.x + c1.y * c1.y + c1.x * c1.x) / y_coef
+            a = 1 + x_coef * x_coef
+            b = (const - c0.y) * x_coef - c0.x
+            c = (const - c0.y) ** 2 + c0.x ** 2 - r02
+            discr = b * b - a * c
+            if discr < 0:
+                if discr > -1e-8:
+                    discr = 0
+                else:
+                    raise PlacementFailedError('The circles have no intersection points')
+            #print("%.3f x^2 + %.3f x + %.3f = 0" % (a, 2 * b, c))
+            sqrt = np.sqrt(discr)
+            x_1 = (-b + sqrt) / a
+            x_2 = (-b - sqrt) / a
+            y_1 = const + x_coef * x_1
+            y_2 = const + x_coef * x_2
+        else:
+            raise PlacementFailedError
+        return (TwoDCoordinates(x_1, y_1), TwoDCoordinates(x_2, y_2))
 
     def __get_coord(self, label):
         value = self.params.get(label)
@@ -423,10 +639,10 @@ class Placement(BasePlacement):
             point = self.scene.get(point)
         assert isinstance(point, CoreScene.Point), 'Parameter is not a point'
 
-        loca = self._coordinates.get(point)
-        if loca is None:
+        index = self.plan.index.get(point)
+        if index is None or index >= len(self.__locations):
             raise IncompletePlacementError
-        return loca
+        return self.__locations[index]
 
     def radius(self, circle):
         if isinstance(circle, str):
@@ -448,99 +664,1118 @@ class Placement(BasePlacement):
         print('\nDeviation: %.15f' % self.deviation())
 
     def deviation(self):
-        if self.__deviation:
-            return self.__deviation
+        if self.__deviation is None:
+            self.__deviation = self.__evaluate(False)[0]
+        return self.__deviation
+
+    def deviation_gradient(self, keys):
+        """
+        Gradient of deviation() with respect to the parameters listed in keys
+        """
+        gradient = self.__evaluate(True)[1]
+        jacobian = self.__coordinates_jacobian(keys)
+        return np.einsum('ij,ijk->k', gradient, jacobian)
+
+    def __evaluate(self, with_gradient):
+        # Returns (deviation, gradient), the gradient is taken with respect to
+        # the coordinates array, it is None if not requested
+        plan = self.plan
+        xy = self.__xy
+        def vectors(pairs):
+            return xy[pairs[:, 1]] - xy[pairs[:, 0]]
+        def lengths(vecs):
+            return np.hypot(vecs[:, 0], vecs[:, 1])
+        def cross(vecs0, vecs1):
+            return vecs0[:, 0] * vecs1[:, 1] - vecs0[:, 1] * vecs1[:, 0]
+        def orthogonal(vecs):
+            # d cross(v, w) / dv = orthogonal(w)
+            return np.stack((vecs[:, 1], -vecs[:, 0]), axis=1)
+
+        dist_gradient = np.zeros(xy.shape) if with_gradient else None
+        numb_gradient = np.zeros(xy.shape) if with_gradient else None
+        def put(gradient, pairs, dvecs):
+            np.add.at(gradient, pairs[:, 1], dvecs)
+            np.add.at(gradient, pairs[:, 0], -dvecs)
 
-        has_distance_constraint = False
         dist_square = 0.0
         numb_square = 0.0
-        for cnstr in self.scene.adjustment_constraints:
-            if hasattr(cnstr, 'guaranteed') and cnstr.guaranteed:
-                continue
+        if len(plan.distances) > 0:
+            vecs = vectors(plan.distances)
+            lens = lengths(vecs)
+            diff = lens - plan.distance_values
+            dist_square += np.sum(diff ** 2)
+            if with_gradient:
+                put(dist_gradient, plan.distances, (2 * diff / lens)[:, None] * vecs)
+        if len(plan.ratios0) > 0:
+            vecs0 = vectors(plan.ratios0)
+            vecs1 = vectors(plan.ratios1)
+            lens0 = lengths(vecs0)
+            lens1 = lengths(vecs1)
+            quot = lens0 / lens1
+            diff = quot - plan.ratio_values
+            numb_square += np.sum(diff ** 2)
+            if with_gradient:
+                put(numb_gradient, plan.ratios0, (2 * diff / lens1 / lens0)[:, None] * vecs0)
+                put(numb_gradient, plan.ratios1, (-2 * diff * quot / lens1 / lens1)[:, None] * vecs1)
+        if len(plan.collinear0) > 0:
+            vecs0 = vectors(plan.collinear0)
+            vecs1 = vectors(plan.collinear1)
+            lens0 = lengths(vecs0)
+            lens1 = lengths(vecs1)
+            sines = cross(vecs0, vecs1) / lens0 / lens1
+            numb_square += np.sum(sines ** 2)
+            if with_gradient:
+                coef = (2 * sines)[:, None]
+                put(numb_gradient, plan.collinear0, coef * (orthogonal(vecs1) / (lens0 * lens1)[:, None] - (sines / lens0 / lens0)[:, None] * vecs0))
+                put(numb_gradient, plan.collinear1, coef * (-orthogonal(vecs0) / (lens0 * lens1)[:, None] - (sines / lens1 / lens1)[:, None] * vecs1))
+        if len(plan.perpendicular0) > 0:
+            vecs0 = vectors(plan.perpendicular0)
+            vecs1 = vectors(plan.perpendicular1)
+            lens0 = lengths(vecs0)
+            lens1 = lengths(vecs1)
+            # squared scalar product normalized to the length unit
+            products = np.sum(vecs0 * vecs1, axis=1)
+            norm = lens0 * lens1
+            values = products ** 2 / norm
+            dist_square += np.sum(values)
+            if with_gradient:
+                put(dist_gradient, plan.perpendicular0, (2 * products / norm)[:, None] * vecs1 - (values / lens0 / lens0)[:, None] * vecs0)
+                put(dist_gradient, plan.perpendicular1, (2 * products / norm)[:, None] * vecs0 - (values / lens1 / lens1)[:, None] * vecs1)
+        if len(plan.angles) > 0:
+            pairs0 = plan.angles[:, 0:2]
+            pairs1 = plan.angles[:, 2:4]
+            vecs0 = vectors(pairs0)
+            vecs1 = vectors(pairs1)
+            lens0 = lengths(vecs0)
+            lens1 = lengths(vecs1)
+            cos = np.clip(np.sum(vecs0 * vecs1, axis=1) / lens0 / lens1, -1, 1)
+            angles = np.arccos(cos)
+            weights = np.zeros(len(angles)) # d numb_square / d angle
+            if len(plan.angle_values) > 0:
+                diff = angles[plan.angle_values] - plan.angle_degrees
+                numb_square += np.sum(diff ** 2)
+                np.add.at(weights, plan.angle_values, 2 * diff)
+            if len(plan.angles0) > 0:
+                diff = angles[plan.angles0] - angles[plan.angles1] * plan.angle_ratios
+                numb_square += np.sum(diff ** 2)
+                np.add.at(weights, plan.angles0, 2 * diff)
+                np.add.at(weights, plan.angles1, -2 * diff * plan.angle_ratios)
+            if len(plan.parallels) > 0:
+                numb_square += np.sum(angles[plan.parallels] ** 2)
+                np.add.at(weights, plan.parallels, 2 * angles[plan.parallels])
+            if with_gradient:
+                sines = np.sqrt(1 - cos ** 2)
+                # d angle / d cos, the derivative is not defined for degenerate angles
+                coef = np.divide(-weights, sines, out=np.zeros(len(angles)), where=sines > 1e-12)
+                put(numb_gradient, pairs0, coef[:, None] * (vecs1 / (lens0 * lens1)[:, None] - (cos / lens0 / lens0)[:, None] * vecs0))
+                put(numb_gradient, pairs1, coef[:, None] * (vecs0 / (lens0 * lens1)[:, None] - (cos / lens1 / lens1)[:, None] * vecs1))
 
-            if cnstr.kind == Constraint.Kind.distance:
-                has_distance_constraint = True
-                dist_square += (self.length(cnstr.params[0]) - np.float64(cnstr.params[1])) ** 2
-            elif cnstr.kind == Constraint.Kind.length_ratio:
-                seg0 = cnstr.params[0]
-                seg1 = cnstr.params[1]
-                coef = np.float64(cnstr.params[2])
-                numb_square += (self.length(seg0) / self.length(seg1) - coef) ** 2
-            elif cnstr.kind == Constraint.Kind.equilateral:
-                triangle = cnstr.params[0]
-                lens = [self.length(side) for side in triangle.sides]
-                numb_square += (lens[0] / lens[1] - 1) ** 2
-                numb_square += (lens[1] / lens[2] - 1) ** 2
-            elif cnstr.kind == Constraint.Kind.collinear:
-                pt = cnstr.params[0]
-                vec0 = pt.vector(cnstr.params[1])
-                vec1 = pt.vector(cnstr.params[2])
-                numb_square += (self.vector_product(vec0, vec1) / self.length(vec0) / self.length(vec1)) ** 2
-            elif cnstr.kind == Constraint.Kind.perpendicular:
-                has_distance_constraint = True
-                pt0 = self.location(cnstr.params[0].points[0])
-                pt1 = self.location(cnstr.params[0].points[1])
-                pt2 = self.location(cnstr.params[1].points[0])
-                pt3 = self.location(cnstr.params[1].points[1])
-                vec0 = TwoDVector(pt0, pt1)
-                vec1 = TwoDVector(pt2, pt3)
-                dist_square += vec0.length * vec1.length - np.abs(vec0.vector_product(vec1))
-            elif cnstr.kind == Constraint.Kind.angle_value:
-                angle = cnstr.params[0]
-                degree = cnstr.params[1]
-                numb_square += (self.angle(angle) - degree * np.pi / 180) ** 2
-            elif cnstr.kind == Constraint.Kind.angles_ratio:
-                angle0 = cnstr.params[0]
-                angle1 = cnstr.params[1]
-                ratio = cnstr.params[2]
-                numb_square += (self.angle(angle0) - self.angle(angle1) * ratio) ** 2
-            elif cnstr.kind == Constraint.Kind.parallel_vectors:
-                vec0 = cnstr.params[0]
-                vec1 = cnstr.params[1]
-                numb_square += self.angle(vec0.angle(vec1)) ** 2
+        if not plan.has_distance_constraint:
+            return numb_square, numb_gradient
+
+        deviation = dist_square
+        gradient = dist_gradient
+        if numb_square > 0:
+            vecs = vectors(plan.user_pairs)
+            average2 = np.sum(vecs[:, 0] ** 2 + vecs[:, 1] ** 2) / len(plan.user_pairs)
+            deviation += numb_square * average2
+            if with_gradient:
+                gradient = gradient + average2 * numb_gradient
+                put(gradient, plan.user_pairs, numb_square * 2 * vecs / len(plan.user_pairs))
+        return deviation, gradient
+
+    def residual_scale(self):
+        """
+        Factor applied to the dimensionless residuals to make them comparable
+        with the distances; 1 if the scene has no distance constraints
+        """
+        if not self.plan.has_distance_constraint or len(self.plan.user_pairs) == 0:
+            return 1.0
+        vecs = self.__xy[self.plan.user_pairs[:, 1]] - self.__xy[self.plan.user_pairs[:, 0]]
+        return np.sqrt(np.sum(vecs[:, 0] ** 2 + vecs[:, 1] ** 2) / len(self.plan.user_pairs))
+
+    def residuals(self, scale=None):
+        """
+        Residual vector of the adjustment constraints, one entry per constraint
+        (two per parallel vectors constraint); all the entries are zeros
+        iff the deviation is zero.
+        If scale is None, residual_scale() is used
+        """
+        return self.__residuals(False, scale)[0]
+
+    def residuals_jacobian(self, keys, scale=None):
+        """
+        Jacobian of residuals(scale) with respect to the parameters listed in keys,
+        the scale is considered a constant
+        """
+        residuals, (numbers, points, dvecs) = self.__residuals(True, scale)
+        by_coordinates = np.zeros((len(residuals), len(self.__xy), 2))
+        np.add.at(by_coordinates, (numbers, points), dvecs)
+        jacobian = self.__coordinates_jacobian(keys)
+        return by_coordinates.reshape((len(by_coordinates), -1)) @ jacobian.reshape((-1, len(keys)))
+
+    def residuals_sparse_jacobian(self, keys, scale=None):
+        """
+        Same as residuals_jacobian(), as a scipy.sparse.csr_matrix;
+        only the parameters the residual points depend on are evaluated
+        """
+        residuals, (numbers, points, dvecs) = self.__residuals(True, scale)
+        jacobian = self.__coordinates_jacobian(keys)
+        key_index = {key: index for index, key in enumerate(keys)}
+        columns = np.array([key_index.get(param, -1) for param in self.plan.parameters], dtype=int)
+        entries, params = np.nonzero(self.plan.dependencies[points])
+        params = columns[params]
+        used = params >= 0
+        entries = entries[used]
+        params = params[used]
+        values = np.sum(dvecs[entries] * jacobian[points[entries], :, params], axis=1)
+        # the duplicate entries are summed up
+        return csr_matrix((values, (numbers[entries], params)), shape=(len(residuals), len(keys)))
+
+    def __residuals(self, with_jacobian, scale):
+        # Returns (residuals, entries), the entries are (residual numbers, point indices,
+        # (count, 2) derivatives by the point coordinates) arrays, a residual can depend
+        # on the same point several times; the entries are None if not requested.
+        # The residual order is defined by ConstructionPlan.residual_points()
+        plan = self.plan
+        xy = self.__xy
+        def vectors(pairs):
+            return xy[pairs[:, 1]] - xy[pairs[:, 0]]
+        def lengths(vecs):
+            return np.hypot(vecs[:, 0], vecs[:, 1])
+
+        dist_residuals = []
+        numb_residuals = []
+        dist_rows = []
+        numb_rows = []
+        def put(rows, pairs, dvecs):
+            if with_jacobian:
+                rows.append((pairs, dvecs))
+
+        if len(plan.distances) > 0:
+            vecs = vectors(plan.distances)
+            lens = lengths(vecs)
+            dist_residuals.append(lens - plan.distance_values)
+            put(dist_rows, (plan.distances,), (vecs / lens[:, None],))
+        if len(plan.perpendicular0) > 0:
+            # scalar product normalized to the length unit
+            vecs0 = vectors(plan.perpendicular0)
+            vecs1 = vectors(plan.perpendicular1)
+            lens0 = lengths(vecs0)
+            lens1 = lengths(vecs1)
+            norm = np.sqrt(lens0 * lens1)
+            values = np.sum(vecs0 * vecs1, axis=1) / norm
+            dist_residuals.append(values)
+            put(dist_rows, (plan.perpendicular0, plan.perpendicular1), (
+                vecs1 / norm[:, None] - (values / 2 / lens0 / lens0)[:, None] * vecs0,
+                vecs0 / norm[:, None] - (values / 2 / lens1 / lens1)[:, None] * vecs1
+            ))
+        if len(plan.ratios0) > 0:
+            vecs0 = vectors(plan.ratios0)
+            vecs1 = vectors(plan.ratios1)
+            lens0 = lengths(vecs0)
+            lens1 = lengths(vecs1)
+            quot = lens0 / lens1
+            numb_residuals.append(quot - plan.ratio_values)
+            put(numb_rows, (plan.ratios0, plan.ratios1), (
+                (1 / lens1 / lens0)[:, None] * vecs0,
+                (-quot / lens1 / lens1)[:, None] * vecs1
+            ))
+        if len(plan.collinear0) > 0:
+            vecs0 = vectors(plan.collinear0)
+            vecs1 = vectors(plan.collinear1)
+            lens0 = lengths(vecs0)
+            lens1 = lengths(vecs1)
+            norm = lens0 * lens1
+            sines = (vecs0[:, 0] * vecs1[:, 1] - vecs0[:, 1] * vecs1[:, 0]) / norm
+            numb_residuals.append(sines)
+            put(numb_rows, (plan.collinear0, plan.collinear1), (
+                np.stack((vecs1[:, 1], -vecs1[:, 0]), axis=1) / norm[:, None] - (sines / lens0 / lens0)[:, None] * vecs0,
+                np.stack((-vecs0[:, 1], vecs0[:, 0]), axis=1) / norm[:, None] - (sines / lens1 / lens1)[:, None] * vecs1
+            ))
+        if len(plan.angles) > 0:
+            pairs0 = plan.angles[:, 0:2]
+            pairs1 = plan.angles[:, 2:4]
+            vecs0 = vectors(pairs0)
+            vecs1 = vectors(pairs1)
+            lens0 = lengths(vecs0)
+            lens1 = lengths(vecs1)
+            cos = np.clip(np.sum(vecs0 * vecs1, axis=1) / lens0 / lens1, -1, 1)
+            angles = np.arccos(cos)
+            if with_jacobian:
+                sines = np.sqrt(1 - cos ** 2)
+                # d angle / d cos, the derivative is not defined for degenerate angles
+                coef = np.divide(-1, sines, out=np.zeros(len(angles)), where=sines > 1e-12)
+                dangle0 = coef[:, None] * (vecs1 / (lens0 * lens1)[:, None] - (cos / lens0 / lens0)[:, None] * vecs0)
+                dangle1 = coef[:, None] * (vecs0 / (lens0 * lens1)[:, None] - (cos / lens1 / lens1)[:, None] * vecs1)
+            if len(plan.angle_values) > 0:
+                indexes = plan.angle_values
+                numb_residuals.append(angles[indexes] - plan.angle_degrees)
+                if with_jacobian:
+                    put(numb_rows, (pairs0[indexes], pairs1[indexes]), (dangle0[indexes], dangle1[indexes]))
+            if len(plan.angles0) > 0:
+                indexes0 = plan.angles0
+                indexes1 = plan.angles1
+                ratios = plan.angle_ratios[:, None]
+                numb_residuals.append(angles[indexes0] - angles[indexes1] * plan.angle_ratios)
+                if with_jacobian:
+                    put(numb_rows, (pairs0[indexes0], pairs1[indexes0], pairs0[indexes1], pairs1[indexes1]), (
+                        dangle0[indexes0], dangle1[indexes0],
+                        -ratios * dangle0[indexes1], -ratios * dangle1[indexes1]
+                    ))
+            if len(plan.parallels) > 0:
+                # difference of the unit vectors; unlike the angle, it is smooth at zero
+                indexes = plan.parallels
+                units0 = vecs0[indexes] / lens0[indexes][:, None]
+                units1 = vecs1[indexes] / lens1[indexes][:, None]
+                numb_residuals.append((units0 - units1).reshape(-1))
+                if with_jacobian:
+                    def dunit(vecs, lens):
+                        # (parallels, 2 residuals, 2 coordinates)
+                        return (np.eye(2)[None, :, :] - vecs[:, :, None] * vecs[:, None, :] / (lens ** 2)[:, None, None]) / lens[:, None, None]
+                    rows = np.repeat(np.arange(len(indexes)), 2)
+                    components = np.tile([0, 1], len(indexes))
+                    put(numb_rows, (np.repeat(pairs0[indexes], 2, axis=0), np.repeat(pairs1[indexes], 2, axis=0)), (
+                        dunit(vecs0[indexes], lens0[indexes])[rows, components],
+                        -dunit(vecs1[indexes], lens1[indexes])[rows, components]
+                    ))
+
+        if scale is None:
+            scale = self.residual_scale()
+        residuals = np.concatenate(dist_residuals + [scale * res for res in numb_residuals] + [np.zeros(0)])
+        if not with_jacobian:
+            return residuals, None
+
+        numbers = []
+        points = []
+        derivatives = []
+        start = 0
+        for rows, factor in [(row, 1.0) for row in dist_rows] + [(row, scale) for row in numb_rows]:
+            pairs_list, dvecs_list = rows
+            count = len(dvecs_list[0])
+            for pairs, dvecs in zip(pairs_list, dvecs_list):
+                numbers += [np.arange(start, start + count)] * 2
+                points += [pairs[:, 1], pairs[:, 0]]
+                derivatives += [factor * dvecs, -factor * dvecs]
+            start += count
+        if not numbers:
+            return residuals, (np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros((0, 2)))
+        return residuals, (np.concatenate(numbers), np.concatenate(points), np.concatenate(derivatives))
+
+    def __coordinates_jacobian(self, keys):
+        # d coordinates / d params, (points, 2, params) array;
+        # computed in the forward mode along the construction plan,
+        # the intersection points are differentiated implicitly
+        key_index = {key: index for index, key in enumerate(keys)}
+        xy = self.__xy
+        jac = np.zeros((len(xy), 2, len(keys)))
+
+        def unit(label):
+            row = np.zeros(len(keys))
+            index = key_index.get(label)
+            if index is not None:
+                row[index] = 1
+            return row
+
+        def line_row(point, pt0, pt1):
+            # P on line (pt0, pt1): cross(P - pt0, pt1 - pt0) = 0
+            vec = xy[pt1] - xy[pt0]
+            dvec = jac[pt1] - jac[pt0]
+            rel = point - xy[pt0]
+            row = np.array([vec[1], -vec[0]])
+            rhs = jac[pt0][0] * vec[1] - jac[pt0][1] * vec[0] - (rel[0] * dvec[1] - rel[1] * dvec[0])
+            return row, rhs
+
+        def circle_row(point, centre, r0, r1):
+            # P on circle: |P - centre|^2 = |r1 - r0|^2
+            rel = point - xy[centre]
+            vec = xy[r1] - xy[r0]
+            dvec = jac[r1] - jac[r0]
+            return 2 * rel, 2 * rel.dot(jac[centre]) + 2 * vec.dot(dvec)
+
+        for index, (p, origin, ops) in enumerate(self.plan.steps):
+            point = xy[index]
+            if origin == CoreScene.Point.Origin.free:
+                jac[index][0] = unit(p.label + '.x')
+                jac[index][1] = unit(p.label + '.y')
+            elif origin == CoreScene.Point.Origin.circle:
+                centre, r0, r1 = ops
+                vec = xy[r1] - xy[r0]
+                radius = np.hypot(*vec)
+                dradius = vec.dot(jac[r1] - jac[r0]) / radius
+                angle = self.params[p.label + '.angle']
+                dangle = unit(p.label + '.angle')
+                jac[index] = jac[centre] + \
+                    np.outer([np.sin(angle), np.cos(angle)], dradius) + \
+                    np.outer([np.cos(angle) * radius, -np.sin(angle) * radius], dangle)
+            elif origin == CoreScene.Point.Origin.line:
+                pt0, pt1 = ops
+                coef = self.params[p.label + '.coef']
+                jac[index] = 0.5 * (jac[pt0] + jac[pt1]) + coef * (jac[pt0] - jac[pt1]) + \
+                    np.outer(xy[pt0] - xy[pt1], unit(p.label + '.coef'))
+            elif origin == CoreScene.Point.Origin.translated:
+                base, start, end = ops
+                jac[index] = jac[base] + np.float64(p.coef) * (jac[end] - jac[start])
+            elif origin == CoreScene.Point.Origin.perp:
+                pt, pt0, pt1 = ops
+                jac[index][0] = jac[pt][0] + jac[pt0][1] - jac[pt1][1]
+                jac[index][1] = jac[pt][1] + jac[pt1][0] - jac[pt0][0]
             else:
-                assert False, 'Constraint `%s` not supported in adjustment' % cnstr.kind
+                if origin == CoreScene.Point.Origin.line_x_line:
+                    rows = (line_row(point, *ops[0:2]), line_row(point, *ops[2:4]))
+                elif origin == CoreScene.Point.Origin.circle_x_line:
+                    rows = (circle_row(point, *ops[0:3]), line_row(point, *ops[3:5]))
+                else:
+                    rows = (circle_row(point, *ops[0:3]), circle_row(point, *ops[3:6]))
+                try:
+                    jac[index] = np.linalg.solve(np.array([rows[0][0], rows[1][0]]), np.array([rows[0][1], rows[1][1]]))
+                except np.linalg.LinAlgError:
+                    raise PlacementFailedError('Degenerate intersection')
+        return jac
 
-        if not has_distance_constraint:
-            self.__deviation = numb_square
-        else:
-            self.__deviation = dist_square
-            if numb_square > 0:
-                average2 = 0.0
-                points = [self.location(pt) for pt in self.scene.points(max_layer='user')]
-                for pt0, pt1 in itertools.combinations(points, 2):
-                    average2 += pt0.distance2_to(pt1)
-                average2 /= len(points) * (len(points) - 1) / 2
-                self.__deviation += numb_square * average2
+class BatchPlacement:
+    """
+    Placement of a batch of parameter vectors at once, vectorized along the batch axis.
+    The candidate intersection points are chosen and validated like in Placement;
+    the batch items that cannot be placed are marked as invalid.
+    """
+    def __init__(self, plan: ConstructionPlan, data):
+        self.plan = plan
+        self.data = data
+        count = len(data)
+        self.xy = np.zeros((count, len(plan.steps), 2), dtype=np.float64)
+        self.valid = np.ones(count, dtype=bool)
+        with np.errstate(all='ignore'):
+            self.__place()
+        self.valid &= np.all(np.isfinite(self.xy), axis=(1, 2))
 
-        return self.__deviation
+    def __place(self):
+        placers = {
+            CoreScene.Point.Origin.free: self.__free,
+            CoreScene.Point.Origin.circle: self.__on_circle,
+            CoreScene.Point.Origin.line: self.__on_line,
+            CoreScene.Point.Origin.translated: self.__translated,
+            CoreScene.Point.Origin.perp: self.__perpendicular,
+            CoreScene.Point.Origin.line_x_line: self.__line_x_line,
+            CoreScene.Point.Origin.circle_x_line: self.__circle_x_line,
+            CoreScene.Point.Origin.circle_x_circle: self.__circle_x_circle,
+        }
+        xy = self.xy
+        for index, (p, origin, operands) in enumerate(self.plan.steps):
+            candidates = placers[origin](p, *operands)
+            if len(candidates) == 2 and hasattr(p, 'x') and hasattr(p, 'y'):
+                target = np.array([p.x, p.y], dtype=np.float64)
+                swap = np.hypot(*(candidates[1] - target).T) < np.hypot(*(candidates[0] - target).T)
+                candidates = (
+                    np.where(swap[:, None], candidates[1], candidates[0]),
+                    np.where(swap[:, None], candidates[0], candidates[1])
+                )
+            chosen = np.zeros(len(xy), dtype=bool)
+            for candidate in candidates:
+                xy[:, index] = np.where(chosen[:, None], xy[:, index], candidate)
+                passed = ~chosen
+                for indexes, checker in self.plan.validation[index]:
+                    passed &= checker(*(xy[:, i] for i in indexes))
+                chosen |= passed
+            self.valid &= chosen
 
-def iterative_placement(scene, max_attempts=10000, max_iterations=400, print_progress=False):
-    for attempt in range(0, max_attempts):
-        frozen = scene.is_frozen
+    def __param(self, label):
+        return self.data[:, self.plan.parameter_index[label]]
+
+    def __free(self, p):
+        x = np.full(len(self.xy), np.float64(p.x)) if hasattr(p, 'x') else self.__param(p.label + '.x')
+        y = np.full(len(self.xy), np.float64(p.y)) if hasattr(p, 'y') else self.__param(p.label + '.y')
+        return (np.stack((x, y), axis=1),)
+
+    def __radius2(self, r0, r1):
+        return np.sum((self.xy[:, r1] - self.xy[:, r0]) ** 2, axis=1)
+
+    def __on_circle(self, p, centre, r0, r1):
+        radius = np.sqrt(self.__radius2(r0, r1))
+        angle = self.__param(p.label + '.angle')
+        return (self.xy[:, centre] + np.stack((np.sin(angle), np.cos(angle)), axis=1) * radius[:, None],)
+
+    def __on_line(self, p, pt0, pt1):
+        loc0 = self.xy[:, pt0]
+        loc1 = self.xy[:, pt1]
+        coef = self.__param(p.label + '.coef')[:, None]
+        return (0.5 * (loc0 + loc1) + coef * (loc0 - loc1),)
+
+    def __translated(self, p, base, start, end):
+        return (self.xy[:, base] + np.float64(p.coef) * (self.xy[:, end] - self.xy[:, start]),)
+
+    def __perpendicular(self, p, pt, pt0, pt1):
+        p0 = self.xy[:, pt]
+        p1 = self.xy[:, pt0]
+        p2 = self.xy[:, pt1]
+        return (np.stack((p0[:, 0] + p1[:, 1] - p2[:, 1], p0[:, 1] + p2[:, 0] - p1[:, 0]), axis=1),)
+
+    def __line_x_line(self, p, pt0, pt1, pt2, pt3):
+        p0, p1, p2, p3 = (self.xy[:, i] for i in (pt0, pt1, pt2, pt3))
+        cx0 = p0[:, 1] - p1[:, 1]
+        cy0 = p1[:, 0] - p0[:, 0]
+        cx1 = p2[:, 1] - p3[:, 1]
+        cy1 = p3[:, 0] - p2[:, 0]
+        discr = cx0 * cy1 - cx1 * cy0
+        discr[np.fabs(discr) < 1e-8] = np.nan
+        s0 = p1[:, 0] * p0[:, 1] - p1[:, 1] * p0[:, 0]
+        s1 = p3[:, 0] * p2[:, 1] - p3[:, 1] * p2[:, 0]
+        return (np.stack(((s0 * cy1 - s1 * cy0) / discr, (s1 * cx0 - s0 * cx1) / discr), axis=1),)
+
+    def __two_points(self, base, direction, height2, x_first):
+        # base +- sqrt(height2) * direction; the candidate with the greater x
+        # (or y, if not x_first) goes first, like in Placement
+        height2[(height2 < 0) & (height2 > -1e-8)] = 0
+        offset = np.sqrt(height2)[:, None] * direction
+        first = base + offset
+        second = base - offset
+        swap = np.where(x_first, first[:, 0] < second[:, 0], first[:, 1] < second[:, 1])
+        return (
+            np.where(swap[:, None], second, first),
+            np.where(swap[:, None], first, second)
+        )
+
+    def __circle_x_line(self, p, centre, r0, r1, pt0, pt1):
+        c = self.xy[:, centre]
+        p0 = self.xy[:, pt0]
+        p1 = self.xy[:, pt1]
+        vec = p1 - p0
+        length2 = np.sum(vec ** 2, axis=1)
+        length2[np.all(np.fabs(vec) < 5e-6, axis=1)] = np.nan
+        foot = p0 + (np.sum((c - p0) * vec, axis=1) / length2)[:, None] * vec
+        height2 = self.__radius2(r0, r1) - np.sum((foot - c) ** 2, axis=1)
+        return self.__two_points(foot, vec / np.sqrt(length2)[:, None], height2, np.fabs(vec[:, 0]) >= 5e-6)
+
+    def __circle_x_circle(self, p, centre0, r00, r01, centre1, r10, r11):
+        c0 = self.xy[:, centre0]
+        c1 = self.xy[:, centre1]
+        vec = c1 - c0
+        distance2 = np.sum(vec ** 2, axis=1)
+        distance2[np.all(np.fabs(vec) <= 5e-6, axis=1)] = np.nan
+        radius02 = self.__radius2(r00, r01)
+        along = (radius02 - self.__radius2(r10, r11) + distance2) / 2 / distance2
+        base = c0 + along[:, None] * vec
+        height2 = radius02 - along ** 2 * distance2
+        direction = np.stack((-vec[:, 1], vec[:, 0]), axis=1) / np.sqrt(distance2)[:, None]
+        return self.__two_points(base, direction, height2, np.fabs(vec[:, 0]) <= 5e-6)
+
+    def deviations(self):
+        """
+        Deviation of every batch item, np.inf for the invalid items
+        """
+        plan = self.plan
+        xy = self.xy
+        def vectors(pairs):
+            return xy[:, pairs[:, 1]] - xy[:, pairs[:, 0]]
+        def lengths(vecs):
+            return np.hypot(vecs[..., 0], vecs[..., 1])
+
+        dist_square = np.zeros(len(xy))
+        numb_square = np.zeros(len(xy))
+        with np.errstate(all='ignore'):
+            if len(plan.distances) > 0:
+                dist_square += np.sum((lengths(vectors(plan.distances)) - plan.distance_values) ** 2, axis=1)
+            if len(plan.ratios0) > 0:
+                quot = lengths(vectors(plan.ratios0)) / lengths(vectors(plan.ratios1))
+                numb_square += np.sum((quot - plan.ratio_values) ** 2, axis=1)
+            if len(plan.collinear0) > 0:
+                vecs0 = vectors(plan.collinear0)
+                vecs1 = vectors(plan.collinear1)
+                sines = (vecs0[..., 0] * vecs1[..., 1] - vecs0[..., 1] * vecs1[..., 0]) / lengths(vecs0) / lengths(vecs1)
+                numb_square += np.sum(sines ** 2, axis=1)
+            if len(plan.perpendicular0) > 0:
+                vecs0 = vectors(plan.perpendicular0)
+                vecs1 = vectors(plan.perpendicular1)
+                products = np.sum(vecs0 * vecs1, axis=2)
+                dist_square += np.sum(products ** 2 / lengths(vecs0) / lengths(vecs1), axis=1)
+            if len(plan.angles) > 0:
+                vecs0 = vectors(plan.angles[:, 0:2])
+                vecs1 = vectors(plan.angles[:, 2:4])
+                cos = np.sum(vecs0 * vecs1, axis=2) / lengths(vecs0) / lengths(vecs1)
+                angles = np.arccos(np.clip(cos, -1, 1))
+                if len(plan.angle_values) > 0:
+                    numb_square += np.sum((angles[:, plan.angle_values] - plan.angle_degrees) ** 2, axis=1)
+                if len(plan.angles0) > 0:
+                    numb_square += np.sum((angles[:, plan.angles0] - angles[:, plan.angles1] * plan.angle_ratios) ** 2, axis=1)
+                if len(plan.parallels) > 0:
+                    numb_square += np.sum(angles[:, plan.parallels] ** 2, axis=1)
+
+            if not plan.has_distance_constraint:
+                deviations = numb_square
+            else:
+                deviations = dist_square
+                if len(plan.user_pairs) > 0:
+                    vecs = vectors(plan.user_pairs)
+                    average2 = np.sum(vecs[..., 0] ** 2 + vecs[..., 1] ** 2, axis=1) / len(plan.user_pairs)
+                    deviations = deviations + numb_square * average2
+        return np.where(self.valid & np.isfinite(deviations), deviations, np.inf)
+
+# Jacobians with more parameters are passed to the solver as sparse matrices
+SPARSE_JACOBIAN_THRESHOLD = 100
+
+def _least_squares(placement, keys, data, placement_for_data, max_iterations, print_progress):
+    scale = placement.residual_scale()
+    size = len(placement.residuals(scale))
+    def numpy_fun(data):
+        try:
+            return placement_for_data(data).residuals(scale)
+        except PlacementFailedError:
+            # the solver rejects non-finite values and shrinks the trust region
+            return np.full(size, np.inf)
+
+    if len(keys) > SPARSE_JACOBIAN_THRESHOLD:
+        def numpy_jac(data):
+            return placement_for_data(data).residuals_sparse_jacobian(keys, scale)
+        tr_solver = 'lsmr'
+    else:
+        def numpy_jac(data):
+            return placement_for_data(data).residuals_jacobian(keys, scale)
+        tr_solver = 'exact'
+
+    return least_squares(
+        numpy_fun, data, jac=numpy_jac, method='trf', tr_solver=tr_solver,
+        ftol=1e-15, xtol=1e-15, gtol=1e-15, max_nfev=max_iterations,
+        verbose=2 if print_progress else 0
+    )
+
+def _fingerprint(plan):
+    def canonical(param):
+        if isinstance(param, CoreScene.Object):
+            return param.label
+        if isinstance(param, (list, tuple)):
+            return [canonical(elt) for elt in param]
+        return str(param)
+
+    points = [
+        [p.label, origin.name, list(operands), str(getattr(p, 'x', None)), str(getattr(p, 'y', None))]
+        for p, origin, operands in plan.steps
+    ]
+    # the constraint order does not affect the placement
+    constraints = sorted(
+        json.dumps([cnstr.kind.name, canonical(cnstr.params)])
+        for cnstr in plan.scene.validation_constraints + plan.scene.adjustment_constraints
+    )
+    return hashlib.sha256(json.dumps([points, constraints]).encode('utf-8')).hexdigest()
+
+def scene_fingerprint(scene):
+    """
+    Canonical fingerprint of the scene: the points in the construction order
+    with their origins and operands, and the constraints.
+    The scenes with equal fingerprints have the same placement parameters
+    """
+    frozen = scene.is_frozen
+    if not frozen:
+        scene.freeze()
+    try:
+        return _fingerprint(ConstructionPlan(scene))
+    finally:
         if not frozen:
-            scene.freeze()
+            scene.unfreeze()
+
+class PlacementCache:
+    """
+    On-disk cache of the converged placement parameters, a JSON file
+    per scene fingerprint in the directory.
+    The cached parameters are re-validated on load, an entry that does not
+    place the scene with zero deviation is ignored
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def __path(self, plan):
+        return os.path.join(self.directory, _fingerprint(plan) + '.json')
+
+    def load(self, plan: ConstructionPlan):
         try:
-            placement = Placement(scene)
+            with open(self.__path(plan)) as cached:
+                params = json.load(cached)['params']
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if not isinstance(params, dict) or set(params) != set(plan.parameters):
+            return None
+        try:
+            placement = Placement(plan.scene, {label: np.float64(params[label]) for label in plan.parameters}, plan=plan)
             if placement.deviation() < 1e-14:
                 return placement
-            keys = list(placement.params.keys())
-            def placement_for_data(data):
-                return Placement(scene, dict(zip(keys, data)))
+        except (PlacementFailedError, TypeError, ValueError):
+            pass
+        return None
+
+    def store(self, placement: Placement):
+        path = self.__path(placement.plan)
+        params = {label: float(placement.params[label]) for label in placement.plan.parameters}
+        # written aside and renamed, the concurrent readers never see a partial file
+        temp = '%s.%d.tmp' % (path, os.getpid())
+        with open(temp, 'w') as out:
+            json.dump({'params': params}, out, indent=1)
+        os.replace(temp, path)
+
+class PlacementAttempt:
+    """
+    Statistics of a single iterative placement attempt
+    """
+    def __init__(self, index, seed=None):
+        self.index = index
+        self.seed = seed
+        self.evaluations = 0
+        self.deviation = None
+        self.time = 0.0
+        self.error = None
+        self.success = False
+
+    def __str__(self):
+        if self.success:
+            outcome = 'success'
+        elif self.error:
+            outcome = self.error
+        elif self.deviation is not None:
+            outcome = 'deviation %.3e' % self.deviation
+        else:
+            outcome = 'failed'
+        return '%d evaluations, %.3f sec, %s' % (self.evaluations, self.time, outcome)
+
+def placement_stats(attempts):
+    successful = [att for att in attempts if att.success]
+    cancelled = [att for att in attempts if att.error == 'Cancelled']
+    data = [
+        ('Attempts', len(attempts)),
+        ('Cancelled attempts', len(cancelled)),
+        ('Successful attempt', successful[0].index if successful else 'none'),
+        ('Total attempts time', '%.3f sec' % sum(att.time for att in attempts)),
+    ]
+    return Stats(data + [
+        Stats([('Attempt %d' % att.index, str(att)) for att in attempts], 'Attempts')
+    ], 'Placement stats')
+
+def _placement_attempt(scene, plan, attempt, max_iterations, print_progress, method, cancelled=None, params=None):
+    # Returns the placement if the attempt succeeds, None otherwise;
+    # fills the attempt statistics. Starts from params if provided, from a random point otherwise
+    start = time.time()
+    frozen = scene.is_frozen
+    if not frozen:
+        scene.freeze()
+    try:
+        placement = Placement(scene, params=dict(params) if params else None, plan=plan)
+        attempt.evaluations = 1
+        attempt.deviation = placement.deviation()
+        if attempt.deviation < 1e-14:
+            attempt.success = True
+            return placement
+        keys = plan.parameters
+        last = [None, None]
+        def placement_for_data(data):
+            # the optimizer asks for the value and the derivatives at the same point
+            if cancelled and cancelled():
+                raise PlacementFailedError('Cancelled')
+            if last[0] is None or not np.array_equal(last[0], data):
+                last[0] = np.array(data)
+                last[1] = Placement(scene, dict(zip(keys, data)), plan=plan)
+                attempt.evaluations += 1
+            return last[1]
 
+        data = np.array([placement.params[k] for k in keys])
+        if method == 'least_squares':
+            res = _least_squares(placement, keys, data, placement_for_data, max_iterations, print_progress)
+        else:
             def numpy_fun(data):
                 return placement_for_data(data).deviation()
 
-            data = np.array([placement.params[k] for k in keys])
-            res = minimize(numpy_fun, data, method='BFGS', options={'gtol': 1e-7, 'maxiter': max_iterations, 'disp': print_progress})
-            pl = placement_for_data(res.x)
-            if pl.deviation() < 1e-14:
-                return pl
+            def numpy_jac(data):
+                return placement_for_data(data).deviation_gradient(keys)
+
+            res = minimize(numpy_fun, data, jac=numpy_jac, method='BFGS', options={'gtol': 1e-7, 'maxiter': max_iterations, 'disp': print_progress})
+        pl = placement_for_data(res.x)
+        attempt.deviation = pl.deviation()
+        if attempt.deviation < 1e-14:
+            attempt.success = True
+            return pl
+    except PlacementFailedError as e:
+        attempt.error = str(e) if str(e) else 'Placement failed'
+        if print_progress:
+            print('Attempt %d failed: %s\r' % (attempt.index, e))
+    finally:
+        attempt.time = time.time() - start
+        if not frozen:
+            scene.unfreeze()
+    return None
+
+def iterative_placement(scene, max_attempts=10000, max_iterations=400, print_progress=False, method='bfgs', processes=1, attempts=None, batch_size=None, decompose=False, seed=None, cache=None):
+    """
+    Places the scene so that the adjustment constraints are met.
+    method is 'least_squares' (the residual vector is minimized with the trust region
+    reflective solver) or 'bfgs' (the deviation is minimized as a scalar function).
+    If processes is greater than 1 (or None, that means the number of CPUs), the attempts
+    run in a process pool, with distinct random seeds; the remaining attempts are
+    cancelled as soon as one succeeds, so the result depends on the timing.
+    With a seed, the later attempts only are cancelled, and the successful attempt
+    with the lowest index is returned, as in the sequential order.
+    If batch_size is set, the random starts are sampled and evaluated batch_size at once,
+    and only the BATCH_REFINEMENTS best valid starts of every batch are refined
+    by the optimizer; every refinement counts as an attempt.
+    If decompose is True, the constraints are split into clusters (see ConstructionPlan.clusters)
+    solved one after another; a failing cluster is restarted alone, up to CLUSTER_ATTEMPTS times.
+    If attempts is a list, PlacementAttempt statistics are appended to it.
+    If seed is set, the placement is reproducible: the random starts are taken
+    from the global generator seeded with it, the generator state is restored afterwards.
+    cache is a PlacementCache (or its directory); a valid cached placement
+    of the scene is returned without any attempt, a new placement is stored.
+    """
+    assert method in ('least_squares', 'bfgs'), 'Unknown placement method `%s`' % method
+    assert not batch_size or processes == 1, 'Batched placement does not run in parallel'
+    assert not decompose or (processes == 1 and not batch_size), 'Decomposed placement is neither batched nor parallel'
+    frozen = scene.is_frozen
+    if not frozen:
+        scene.freeze()
+    try:
+        plan = ConstructionPlan(scene)
+    except PlacementFailedError as e:
+        if print_progress:
+            print('Placement failed: %s' % e)
+        return None
+    finally:
+        if not frozen:
+            scene.unfreeze()
+
+    if isinstance(cache, str):
+        cache = PlacementCache(cache)
+    if cache is not None:
+        placement = cache.load(plan)
+        if placement:
+            return placement
+
+    if attempts is None:
+        attempts = []
+    if seed is not None:
+        state = np.random.get_state()
+        np.random.seed(seed)
+    try:
+        placement = _placement(
+            scene, plan, max_attempts, max_iterations, print_progress, method,
+            processes, attempts, batch_size, decompose, seed
+        )
+    finally:
+        if seed is not None:
+            np.random.set_state(state)
+    if placement and cache is not None:
+        cache.store(placement)
+    return placement
+
+def _placement(scene, plan, max_attempts, max_iterations, print_progress, method, processes, attempts, batch_size, decompose, seed):
+    if processes is None or processes > 1:
+        return _parallel_placement(scene, plan, max_attempts, max_iterations, print_progress, method, processes, attempts, seed is not None)
+    if batch_size:
+        return _batch_placement(scene, plan, max_attempts, max_iterations, print_progress, method, batch_size, attempts)
+    if decompose:
+        return _clustered_placement(scene, plan, max_attempts, max_iterations, print_progress, method, attempts)
+
+    for index in range(0, max_attempts):
+        attempt = PlacementAttempt(index)
+        attempts.append(attempt)
+        placement = _placement_attempt(scene, plan, attempt, max_iterations, print_progress, method)
+        if placement:
+            return placement
+
+    return None
+
+# number of restarts of a failing cluster before it is widened
+CLUSTER_ATTEMPTS = 5
+
+def _solve_cluster(scene, plan, data, rows, columns, attempt, max_iterations, method):
+    # Varies data[columns] (in place) to zero the residuals listed in rows;
+    # returns True on success
+    keys = [plan.parameters[c] for c in columns]
+    last = [None, None]
+    def placement_for_data(sub):
+        if last[0] is None or not np.array_equal(last[0], sub):
+            full = np.array(data)
+            full[columns] = sub
+            last[0] = np.array(sub)
+            last[1] = Placement(scene, dict(zip(plan.parameters, full)), plan=plan)
+            attempt.evaluations += 1
+        return last[1]
+
+    scale = placement_for_data(data[columns]).residual_scale()
+    def residuals(sub):
+        return placement_for_data(sub).residuals(scale)[rows]
+    def jacobian(sub):
+        return placement_for_data(sub).residuals_jacobian(keys, scale)[rows]
+
+    if method == 'least_squares':
+        def numpy_fun(sub):
+            try:
+                return residuals(sub)
+            except PlacementFailedError:
+                return np.full(len(rows), np.inf)
+        res = least_squares(
+            numpy_fun, data[columns], jac=jacobian, method='trf',
+            ftol=1e-15, xtol=1e-15, gtol=1e-15, max_nfev=max_iterations
+        )
+    else:
+        def numpy_fun(sub):
+            return np.sum(residuals(sub) ** 2)
+        def numpy_jac(sub):
+            return 2 * residuals(sub) @ jacobian(sub)
+        res = minimize(numpy_fun, data[columns], jac=numpy_jac, method='BFGS', options={'gtol': 1e-7, 'maxiter': max_iterations})
+    if np.sum(residuals(res.x) ** 2) >= 1e-14:
+        return False
+    data[columns] = res.x
+    return True
+
+def _widen_cluster(clusters, position, sparsity):
+    # The cluster at position gets all the parameters its residuals depend on;
+    # the preceding clusters that depend on these parameters are merged into it.
+    # Returns the new position of the cluster, None if it cannot be widened
+    rows, columns = clusters[position]
+    wanted = np.any(sparsity[rows], axis=0)
+    if np.sum(wanted) == len(columns):
+        return None
+    merged_rows = [rows]
+    preceding = clusters[:position]
+    merged = True
+    while merged:
+        merged = False
+        for index, (cluster_rows, cluster_columns) in enumerate(preceding):
+            if np.any(sparsity[cluster_rows][:, wanted]):
+                del preceding[index]
+                merged_rows.append(cluster_rows)
+                wanted[cluster_columns] = True
+                merged = True
+                break
+    clusters[:] = preceding + [(np.concatenate(merged_rows), np.nonzero(wanted)[0])] + clusters[position + 1:]
+    return len(preceding)
+
+def _solve_clusters(scene, plan, data, clusters, position, sparsity, attempt, max_iterations, method):
+    # Solves the clusters starting from position, varies data in place;
+    # raises PlacementFailedError if a cluster cannot be solved
+    while position < len(clusters):
+        rows, columns = clusters[position]
+        for _ in range(0, CLUSTER_ATTEMPTS):
+            try:
+                if _solve_cluster(scene, plan, data, rows, columns, attempt, max_iterations, method):
+                    position += 1
+                    break
+            except PlacementFailedError:
+                pass
+            # restart the cluster only
+            data[columns] = plan.random_parameters(1)[0, columns]
+        else:
+            position = _widen_cluster(clusters, position, sparsity)
+            if position is None:
+                raise PlacementFailedError('Cannot meet the constraints of a cluster')
+
+def _clustered_placement(scene, plan, max_attempts, max_iterations, print_progress, method, attempts):
+    sparsity = plan.jacobian_sparsity()
+    # the decomposition is shared by the attempts, the widened clusters stay widened
+    clusters = plan.clusters()
+    frozen = scene.is_frozen
+    if not frozen:
+        scene.freeze()
+    try:
+        for index in range(0, max_attempts):
+            attempt = PlacementAttempt(index)
+            attempts.append(attempt)
+            start = time.time()
+            try:
+                placement = Placement(scene, plan=plan)
+                attempt.evaluations = 1
+                data = np.array([placement.params[k] for k in plan.parameters])
+                _solve_clusters(scene, plan, data, clusters, 0, sparsity, attempt, max_iterations, method)
+                placement = Placement(scene, dict(zip(plan.parameters, data)), plan=plan)
+                attempt.deviation = placement.deviation()
+                if attempt.deviation < 1e-14:
+                    attempt.success = True
+                    return placement
+            except PlacementFailedError as e:
+                attempt.error = str(e) if str(e) else 'Placement failed'
+                if print_progress:
+                    print('Attempt %d failed: %s\r' % (index, e))
+            finally:
+                attempt.time = time.time() - start
+    finally:
+        if not frozen:
+            scene.unfreeze()
+
+    return None
+
+def incremental_placement(placement, max_attempts=100, max_iterations=400, print_progress=False, method='bfgs', attempts=None):
+    """
+    Places the points and constraints added to placement.scene after the placement was built.
+    The parameters of the placed points are kept, only the new parameters are varied
+    to meet the constraints that depend on them (and the new constraints on the placed points).
+    If that fails, the cluster is widened (see _widen_cluster): the affected clusters
+    of the placed points are re-optimized together with the new parameters,
+    the rest of the placement stays as is.
+    Returns the new Placement, or None if the constraints cannot be met.
+    If attempts is a list, PlacementAttempt statistics are appended to it.
+    """
+    assert method in ('least_squares', 'bfgs'), 'Unknown placement method `%s`' % method
+    scene = placement.scene
+    if attempts is None:
+        attempts = []
+    frozen = scene.is_frozen
+    if not frozen:
+        scene.freeze()
+    try:
+        try:
+            plan = ConstructionPlan(scene)
         except PlacementFailedError as e:
             if print_progress:
-                print('Attempt %d failed: %s\r' % (attempt, e))
-        finally:
-            if not frozen:
-                scene.unfreeze()
+                print('Placement failed: %s' % e)
+            return None
+        known = {label: value for label, value in placement.params.items() if label in plan.parameter_index}
+        added = np.array([label not in known for label in plan.parameters], dtype=bool)
+        sparsity = plan.jacobian_sparsity()
+
+        for index in range(0, max_attempts):
+            attempt = PlacementAttempt(index)
+            attempts.append(attempt)
+            start = time.time()
+            try:
+                # the new parameters are random, the known ones are copied
+                initial = Placement(scene, dict(known), plan=plan)
+                attempt.evaluations = 1
+                data = np.array([initial.params[k] for k in plan.parameters])
+                # the residuals that the new parameters affect, and the new constraints
+                # on the placed points that are not met
+                rows = np.nonzero(
+                    np.any(sparsity[:, added], axis=1) | (np.fabs(initial.residuals()) > 1e-7)
+                )[0]
+                if len(rows) > 0:
+                    clusters = [
+                        (np.setdiff1d(cluster_rows, rows), columns)
+                        for cluster_rows, columns in plan.clusters()
+                    ]
+                    clusters = [cluster for cluster in clusters if len(cluster[0]) > 0]
+                    clusters.append((rows, np.nonzero(added)[0]))
+                    position = len(clusters) - 1
+                    if not np.any(added):
+                        position = _widen_cluster(clusters, position, sparsity)
+                        if position is None:
+                            raise PlacementFailedError('Cannot meet the constraints of a cluster')
+                    _solve_clusters(scene, plan, data, clusters, position, sparsity, attempt, max_iterations, method)
+                result = Placement(scene, dict(zip(plan.parameters, data)), plan=plan)
+                attempt.deviation = result.deviation()
+                if attempt.deviation < 1e-14:
+                    attempt.success = True
+                    return result
+            except PlacementFailedError as e:
+                attempt.error = str(e) if str(e) else 'Placement failed'
+                if print_progress:
+                    print('Attempt %d failed: %s\r' % (index, e))
+            finally:
+                attempt.time = time.time() - start
+    finally:
+        if not frozen:
+            scene.unfreeze()
+
+    return None
+
+# number of the best starts of a batch that are refined by the optimizer
+BATCH_REFINEMENTS = 4
+
+def _batch_placement(scene, plan, max_attempts, max_iterations, print_progress, method, batch_size, attempts):
+    index = 0
+    while index < max_attempts:
+        data = plan.random_parameters(batch_size)
+        deviations = BatchPlacement(plan, data).deviations()
+        best = [i for i in np.argsort(deviations)[:BATCH_REFINEMENTS] if np.isfinite(deviations[i])]
+        if print_progress:
+            print('Batch: %d valid starts of %d\r' % (np.sum(np.isfinite(deviations)), batch_size))
+        if not best:
+            # a batch without valid starts counts as one failed attempt
+            attempt = PlacementAttempt(index)
+            attempt.error = 'No valid starts in the batch'
+            attempts.append(attempt)
+            index += 1
+            continue
+        for i in best[:max_attempts - index]:
+            attempt = PlacementAttempt(index)
+            attempts.append(attempt)
+            index += 1
+            placement = _placement_attempt(
+                scene, plan, attempt, max_iterations, print_progress, method,
+                params=dict(zip(plan.parameters, data[i]))
+            )
+            if placement:
+                return placement
 
     return None
+
+_worker_state = None
+
+def _init_placement_worker(scene, plan, bound):
+    global _worker_state
+    _worker_state = (scene, plan, bound)
+
+def _placement_worker(first, count, base_seed, max_iterations, print_progress, method):
+    # runs a chunk of consecutive attempts, stops on the first success;
+    # returns (attempts, params of the successful placement or None).
+    # The attempts with indexes greater than the shared bound are cancelled
+    scene, plan, bound = _worker_state
+    attempts = []
+    for index in range(first, first + count):
+        attempt = PlacementAttempt(index, base_seed + index)
+        attempts.append(attempt)
+        cancelled = lambda: index > bound.value
+        if cancelled():
+            attempt.error = 'Cancelled'
+            break
+        np.random.seed(attempt.seed)
+        placement = _placement_attempt(scene, plan, attempt, max_iterations, print_progress, method, cancelled=cancelled)
+        if placement:
+            return attempts, dict(placement.params)
+    return attempts, None
+
+# number of attempts sent to a worker at once, most failed attempts are short
+PARALLEL_PLACEMENT_CHUNK = 4
+
+def _parallel_placement(scene, plan, max_attempts, max_iterations, print_progress, method, processes, attempts, deterministic):
+    # If deterministic is set, the successful attempt with the lowest index is returned:
+    # the attempts after a success are cancelled, the earlier ones are waited for.
+    # Otherwise, the first success in time cancels everything else
+    if processes is None:
+        processes = os.cpu_count() or 1
+    # consecutive seeds are distinct, the base is taken from the global generator
+    # to keep the results reproducible with np.random.seed()
+    base_seed = np.random.randint(0, 2 ** 31 - max_attempts)
+    # the attempts with greater indexes are cancelled
+    bound = multiprocessing.Value('l', max_attempts)
+    records = []
+    found = {} # attempt index => params
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_placement_worker, initargs=(scene, plan, bound)) as executor:
+        submitted = 0
+        pending = {} # future => first attempt index
+        def fill():
+            nonlocal submitted
+            # a couple of queued attempts per process keep the workers busy
+            while submitted < max_attempts and submitted <= bound.value and len(pending) < 2 * processes:
+                count = min(PARALLEL_PLACEMENT_CHUNK, max_attempts - submitted)
+                pending[executor.submit(
+                    _placement_worker, submitted, count, base_seed,
+                    max_iterations, print_progress, method
+                )] = submitted
+                submitted += count
+
+        fill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                del pending[future]
+                if future.cancelled():
+                    continue
+                chunk, result = future.result()
+                records += chunk
+                if result is None:
+                    continue
+                found[chunk[-1].index] = result
+                bound.value = min(found) if deterministic else -1
+                for other, first in list(pending.items()):
+                    if first > bound.value and other.cancel():
+                        del pending[other]
+            fill()
+
+    attempts += sorted(records, key=lambda att: att.index)
+    if not found:
+        return None
+    return Placement(scene, found[min(found)], plan=plan)
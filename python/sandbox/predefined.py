@@ -2,7 +2,7 @@ from .core import Constraint, CoreScene
 from .property import *
 from .util import Comment, LazyComment
 
-def enumerate_predefined_properties(scene, max_layer, extra_points=set()):
+def enumerate_predefined_properties(scene, max_layer, extra_points=set(), expand_perpendiculars=True):
     layer_set = CoreScene.layers_by(max_layer)
     def is_visible(point):
         return point.layer in layer_set or point in extra_points
@@ -48,12 +48,13 @@ def enumerate_predefined_properties(scene, max_layer, extra_points=set()):
             )
             continue
 
-        for pts0 in itertools.combinations(line0.all_points, 2):
-            if not all_visible(pts0):
-                continue
-            for pts1 in itertools.combinations(line1.all_points, 2):
-                if not all_visible(pts1):
-                    continue
+        pairs0 = [pts for pts in itertools.combinations(line0.all_points, 2) if all_visible(pts)]
+        pairs1 = [pts for pts in itertools.combinations(line1.all_points, 2) if all_visible(pts)]
+        if not expand_perpendiculars:
+            # a single fact per pair of lines, the property set derives the others
+            pairs0, pairs1 = pairs0[:1], pairs1[:1]
+        for pts0 in pairs0:
+            for pts1 in pairs1:
                 yield (
                     PerpendicularSegmentsProperty(
                         pts0[0].segment(pts0[1]), pts1[0].segment(pts1[1])
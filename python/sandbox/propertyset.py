@@ -13,6 +13,20 @@ def _synthetic_property(prop, comment, premises):
     prop.rule = SyntheticPropertyRule.instance()
     prop.reason = Reason(1 + max(p.reason.generation for p in premises), comment, premises)
     prop.reason.obsolete = all(p.reason.obsolete for p in premises)
+    prop.reason.premise_reasons = [p.reason for p in prop.reason.premises]
+    return prop
+
+def _memoized_synthetic_property(prop):
+    # the premises might become obsolete or get better reasons after the property
+    # has been memoized; the generation and the cost follow the current premise reasons
+    reason = prop.reason
+    reasons = [p.reason for p in reason.premises]
+    known = getattr(reason, 'premise_reasons', None)
+    if known is not None and any(r is not k for r, k in zip(reasons, known)):
+        reason.generation = 1 + max(r.generation for r in reasons)
+        reason.reset_premises()
+        reason.premise_reasons = reasons
+    reason.obsolete = all(r.obsolete for r in reasons)
     return prop
 
 class ContradictionError(Exception):
@@ -24,12 +38,15 @@ class LineSet:
             self.premises_graph = nx.Graph()
             self.points_on = {} # point => set of props
             self.points_not_on = {} # point => set of props
+            self.version = 0
+            self.__same_line_cache = {} # (segment, segment) => (version, prop)
 
         @property
         def segments(self):
             return self.premises_graph.nodes
 
         def add(self, prop):
+            self.version += 1
             self.premises_graph.add_edge(*prop.segments, prop=prop)
             for pt in (*prop.segments[0].points, *prop.segments[1].points):
                 if pt not in self.points_on:
@@ -54,12 +71,18 @@ class LineSet:
             )
 
         def same_line_property(self, segment0, segment1):
+            key = (segment0, segment1)
+            cached = self.__same_line_cache.get(key)
+            if cached and cached[0] == self.version:
+                return _memoized_synthetic_property(cached[1])
             comment, premises = self.same_line_explanation(segment0, segment1)
             if len(premises) == 1:
                 return premises[0]
-            return _synthetic_property(
+            prop = _synthetic_property(
                 LinesCoincidenceProperty(segment0, segment1, True), comment, premises
             )
+            self.__same_line_cache[key] = (self.version, prop)
+            return prop
 
         def point_on_line_property(self, segment, point):
             if point in self.points_on:
@@ -204,8 +227,16 @@ class LineSet:
         self.__all_lines = []
         self.__all_circles = []
         self.__different_lines = {} # {line, line} => [props]
-        self.__coincidence = {}   # {point, point} => prop
+        self.__lines_coincidence_cache = {} # (segment, segment) => (stamp, prop)
+        self.__perpendicular_lines = {} # {line, line} => [props]
+        self.__perpendicular_lines_cache = {} # (segment, segment) => (stamp, prop)
+        self.__directions = DirectionPropertySet()
+        self.__direction_cache = {} # (segment, segment) => (stamp, prop)
+        self.__coincidence = {}   # point => {point => prop}
+        self.__point_to_lines = {} # point => [lines that the point is known to lie or not to lie on]
         self.__collinearity = {}  # {point, point, point} => prop
+        self.__collinearity_unknown = {} # {point, point, point} => sum of point versions
+        self.__point_versions = {} # point => number of changes in the lines through the point
         self.__concyclicity = {}  # {point, point, point, point} => prop
         self.__point_on_line = {} # (point, segment) => prop
         self.__point_and_circle = {} # (point, set of three points) => prop
@@ -234,21 +265,38 @@ class LineSet:
                     if line1 in key:
                         new_key = frozenset([next(l for l in key if l != line1), line0])
                         self.__different_lines[new_key] = self.__different_lines.pop(key)
+                for key in list(self.__perpendicular_lines.keys()):
+                    if line1 in key:
+                        new_key = frozenset([next(l for l in key if l != line1), line0])
+                        props = self.__perpendicular_lines.pop(key)
+                        known = self.__perpendicular_lines.get(new_key)
+                        if known:
+                            known += props
+                        else:
+                            self.__perpendicular_lines[new_key] = props
+                self.__directions.merge_lines(line0, line1)
+                for pt in set(line1.points_on).union(line1.points_not_on):
+                    lines = self.__point_to_lines[pt]
+                    lines.remove(line1)
+                    if line0 not in lines:
+                        lines.append(line0)
 
                 self.__all_lines.remove(line1)
-            line0.add(prop)
+            line = line0
         elif line0:
-            line0.add(prop)
+            line = line0
             self.__segment_to_line[prop.segments[1]] = line0
         elif line1:
-            line1.add(prop)
+            line = line1
             self.__segment_to_line[prop.segments[0]] = line1
         else:
             line = LineSet.Line()
-            line.add(prop)
             self.__segment_to_line[prop.segments[0]] = line
             self.__segment_to_line[prop.segments[1]] = line
             self.__all_lines.append(line)
+        line.add(prop)
+        self.__attach_points(line, (*prop.segments[0].points, *prop.segments[1].points))
+        self.__touch(line)
 
     def __add_same_circle_property(self, prop):
         circle0 = self.__key_to_circle.get(prop.circle_keys[0])
@@ -291,6 +339,19 @@ class LineSet:
             self.__key_to_circle[prop.circle_keys[1]] = circle
             self.__all_circles.append(circle)
 
+    def __attach_points(self, line, points):
+        for pt in points:
+            lines = self.__point_to_lines.get(pt)
+            if lines is None:
+                self.__point_to_lines[pt] = [line]
+            elif line not in lines:
+                lines.append(line)
+
+    def __touch(self, *lines):
+        for line in lines:
+            for pt in itertools.chain(line.points_on, line.points_not_on):
+                self.__point_versions[pt] = self.__point_versions.get(pt, 0) + 1
+
     def __line_by_segment(self, segment):
         line = self.__segment_to_line.get(segment)
         if line is None:
@@ -300,6 +361,7 @@ class LineSet:
                 line.points_on[pt] = set()
             self.__segment_to_line[segment] = line
             self.__all_lines.append(line)
+            self.__attach_points(line, segment.points)
         return line
 
     def __circle_by_key(self, key):
@@ -322,6 +384,28 @@ class LineSet:
             ar.append(prop)
         else:
             self.__different_lines[key] = [prop]
+        self.__touch(line0, line1)
+
+    def __add_perpendicular_property(self, prop):
+        line0 = self.__line_by_segment(prop.segments[0])
+        line1 = self.__line_by_segment(prop.segments[1])
+        key = frozenset((line0, line1))
+        ar = self.__perpendicular_lines.get(key)
+        if ar:
+            ar.append(prop)
+        else:
+            self.__perpendicular_lines[key] = [prop]
+        self.__add_direction_property(prop)
+
+    def __add_direction_property(self, prop):
+        if hasattr(prop, 'rule') and prop.rule == SyntheticPropertyRule.instance():
+            return
+        seg0, seg1, parallel = _direction_segments(prop)
+        if seg0 == seg1:
+            return
+        line0 = self.__line_by_segment(seg0)
+        line1 = self.__line_by_segment(seg1)
+        self.__directions.add(line0, line1, parallel, prop, (seg0, seg1))
 
     def __add_point_on_line_property(self, prop):
         self.__point_on_line[(prop.point, prop.segment)] = prop
@@ -332,6 +416,8 @@ class LineSet:
             prop_set.add(prop)
         else:
             storage[prop.point] = {prop}
+        self.__attach_points(line, (prop.point, ))
+        self.__touch(line)
 
     def __add_point_and_circle_property(self, prop):
         self.__point_and_circle[(prop.point, prop.circle_key)] = prop
@@ -356,10 +442,21 @@ class LineSet:
                 self.__add_different_lines_property(prop)
         elif isinstance(prop, PointOnLineProperty):
             self.__add_point_on_line_property(prop)
+        elif isinstance(prop, PerpendicularSegmentsProperty):
+            self.__add_perpendicular_property(prop)
+        elif isinstance(prop, (ParallelSegmentsProperty, ParallelVectorsProperty)):
+            self.__add_direction_property(prop)
+        elif isinstance(prop, AngleValueProperty) and prop.degree == 0:
+            self.__add_direction_property(prop)
         elif isinstance(prop, PointsCollinearityProperty):
             self.__collinearity[prop.property_key] = prop
         elif isinstance(prop, PointsCoincidenceProperty):
-            self.__coincidence[prop.property_key] = prop
+            for pt0, pt1 in (prop.points, reversed(prop.points)):
+                known = self.__coincidence.get(pt0)
+                if known:
+                    known[pt1] = prop
+                else:
+                    self.__coincidence[pt0] = {pt1: prop}
         elif isinstance(prop, CircleCoincidenceProperty):
             if prop.coincident:
                 self.__add_same_circle_property(prop)
@@ -385,11 +482,11 @@ class LineSet:
         return candidates
 
     def coincidence_property(self, pt0, pt1):
-        cached = self.__coincidence.get(frozenset([pt0, pt1]))
+        cached = self.__coincidence.get(pt0, {}).get(pt1)
         if cached:
             return cached
         candidates = []
-        for line in self.__all_lines:
+        for line in self.__point_to_lines.get(pt0, []):
             if pt0 in line.points_on and pt1 in line.points_not_on:
                 candidates.append(line.non_coincidence_property(pt0, pt1))
                 candidates += self.__non_coincidence_property_candidates(line, pt0, pt1)
@@ -422,6 +519,9 @@ class LineSet:
         cached = self.__collinearity.get(key)
         if cached:
             return cached
+        version = sum(self.__point_versions.get(pt, 0) for pt in pts)
+        if self.__collinearity_unknown.get(key) == version:
+            return None
 
         candidates = []
         for line in self.__all_lines:
@@ -485,6 +585,8 @@ class LineSet:
         prop = LineSet.best_candidate(candidates)
         if prop:
             self.__collinearity[key] = prop
+        else:
+            self.__collinearity_unknown[key] = version
         return prop
 
     @staticmethod
@@ -533,11 +635,8 @@ class LineSet:
         return list(self.__all_circles)
 
     def non_coincident_points(self, point):
-        collection = set()
-        for key in self.__coincidence:
-            if point in key:
-                collection.add(next(pt for pt in key if pt != point))
-        for line in self.__all_lines:
+        collection = set(self.__coincidence.get(point, {}))
+        for line in self.__point_to_lines.get(point, []):
             if point in line.points_on:
                 collection.update(line.points_not_on)
             elif point in line.points_not_on:
@@ -550,6 +649,10 @@ class LineSet:
             return []
         return [pt for pt in line.points_on if pt not in segment.points]
 
+    def is_collinear_point(self, segment, point):
+        line = self.__segment_to_line.get(segment)
+        return line is not None and point in line.points_on
+
     def not_collinear_points(self, segment):
         line = self.__segment_to_line.get(segment)
         return list(line.points_not_on.keys()) if line else []
@@ -587,6 +690,12 @@ class LineSet:
             if segment0 in prop.segments and segment1 in prop.segments:
                 return prop
 
+        key = (segment0, segment1)
+        stamp = (line0, line0.version, line1, line1.version, len(known))
+        cached = self.__lines_coincidence_cache.get(key)
+        if cached and cached[0] == stamp:
+            return _memoized_synthetic_property(cached[1])
+
         candidates = []
         for prop in known:
             seg0, seg1 = prop.segments
@@ -607,13 +716,126 @@ class LineSet:
             prop = LinesCoincidenceProperty(segment0, segment1, False)
             candidates.append(_synthetic_property(prop, Comment(pattern, params), premises))
 
-        return LineSet.best_candidate(candidates)
+        prop = LineSet.best_candidate(candidates)
+        self.__lines_coincidence_cache[key] = (stamp, prop)
+        return prop
+
+    def __perpendicular_lines_candidate(self, known, line0, line1, segment0, segment1):
+        seg0, seg1 = known.segments
+        if self.__segment_to_line[seg0] != line0:
+            seg0, seg1 = seg1, seg0
+        premises = [known]
+        if seg0 != segment0:
+            premises.append(line0.same_line_property(seg0, segment0))
+        if seg1 != segment1:
+            premises.append(line1.same_line_property(seg1, segment1))
+        return _synthetic_property(
+            PerpendicularSegmentsProperty(segment0, segment1),
+            Comment(
+                '$%{segment:seg0}$ and $%{segment:seg1}$ lie on perpendicular lines $%{line:line0}$ and $%{line:line1}$',
+                {'seg0': segment0, 'seg1': segment1, 'line0': seg0, 'line1': seg1}
+            ),
+            premises
+        )
+
+    def perpendicular_lines_property(self, segment0, segment1):
+        line0 = self.__segment_to_line.get(segment0)
+        line1 = self.__segment_to_line.get(segment1)
+        if line0 is None or line1 is None:
+            return None
+        known = self.__perpendicular_lines.get(frozenset((line0, line1)))
+        if not known:
+            return None
+        return self.__perpendicular_lines_property(known, line0, line1, segment0, segment1)
+
+    def __perpendicular_lines_property(self, known, line0, line1, segment0, segment1):
+        key = (segment0, segment1)
+        stamp = (line0, line0.version, line1, line1.version, len(known))
+        cached = self.__perpendicular_lines_cache.get(key)
+        if cached and cached[0] == stamp:
+            return _memoized_synthetic_property(cached[1])
+        prop = LineSet.best_candidate([
+            self.__perpendicular_lines_candidate(prop, line0, line1, segment0, segment1) for prop in known
+        ])
+        self.__perpendicular_lines_cache[key] = (stamp, prop)
+        return prop
+
+    def perpendicular_lines_properties(self, segment):
+        line0 = self.__segment_to_line.get(segment)
+        if line0 is None:
+            return []
+        properties = []
+        for key, known in self.__perpendicular_lines.items():
+            if line0 not in key:
+                continue
+            line1 = next(l for l in key if l != line0)
+            for seg in line1.segments:
+                properties.append(self.__perpendicular_lines_property(known, line0, line1, segment, seg))
+        return properties
+
+    def direction_property(self, segment0, segment1, parallel):
+        line0 = self.__segment_to_line.get(segment0)
+        line1 = self.__segment_to_line.get(segment1)
+        if line0 is None or line1 is None or line0 == line1:
+            return None
+        if self.__directions.parallel(line0, line1) != parallel:
+            return None
+        fam = self.__directions.line_to_family[line0]
+        key = (segment0, segment1)
+        stamp = (fam, fam.version, line0.version, line1.version)
+        cached = self.__direction_cache.get(key)
+        if cached and cached[0] == stamp:
+            return _memoized_synthetic_property(cached[1])
+
+        premises = []
+        clauses = []
+        params = {}
+        def same_line(line, seg0, seg1):
+            premises.append(line.same_line_property(seg0, seg1))
+            clauses.append('$%%{line:seg%d}$ is the same line as $%%{line:seg%d}$' % (len(params), len(params) + 1))
+            params['seg%d' % len(params)] = seg0
+            params['seg%d' % len(params)] = seg1
+
+        current = segment0
+        for index, (l0, l1, known) in enumerate(self.__directions.path(line0, line1)):
+            seg0, seg1, para = _direction_segments(known)
+            if self.__segment_to_line[seg0] != l0:
+                seg0, seg1 = seg1, seg0
+            if index > 0:
+                # the transitivity does not work via zero-length segments
+                for seg in (current, ) if current == seg0 else (current, seg0):
+                    ne = self.coincidence_property(*seg.points)
+                    if ne is None or ne.coincident:
+                        return None
+                    premises.append(ne)
+            if seg0 != current:
+                same_line(l0, current, seg0)
+            premises.append(known)
+            clauses.append('$%%{segment:seg%d} %s %%{segment:seg%d}$' % (len(params), '\\,\\|\\,' if para else '\\perp', len(params) + 1))
+            params['seg%d' % len(params)] = seg0
+            params['seg%d' % len(params)] = seg1
+            current = seg1
+        if current != segment1:
+            same_line(line1, current, segment1)
+
+        prop = ParallelSegmentsProperty(segment0, segment1) if parallel else PerpendicularSegmentsProperty(segment0, segment1)
+        prop = _synthetic_property(prop, Comment(', '.join(clauses), params), premises)
+        self.__direction_cache[key] = (stamp, prop)
+        return prop
+
+    def direction_segments(self, since):
+        # Returns (families, cursor); a family is a list of the segments of the parallel
+        # and perpendicular facts on linked lines that changed after the `since` cursor.
+        families, cursor = self.__directions.changes_since(since)
+        return [list(fam.segments) for fam in families], cursor
 
 class CyclicOrderPropertySet:
     class Family:
         def __init__(self):
             self.cycle_set = set()
             self.premises_graph = nx.Graph()
+            self.version = 0
+            self.__same_order_cache = {} # (cycle, cycle) => (version, prop)
 
         def explanation(self, cycle0, cycle1):
             if cycle0 not in self.cycle_set or cycle1 not in self.cycle_set:
@@ -629,6 +851,18 @@ class CyclicOrderPropertySet:
             premises = [self.premises_graph.get_edge_data(i, j)['prop'] for i, j in zip(path[:-1], path[1:])]
             return (comment, premises)
 
+        def same_order_property(self, cycle0, cycle1):
+            key = (cycle0, cycle1)
+            cached = self.__same_order_cache.get(key)
+            if cached and cached[0] == self.version:
+                return _memoized_synthetic_property(cached[1])
+            comment, premises = self.explanation(cycle0, cycle1)
+            if comment is None:
+                return None
+            prop = _synthetic_property(SameCyclicOrderProperty(cycle0, cycle1), comment, premises)
+            self.__same_order_cache[key] = (self.version, prop)
+            return prop
+
     def __init__(self):
         self.families = []
 
@@ -661,11 +895,319 @@ class CyclicOrderPropertySet:
             fam.cycle_set.add(prop.cycle1)
             self.families.append(fam)
         fam.premises_graph.add_edge(prop.cycle0, prop.cycle1, prop=prop)
+        fam.version += 1
 
     def explanation(self, cycle0, cycle1):
         fam = self.__find_by_cycle(cycle0)
         return fam.explanation(cycle0, cycle1) if fam else (None, None)
 
+    def same_order_property(self, cycle0, cycle1):
+        fam = self.__find_by_cycle(cycle0)
+        return fam.same_order_property(cycle0, cycle1) if fam else None
+
+class TwoPointsRelativeToLinePropertySet:
+    class Family:
+        def __init__(self, segment):
+            self.segment = segment
+            self.point_to_side = {} # point => 0 or 1, the points with equal values are on the same side
+            self.premises_graph = nx.Graph()
+            self.version = 0
+            self.__cache = {} # (point, point) => (version, prop)
+
+        def add(self, prop):
+            self.version += 1
+            self.premises_graph.add_edge(*prop.points, prop=prop)
+
+        def merge(self, other, flip):
+            for pt, side in other.point_to_side.items():
+                self.point_to_side[pt] = 1 - side if flip else side
+            self.premises_graph.add_edges_from(other.premises_graph.edges(data=True))
+            self.version += 1
+
+        def relative_position_property(self, point0, point1):
+            key = (point0, point1)
+            cached = self.__cache.get(key)
+            if cached and cached[0] == self.version:
+                return _memoized_synthetic_property(cached[1])
+            path = nx.algorithms.shortest_path(self.premises_graph, point0, point1)
+            premises = [self.premises_graph[i][j]['prop'] for i, j in zip(path[:-1], path[1:])]
+            if len(premises) == 1:
+                return premises[0]
+            pattern = ', '.join(['$%%{point:pt%d}$' % index for index in range(0, len(path))])
+            params = {'pt%d' % index: pt for index, pt in enumerate(path)}
+            params['line'] = self.segment
+            prop = _synthetic_property(
+                SameOrOppositeSideProperty(
+                    self.segment, point0, point1,
+                    self.point_to_side[point0] == self.point_to_side[point1]
+                ),
+                Comment('positions of %s relative to $%%{line:line}$' % pattern, params),
+                premises
+            )
+            self.__cache[key] = (self.version, prop)
+            return prop
+
+    def __init__(self):
+        self.__point_to_family = {} # (segment, point) => family
+
+    def add(self, prop):
+        if hasattr(prop, 'rule') and prop.rule == SyntheticPropertyRule.instance():
+            return
+        segment = prop.segment
+        pt0, pt1 = prop.points
+        fam0 = self.__point_to_family.get((segment, pt0))
+        fam1 = self.__point_to_family.get((segment, pt1))
+        if fam0 and fam1:
+            if fam0 != fam1:
+                if len(fam0.point_to_side) < len(fam1.point_to_side):
+                    fam0, fam1 = fam1, fam0
+                    pt0, pt1 = pt1, pt0
+                same = fam0.point_to_side[pt0] == fam1.point_to_side[pt1]
+                fam0.merge(fam1, same != prop.same)
+                for pt in fam1.point_to_side:
+                    self.__point_to_family[(segment, pt)] = fam0
+            fam = fam0
+        elif fam0 or fam1:
+            if fam1:
+                fam0, pt0, pt1 = fam1, pt1, pt0
+            side = fam0.point_to_side[pt0]
+            fam0.point_to_side[pt1] = side if prop.same else 1 - side
+            self.__point_to_family[(segment, pt1)] = fam0
+            fam = fam0
+        else:
+            fam = TwoPointsRelativeToLinePropertySet.Family(segment)
+            fam.point_to_side[pt0] = 0
+            fam.point_to_side[pt1] = 0 if prop.same else 1
+            self.__point_to_family[(segment, pt0)] = fam
+            self.__point_to_family[(segment, pt1)] = fam
+        fam.add(prop)
+
+    def relative_position_property(self, segment, point0, point1):
+        fam = self.__point_to_family.get((segment, point0))
+        if fam is None or self.__point_to_family.get((segment, point1)) != fam:
+            return None
+        return fam.relative_position_property(point0, point1)
+
+class RayPropertySet:
+    # 0º and 180º angles with vertex. The points of a family lie on the same line
+    # through the vertex, the family splits them into two rays.
+    class Family:
+        def __init__(self, vertex):
+            self.vertex = vertex
+            self.point_to_ray = {} # point => 0 or 1, the points with equal values are on the same ray
+            self.premises_graph = nx.Graph()
+            self.version = 0
+            self.__cache = {} # (point, point) => (version, prop)
+
+        def add(self, prop):
+            self.version += 1
+            self.premises_graph.add_edge(*prop.angle.endpoints, prop=prop)
+
+        def merge(self, other, flip):
+            for pt, ray in other.point_to_ray.items():
+                self.point_to_ray[pt] = 1 - ray if flip else ray
+            self.premises_graph.add_edges_from(other.premises_graph.edges(data=True))
+            self.version += 1
+
+        def ray_points(self, point):
+            ray = self.point_to_ray[point]
+            return {pt for pt, r in self.point_to_ray.items() if r == ray}
+
+        def premises(self, point0, point1):
+            path = nx.algorithms.shortest_path(self.premises_graph, point0, point1)
+            return [self.premises_graph[i][j]['prop'] for i, j in zip(path[:-1], path[1:])]
+
+        def ray_property(self, point0, point1):
+            premises = self.premises(point0, point1)
+            if len(premises) == 1:
+                return premises[0]
+            key = (point0, point1)
+            cached = self.__cache.get(key)
+            if cached and cached[0] == self.version:
+                return _memoized_synthetic_property(cached[1])
+            if self.point_to_ray[point0] == self.point_to_ray[point1]:
+                prop = AngleValueProperty(self.vertex.angle(point0, point1), 0)
+                pattern = '$%{point:pt0}$ and $%{point:pt1}$ lie on the same ray from $%{point:vertex}$'
+            else:
+                prop = AngleValueProperty(self.vertex.angle(point0, point1), 180)
+                pattern = '$%{point:pt0}$ and $%{point:pt1}$ lie on the opposite rays from $%{point:vertex}$'
+            prop = _synthetic_property(
+                prop, Comment(pattern, {'pt0': point0, 'pt1': point1, 'vertex': self.vertex}), premises
+            )
+            self.__cache[key] = (self.version, prop)
+            return prop
+
+    def __init__(self):
+        self.__point_to_family = {} # (vertex, point) => family
+        self.__counts = {} # vertex => number of facts
+
+    def add(self, prop):
+        if hasattr(prop, 'rule') and prop.rule == SyntheticPropertyRule.instance():
+            return
+        vertex = prop.angle.vertex
+        same = prop.degree == 0
+        pt0, pt1 = prop.angle.endpoints
+        self.__counts[vertex] = self.__counts.get(vertex, 0) + 1
+        fam0 = self.__point_to_family.get((vertex, pt0))
+        fam1 = self.__point_to_family.get((vertex, pt1))
+        if fam0 and fam1:
+            if fam0 != fam1:
+                if len(fam0.point_to_ray) < len(fam1.point_to_ray):
+                    fam0, fam1 = fam1, fam0
+                    pt0, pt1 = pt1, pt0
+                flip = (fam0.point_to_ray[pt0] == fam1.point_to_ray[pt1]) != same
+                fam0.merge(fam1, flip)
+                for pt in fam1.point_to_ray:
+                    self.__point_to_family[(vertex, pt)] = fam0
+            fam = fam0
+        elif fam0 or fam1:
+            if fam1:
+                fam0, pt0, pt1 = fam1, pt1, pt0
+            ray = fam0.point_to_ray[pt0]
+            fam0.point_to_ray[pt1] = ray if same else 1 - ray
+            self.__point_to_family[(vertex, pt1)] = fam0
+            fam = fam0
+        else:
+            fam = RayPropertySet.Family(vertex)
+            fam.point_to_ray[pt0] = 0
+            fam.point_to_ray[pt1] = 0 if same else 1
+            self.__point_to_family[(vertex, pt0)] = fam
+            self.__point_to_family[(vertex, pt1)] = fam
+        fam.add(prop)
+
+    def count(self, vertex):
+        return self.__counts.get(vertex, 0)
+
+    def same_ray_points(self, vertex, point):
+        fam = self.__point_to_family.get((vertex, point))
+        return fam.ray_points(point) if fam else {point}
+
+    def __family(self, vertex, point0, point1):
+        fam = self.__point_to_family.get((vertex, point0))
+        if fam is None or self.__point_to_family.get((vertex, point1)) != fam:
+            return None
+        return fam
+
+    def same_ray(self, vertex, point0, point1):
+        fam = self.__family(vertex, point0, point1)
+        if fam is None:
+            return None
+        return fam.point_to_ray[point0] == fam.point_to_ray[point1]
+
+    def premises(self, vertex, point0, point1):
+        return self.__point_to_family[(vertex, point0)].premises(point0, point1)
+
+    def ray_property(self, vertex, point0, point1):
+        fam = self.__family(vertex, point0, point1)
+        return fam.ray_property(point0, point1) if fam else None
+
+def _direction_segments(prop):
+    # (segment, segment, parallel) for a parallel, perpendicular, or 0º angle fact
+    if isinstance(prop, ParallelVectorsProperty):
+        return (prop.vectors[0].as_segment, prop.vectors[1].as_segment, True)
+    if isinstance(prop, AngleValueProperty):
+        return (prop.angle.vectors[0].as_segment, prop.angle.vectors[1].as_segment, True)
+    return (*prop.segments, isinstance(prop, ParallelSegmentsProperty))
+
+class DirectionPropertySet:
+    class Family:
+        def __init__(self):
+            self.line_to_parity = {} # line => 0 or 1, equal values for parallel lines
+            self.segments = {} # segments of the facts, in the order of addition
+            self.premises_graph = nx.Graph() # lines, an edge keeps a fact
+            self.version = 0
+
+        def merge(self, other, flip):
+            for line, parity in other.line_to_parity.items():
+                self.line_to_parity[line] = 1 - parity if flip else parity
+            self.segments.update(other.segments)
+            self.premises_graph.add_edges_from(other.premises_graph.edges(data=True))
+
+    def __init__(self):
+        self.line_to_family = {}
+        self.__changes = [] # families in the order of modification, with repetitions
+
+    def __touch(self, fam):
+        fam.version += 1
+        self.__changes.append(fam)
+
+    def __merge(self, fam0, line0, fam1, line1, same):
+        # merges the families so that line0 and line1 get equal parities iff same
+        flip = (fam0.line_to_parity[line0] == fam1.line_to_parity[line1]) != same
+        if len(fam0.line_to_parity) < len(fam1.line_to_parity):
+            fam0, fam1 = fam1, fam0
+        fam0.merge(fam1, flip)
+        for line in fam1.line_to_parity:
+            self.line_to_family[line] = fam0
+        return fam0
+
+    def add(self, line0, line1, parallel, prop, segments):
+        if line0 == line1:
+            return
+        fam0 = self.line_to_family.get(line0)
+        fam1 = self.line_to_family.get(line1)
+        if fam0 and fam1:
+            fam = fam0 if fam0 == fam1 else self.__merge(fam0, line0, fam1, line1, parallel)
+        elif fam0 or fam1:
+            if fam1:
+                fam0, line0, line1 = fam1, line1, line0
+            parity = fam0.line_to_parity[line0]
+            fam0.line_to_parity[line1] = parity if parallel else 1 - parity
+            self.line_to_family[line1] = fam0
+            fam = fam0
+        else:
+            fam = DirectionPropertySet.Family()
+            fam.line_to_parity[line0] = 0
+            fam.line_to_parity[line1] = 0 if parallel else 1
+            self.line_to_family[line0] = fam
+            self.line_to_family[line1] = fam
+        fam.segments.update(dict.fromkeys(segments))
+        if not fam.premises_graph.has_edge(line0, line1):
+            fam.premises_graph.add_edge(line0, line1, prop=prop)
+        self.__touch(fam)
+
+    def merge_lines(self, line0, line1):
+        # line1 is absorbed by line0
+        fam1 = self.line_to_family.get(line1)
+        if fam1 is None:
+            return
+        fam0 = self.line_to_family.get(line0)
+        if fam0 is None:
+            fam1.line_to_parity[line0] = fam1.line_to_parity[line1]
+            self.line_to_family[line0] = fam1
+            fam = fam1
+        elif fam0 != fam1:
+            fam = self.__merge(fam0, line0, fam1, line1, True)
+        else:
+            fam = fam0
+        del fam.line_to_parity[line1]
+        del self.line_to_family[line1]
+        graph = fam.premises_graph
+        for other, data in list(graph[line1].items()):
+            if other != line0 and not graph.has_edge(line0, other):
+                graph.add_edge(line0, other, **data)
+        graph.remove_node(line1)
+        self.__touch(fam)
+
+    def parallel(self, line0, line1):
+        fam = self.line_to_family.get(line0)
+        if fam is None or self.line_to_family.get(line1) != fam:
+            return None
+        return fam.line_to_parity[line0] == fam.line_to_parity[line1]
+
+    def path(self, line0, line1):
+        fam = self.line_to_family[line0]
+        lines = nx.algorithms.shortest_path(fam.premises_graph, line0, line1)
+        return [(l0, l1, fam.premises_graph[l0][l1]['prop']) for l0, l1 in zip(lines[:-1], lines[1:])]
+
+    def changes_since(self, since):
+        # the families absorbed by other families are skipped
+        size = len(self.__changes)
+        if size <= since:
+            return [], since
+        families = dict.fromkeys(itertools.islice(self.__changes, since, size))
+        return [fam for fam in families if self.line_to_family.get(next(iter(fam.line_to_parity))) == fam], size
+
 class AngleRatioPropertySet:
     class CommentFromPath:
         def __init__(self, path, premises, multiplier, angle_to_ratio):
@@ -710,6 +1252,8 @@ class AngleRatioPropertySet:
             self.angle_to_ratio = {}
             self.premises_graph = nx.Graph()
             self.degree = None
+            self.version = 0
+            self.__value_cache = {} # angle => (version, prop)
 
         def explanation_from_path(self, path, multiplier):
             premises = [self.premises_graph.get_edge_data(i, j)['prop'] for i, j in zip(path[:-1], path[1:])]
@@ -731,30 +1275,28 @@ class AngleRatioPropertySet:
             ratio = self.angle_to_ratio.get(angle)
             return ratio * self.degree if ratio else None
 
-        def value_property(self, angle):
-            ratio = self.angle_to_ratio.get(angle)
-            if ratio is None:
-                return None
+        def __value_property(self, angle, ratio):
             edge = self.premises_graph.get_edge_data(angle, self.degree)
             if edge:
                 return edge['prop']
+            cached = self.__value_cache.get(angle)
+            if cached and cached[0] == self.version:
+                return _memoized_synthetic_property(cached[1])
             path = nx.algorithms.shortest_path(self.premises_graph, angle, self.degree)
             comment, premises = self.explanation_from_path(path, ratio)
             prop = AngleValueProperty(angle, self.degree * ratio)
-            return _synthetic_property(prop, comment, premises)
+            prop = _synthetic_property(prop, comment, premises)
+            self.__value_cache[angle] = (self.version, prop)
+            return prop
+
+        def value_property(self, angle):
+            ratio = self.angle_to_ratio.get(angle)
+            if ratio is None:
+                return None
+            return self.__value_property(angle, ratio)
 
         def value_properties(self):
-            properties = []
-            for angle, ratio in self.angle_to_ratio.items():
-                edge = self.premises_graph.get_edge_data(angle, self.degree)
-                if edge:
-                    properties.append(edge['prop'])
-                    continue
-                path = nx.algorithms.shortest_path(self.premises_graph, angle, self.degree)
-                comment, premises = self.explanation_from_path(path, ratio)
-                prop = AngleValueProperty(angle, self.degree * ratio)
-                properties.append(_synthetic_property(prop, comment, premises))
-            return properties
+            return [self.__value_property(angle, ratio) for angle, ratio in self.angle_to_ratio.items()]
 
         def angles_for_degree(self, degree):
             angles = []
@@ -770,14 +1312,7 @@ class AngleRatioPropertySet:
                     continue
                 if self.degree * ratio != degree:
                     continue
-                edge = self.premises_graph.get_edge_data(angle, self.degree)
-                if edge:
-                    properties.append(edge['prop'])
-                    continue
-                path = nx.algorithms.shortest_path(self.premises_graph, angle, self.degree)
-                comment, premises = self.explanation_from_path(path, ratio)
-                prop = AngleValueProperty(angle, degree)
-                properties.append(_synthetic_property(prop, comment, premises))
+                properties.append(self.__value_property(angle, ratio))
             return properties
 
         def congruent_angles_with_vertex(self):
@@ -817,6 +1352,7 @@ class AngleRatioPropertySet:
                     yield _synthetic_property(prop, comment, premises)
 
         def add_value_property(self, prop):
+            self.version += 1
             ratio = self.angle_to_ratio.get(prop.angle)
             if ratio and self.degree:
                 # TODO: better way to report contradiction
@@ -831,6 +1367,7 @@ class AngleRatioPropertySet:
             self.premises_graph.add_edge(prop.angle, self.degree, prop=prop, cost=prop.reason.cost)
 
         def add_ratio_property(self, prop):
+            self.version += 1
             ratio0 = self.angle_to_ratio.get(prop.angle0)
             ratio1 = self.angle_to_ratio.get(prop.angle1)
             if ratio0 and ratio1:
@@ -851,6 +1388,15 @@ class AngleRatioPropertySet:
         self.__value_cache = {} # angle => prop
         self.__ratio_cache = {} # {angle, angle} => prop
         self.__sum_of_two_angles = {} # (angle, angle) => prop
+        # an angle class is a (family, ratio) pair; a triangle is put into a bucket
+        # for each pair of its angle classes, the buckets are updated for the triangles
+        # with new angles and the triangles with angles in merged families
+        self.__class_ids = {} # (family, ratio) => class number
+        self.__triangle_angles = {} # three points => [angles]
+        self.__triangle_keys = {} # three points => [bucket keys]
+        self.__buckets = {} # (class number, class number) => {three points => [(angle, angle)]}
+        self.__dirty_triangles = {} # three points => None, ordered set
+        self.__class_count = 0
 
     def value(self, angle):
         fam = self.family_with_degree
@@ -874,6 +1420,22 @@ class AngleRatioPropertySet:
         fam = self.family_with_degree
         return fam.angles_for_degree(degree) if fam else []
 
+    def value_count(self):
+        fam = self.family_with_degree
+        return len(fam.angle_to_ratio) if fam else 0
+
+    def angle_values_since(self, since):
+        # angles with known values are never removed from the family, and their values
+        # never change, so the insertion order is a log of newly evaluated angles
+        fam = self.family_with_degree
+        if fam is None:
+            return [], since
+        size = len(fam.angle_to_ratio)
+        if size <= since:
+            return [], since
+        items = itertools.islice(fam.angle_to_ratio.items(), since, size)
+        return [(angle, ratio * fam.degree) for angle, ratio in items], size
+
     def value_properties_for_degree(self, degree, condition):
         fam = self.family_with_degree
         return fam.value_properties_for_degree(degree, condition) if fam else []
@@ -902,6 +1464,74 @@ class AngleRatioPropertySet:
             for angle in fam.congruent_angles_with_vertex():
                 yield angle
 
+    def __register_angle(self, angle):
+        if angle.vertex is None:
+            return
+        key = angle.point_set
+        lst = self.__triangle_angles.get(key)
+        if lst:
+            lst.append(angle)
+        else:
+            self.__triangle_angles[key] = [angle]
+        self.__dirty_triangles[key] = None
+
+    def __touch_family(self, fam):
+        # the classes of the family angles are about to change
+        for angle in fam.angle_to_ratio:
+            if angle.vertex is not None:
+                self.__dirty_triangles[angle.point_set] = None
+        for key in [key for key in self.__class_ids if key[0] == fam]:
+            del self.__class_ids[key]
+
+    def __class_id(self, angle):
+        fam = self.angle_to_family[angle]
+        key = (fam, fam.angle_to_ratio[angle])
+        cls = self.__class_ids.get(key)
+        if cls is None:
+            cls = self.__class_count
+            self.__class_count += 1
+            self.__class_ids[key] = cls
+        return cls
+
+    def __update_buckets(self):
+        for point_set in self.__dirty_triangles:
+            for key in self.__triangle_keys.get(point_set, []):
+                entries = self.__buckets[key]
+                del entries[point_set]
+                if not entries:
+                    del self.__buckets[key]
+            keys = []
+            lst = [(self.__class_id(angle), angle) for angle in self.__triangle_angles[point_set]]
+            for (cls0, angle0), (cls1, angle1) in itertools.combinations(lst, 2):
+                if cls0 > cls1:
+                    cls0, cls1, angle0, angle1 = cls1, cls0, angle1, angle0
+                entries = self.__buckets.get((cls0, cls1))
+                if entries is None:
+                    entries = {}
+                    self.__buckets[(cls0, cls1)] = entries
+                pairs = entries.get(point_set)
+                if pairs:
+                    pairs.append((angle0, angle1))
+                else:
+                    entries[point_set] = [(angle0, angle1)]
+                    keys.append((cls0, cls1))
+            self.__triangle_keys[point_set] = keys
+        self.__dirty_triangles = {}
+
+    def triangles_with_two_congruent_angles(self):
+        # Yields pairs of congruence pairs ((a0, a1), (b0, b1)), where a0, b0 are angles
+        # of one triangle and a1, b1 are angles of another one.
+        # A triangle is put into a bucket for each pair of its angle classes,
+        # so the candidates are the bucket hits only.
+        self.__update_buckets()
+        for (cls0, cls1), entries in list(self.__buckets.items()):
+            for (set0, pairs0), (set1, pairs1) in itertools.combinations(entries.items(), 2):
+                for a0, b0 in pairs0:
+                    for a1, b1 in pairs1:
+                        yield ((a0, a1), (b0, b1))
+                        if cls0 == cls1:
+                            yield ((a0, b1), (b0, a1))
+
     def congruent_angles_for(self, angle):
         fam = self.angle_to_family.get(angle)
         if fam:
@@ -929,6 +1559,7 @@ class AngleRatioPropertySet:
         fam = self.angle_to_family.get(prop.angle)
         if fam and self.family_with_degree:
             if fam != self.family_with_degree:
+                self.__touch_family(fam)
                 coef = divide(prop.degree, self.family_with_degree.degree * fam.angle_to_ratio[prop.angle])
                 if coef != 1:
                     for key in fam.angle_to_ratio:
@@ -938,13 +1569,16 @@ class AngleRatioPropertySet:
                     if self.angle_to_family[key] == fam:
                         self.angle_to_family[key] = self.family_with_degree
                 self.family_with_degree.premises_graph.add_edges_from(fam.premises_graph.edges(data=True))
+                self.family_with_degree.version += 1
         elif fam:
             self.family_with_degree = fam
         elif self.family_with_degree:
             self.angle_to_family[prop.angle] = self.family_with_degree
+            self.__register_angle(prop.angle)
         else:
             self.family_with_degree = AngleRatioPropertySet.Family()
             self.angle_to_family[prop.angle] = self.family_with_degree
+            self.__register_angle(prop.angle)
         self.family_with_degree.add_value_property(prop)
 
     def __add_ratio_property(self, prop):
@@ -958,6 +1592,7 @@ class AngleRatioPropertySet:
                     coef = divide(fam0.angle_to_ratio[prop.angle1] * prop.value, fam1.angle_to_ratio[prop.angle0])
                 else:
                     coef = divide(fam0.angle_to_ratio[prop.angle0], prop.value * fam1.angle_to_ratio[prop.angle1])
+                self.__touch_family(fam1)
                 if coef != 1:
                     for key in fam1.angle_to_ratio:
                         fam1.angle_to_ratio[key] *= coef
@@ -966,17 +1601,22 @@ class AngleRatioPropertySet:
                     if self.angle_to_family[key] == fam1:
                         self.angle_to_family[key] = fam0
                 fam0.premises_graph.add_edges_from(fam1.premises_graph.edges(data=True))
+                fam0.version += 1
         elif fam0:
             fam0.add_ratio_property(prop)
             self.angle_to_family[prop.angle1] = fam0
+            self.__register_angle(prop.angle1)
         elif fam1:
             fam1.add_ratio_property(prop)
             self.angle_to_family[prop.angle0] = fam1
+            self.__register_angle(prop.angle0)
         else:
             fam = AngleRatioPropertySet.Family()
             fam.add_ratio_property(prop)
             self.angle_to_family[prop.angle0] = fam
             self.angle_to_family[prop.angle1] = fam
+            self.__register_angle(prop.angle0)
+            self.__register_angle(prop.angle1)
 
     def sum_of_two_angles(self, angle0, angle1):
         congruents0 = set(self.congruent_angles_for(angle0))
@@ -1019,10 +1659,17 @@ class LengthRatioPropertySet:
             self.ratio_value = None
             self.ratio_set = set()
             self.premises_graph = nx.Graph()
+            self.version = 0
+            self.__value_cache = {} # ratio => (version, prop)
 
         def add_ratio(self, ratio):
+            self.version += 1
             self.ratio_set.add(ratio)
 
+        def add_premise(self, node0, node1, prop):
+            self.version += 1
+            self.premises_graph.add_edge(node0, node1, prop=prop)
+
         def merge(self, other):
             if self.ratio_value is not None:
                 # TODO: better way to report contradiction
@@ -1032,6 +1679,7 @@ class LengthRatioPropertySet:
 
             self.ratio_set.update(other.ratio_set)
             self.premises_graph.add_edges_from(other.premises_graph.edges(data=True))
+            self.version += 1
 
         def find_ratio(self, ratio):
             if ratio in self.ratio_set:
@@ -1058,6 +1706,18 @@ class LengthRatioPropertySet:
         def value_explanation(self, ratio):
             return self.explanation(ratio, (self.ratio_value, ))
 
+        def value_property(self, ratio):
+            cached = self.__value_cache.get(ratio)
+            if cached and cached[0] == self.version:
+                return _memoized_synthetic_property(cached[1])
+            comment, premises = self.value_explanation(ratio)
+            if len(premises) == 1:
+                return premises[0]
+            prop = LengthRatioProperty(*ratio, self.ratio_value)
+            prop = _synthetic_property(prop, comment, premises)
+            self.__value_cache[ratio] = (self.version, prop)
+            return prop
+
     def __init__(self):
         self.families = []
         self.ratio_to_family = {}
@@ -1066,7 +1726,7 @@ class LengthRatioPropertySet:
 
     def __add_lr(self, prop, ratio, value):
         def add_property_to(fam):
-            fam.premises_graph.add_edge(ratio, (value, ), prop=prop)
+            fam.add_premise(ratio, (value, ), prop)
 
         fam0 = self.ratio_to_family.get(ratio)
         fam1 = self.ratio_to_family.get(value)
@@ -1102,7 +1762,7 @@ class LengthRatioPropertySet:
         ratio1 = (prop.segments[2], prop.segments[3])
 
         def add_property_to(fam):
-            fam.premises_graph.add_edge(ratio0, ratio1, prop=prop)
+            fam.add_premise(ratio0, ratio1, prop)
 
         fam0 = self.ratio_to_family.get(ratio0)
         fam1 = self.ratio_to_family.get(ratio1)
@@ -1190,12 +1850,7 @@ class LengthRatioPropertySet:
                     if key in unique:
                         continue
                     unique.add(key)
-                comment, premises = fam.value_explanation(ratio)
-                if len(premises) == 1:
-                    yield premises[0]
-                else:
-                    prop = LengthRatioProperty(*ratio, fam.ratio_value)
-                    yield _synthetic_property(prop, comment, premises)
+                yield fam.value_property(ratio)
 
     def property_and_value(self, segment0, segment1):
         ratio = (segment0, segment1)
@@ -1219,10 +1874,58 @@ class LengthRatioPropertySet:
         self.__cache[key] = pair
         return pair
 
+class TriangleSet:
+    class Summary:
+        def __init__(self, points):
+            self.points = points
+            self.angles = [] # angles with known non-degenerate values
+            self.version = 0
+
+    def __init__(self):
+        self.__summaries = {} # three points => Summary
+        self.__by_side = {} # two points => [Summary]
+        self.__changes = [] # summaries in the order of modification, with repetitions
+
+    def __len__(self):
+        return len(self.__summaries)
+
+    def __touch(self, summary):
+        summary.version += 1
+        self.__changes.append(summary)
+
+    def add_angle(self, angle):
+        key = angle.point_set
+        summary = self.__summaries.get(key)
+        if summary is None:
+            summary = TriangleSet.Summary(key)
+            self.__summaries[key] = summary
+            for pt0, pt1 in itertools.combinations(key, 2):
+                side = frozenset([pt0, pt1])
+                lst = self.__by_side.get(side)
+                if lst:
+                    lst.append(summary)
+                else:
+                    self.__by_side[side] = [summary]
+        summary.angles.append(angle)
+        self.__touch(summary)
+
+    def touch_side(self, pt0, pt1):
+        for summary in self.__by_side.get(frozenset([pt0, pt1]), []):
+            self.__touch(summary)
+
+    def changes_since(self, since):
+        size = len(self.__changes)
+        if size <= since:
+            return [], since
+        return list(dict.fromkeys(itertools.islice(self.__changes, since, size))), size
+
 class PropertySet(LineSet):
-    def __init__(self, points):
+    def __init__(self, points, line_level_perpendiculars=False):
         super().__init__()
         self.points = list(points)
+        # if set, perpendicular segments on the same pair of lines are not expected
+        # to be listed one by one, they are derived from the line-level facts
+        self.line_level_perpendiculars = line_level_perpendiculars
         self.__combined = {} # (type, key) => [prop] and type => prop
         self.__full_set = {} # prop => prop
         self.__indexes = {} # prop => number
@@ -1230,8 +1933,18 @@ class PropertySet(LineSet):
         self.__angle_ratios = AngleRatioPropertySet()
         self.__length_ratios = LengthRatioPropertySet()
         self.__cyclic_orders = CyclicOrderPropertySet()
-        self.__similar_triangles = {} # (three points) => {(three points)}
+        self.__similar_triangles = set() # frozenset of vertex correspondences, one orientation per fact
         self.__two_points_relative_to_line = {} # key => SameOrOppositeSideProperty
+        self.__relative_positions = TwoPointsRelativeToLinePropertySet()
+        # 0º angles are not included into the angle ratio families
+        self.__zero_angles = [] # props in the order of addition
+        self.__zero_angles_by_vertex = {} # vertex (None for vectors with no common start) => [props]
+        self.__zero_angles_by_point_set = {} # three points => [props], for angles with vertex only
+        self.__rays = RayPropertySet() # 0º and 180º angles with vertex
+        self.__same_rays_cache = {} # angle => (stamp, prop or None)
+        self.__inside_segment = {} # segment => [points], from 180º angles with vertex
+        self.__triangles = TriangleSet() # triangles with known angles
+        self.__angle_values_cursor = 0 # number of processed angles with known values
 
     def add(self, prop):
         def put(key):
@@ -1249,6 +1962,11 @@ class PropertySet(LineSet):
         self.__indexes[prop] = len(self.__indexes)
         if type_key in (AngleValueProperty, AngleRatioProperty, SumOfTwoAnglesProperty):
             self.__angle_ratios.add(prop)
+            if type_key == AngleValueProperty and prop.degree == 0:
+                self.__add_zero_angle(prop)
+                super().add(prop)
+            elif type_key == AngleValueProperty and prop.degree == 180 and prop.angle.vertex:
+                self.__add_ray_property(prop)
         elif type_key == AngleKindProperty:
             self.__angle_kinds[prop.angle] = prop
         elif type_key == ProportionalLengthsProperty:
@@ -1259,22 +1977,38 @@ class PropertySet(LineSet):
             self.__length_ratios.add(prop)
         elif type_key == SameCyclicOrderProperty:
             self.__cyclic_orders.add(prop)
-        elif type_key in (PointsCoincidenceProperty, LinesCoincidenceProperty, PointOnLineProperty, PointsCollinearityProperty, CircleCoincidenceProperty, PointAndCircleProperty, ConcyclicPointsProperty):
+        elif type_key in (PointsCoincidenceProperty, LinesCoincidenceProperty, PointOnLineProperty, PointsCollinearityProperty, CircleCoincidenceProperty, PointAndCircleProperty, ConcyclicPointsProperty, ParallelSegmentsProperty, ParallelVectorsProperty, PerpendicularSegmentsProperty):
             super().add(prop)
         elif type_key == SameOrOppositeSideProperty:
             self.__two_points_relative_to_line[prop.property_key] = prop
+            self.__relative_positions.add(prop)
         elif type_key in (SimilarTrianglesProperty, CongruentTrianglesProperty):
-            for key0, key1 in zip(prop.triangle0.permutations, prop.triangle1.permutations):
-                triples = self.__similar_triangles.get(key0)
-                if triples:
-                    triples.add(key1)
-                else:
-                    self.__similar_triangles[key0] = {key1}
-                triples = self.__similar_triangles.get(key1)
-                if triples:
-                    triples.add(key0)
-                else:
-                    self.__similar_triangles[key1] = {key0}
+            self.__similar_triangles.add(frozenset(zip(prop.triangle0.points, prop.triangle1.points)))
+
+    def __add_zero_angle(self, prop):
+        self.__zero_angles.append(prop)
+        vertex = prop.angle.vertex
+        lst = self.__zero_angles_by_vertex.get(vertex)
+        if lst:
+            lst.append(prop)
+        else:
+            self.__zero_angles_by_vertex[vertex] = [prop]
+        if vertex is None:
+            return
+        lst = self.__zero_angles_by_point_set.get(prop.angle.point_set)
+        if lst:
+            lst.append(prop)
+        else:
+            self.__zero_angles_by_point_set[prop.angle.point_set] = [prop]
+        self.__add_ray_property(prop)
+
+    def __add_ray_property(self, prop):
+        self.__rays.add(prop)
+        # the triangles with a side on the extended rays might get new angle values
+        vertex = prop.angle.vertex
+        for end in prop.angle.endpoints:
+            for pt in self.__rays.same_ray_points(vertex, end):
+                self.__triangles.touch_side(vertex, pt)
 
     def equal_length_ratios_with_common_denominator(self):
         pairs = []
@@ -1287,17 +2021,38 @@ class PropertySet(LineSet):
         return pairs
 
     def list(self, property_type, keys=None):
+        if keys and property_type == PerpendicularSegmentsProperty and self.line_level_perpendiculars:
+            collection = {}
+            for key in keys:
+                for prop in self.__combined.get((property_type, key), []):
+                    collection[prop] = prop
+                for prop in self.perpendicular_lines_properties(key):
+                    if prop not in collection:
+                        collection[prop] = prop
+            return list(collection)
         if keys:
             assert isinstance(keys, list)
             if len(keys) == 1:
                 lst = self.__combined.get((property_type, keys[0]))
                 return list(lst) if lst else []
             sublists = [self.__combined.get((property_type, k)) for k in keys]
-            return list(set(itertools.chain(*[l for l in sublists if l])))
+            return list(dict.fromkeys(itertools.chain(*[l for l in sublists if l])))
         else:
             lst = self.__combined.get(property_type)
             return list(lst) if lst else []
 
+    def count(self, property_type, key=None):
+        lst = self.__combined.get(property_type if key is None else (property_type, key))
+        return len(lst) if lst else 0
+
+    def iterate(self, property_type, key=None, since=0):
+        # Iterates over the stored list without copying it.
+        # The properties added after the call are not included,
+        # so the context can be extended while the iterator is consumed.
+        # Use count() as the cursor for the next `since` value.
+        lst = self.__combined.get(property_type if key is None else (property_type, key))
+        return itertools.islice(lst, since, len(lst)) if lst else iter(())
+
     def __len__(self):
         return len(self.__full_set)
 
@@ -1341,6 +2096,8 @@ class PropertySet(LineSet):
                 existing = self.lines_coincidence_property(*prop.segments)
             elif isinstance(prop, SumOfTwoAnglesProperty):
                 existing = self.sum_of_two_angles_property(*prop.angles)
+            elif isinstance(prop, PerpendicularSegmentsProperty) and self.line_level_perpendiculars:
+                existing = self.perpendicular_lines_property(*prop.segments)
         #TODO: LengthRatioProperty
         #TODO: EqualLengthRatiosProperty
         if existing and not existing.compare_values(prop):
@@ -1352,10 +2109,56 @@ class PropertySet(LineSet):
         return prop if prop and not prop.coincident else None
 
     def angle_value(self, angle):
-        return self.__angle_ratios.value(angle)
+        value = self.__angle_ratios.value(angle)
+        if value is None and angle.vertex is not None:
+            prop = self.__same_rays_angle_value_property(angle)
+            if prop:
+                value = prop.degree
+        return value
 
     def angle_value_property(self, angle):
-        return self.__angle_ratios.value_property(angle)
+        prop = self.__angle_ratios.value_property(angle)
+        if prop or angle.vertex is None:
+            return prop
+        return self.__same_rays_angle_value_property(angle)
+
+    def __same_rays_angle_value_property(self, angle):
+        count = self.__rays.count(angle.vertex)
+        if count == 0:
+            return None
+        # the result changes only with new rays or new angle values
+        stamp = (count, self.__angle_ratios.value_count())
+        cached = self.__same_rays_cache.get(angle)
+        if cached and cached[0] == stamp:
+            return _memoized_synthetic_property(cached[1]) if cached[1] else None
+        prop = self.__same_rays_candidate(angle)
+        self.__same_rays_cache[angle] = (stamp, prop)
+        return prop
+
+    def __same_rays_candidate(self, angle):
+        pt0, pt1 = angle.endpoints
+        ray0 = self.same_ray_points(angle.vertex, pt0)
+        ray1 = self.same_ray_points(angle.vertex, pt1)
+        if len(ray0) == 1 and len(ray1) == 1:
+            return None
+
+        candidates = []
+        for end0, end1 in itertools.product(ray0, ray1):
+            if end0 == end1 or (end0, end1) in ((pt0, pt1), (pt1, pt0)):
+                continue
+            same = angle.vertex.angle(end0, end1)
+            known = self.__angle_ratios.value_property(same)
+            if known is None:
+                continue
+            candidates.append(_synthetic_property(
+                AngleValueProperty(angle, known.degree),
+                Comment(
+                    '$%{angle:angle}$ is the same as $%{angle:same}$, and $%{anglemeasure:same} = %{degree:degree}$',
+                    {'angle': angle, 'same': same, 'degree': known.degree}
+                ),
+                [known] + self.__same_ray_premises(angle.vertex, pt0, end0) + self.__same_ray_premises(angle.vertex, pt1, end1)
+            ))
+        return LineSet.best_candidate(candidates)
 
     def angle_kind_property(self, angle):
         return self.__angle_kinds.get(angle)
@@ -1365,22 +2168,79 @@ class PropertySet(LineSet):
 
     def angles_for_degree(self, degree):
         if degree == 0:
-            return [p.angle for p in self.list(AngleValueProperty) if p.degree == 0]
+            return [p.angle for p in self.__zero_angles]
         return self.__angle_ratios.angles_for_degree(degree)
 
     def angle_value_properties_for_degree(self, degree, condition=None):
         if degree == 0:
             if condition:
-                return [p for p in self.list(AngleValueProperty) if p.degree == 0 and condition(p.angle)]
+                return [p for p in self.__zero_angles if condition(p.angle)]
             else:
-                return [p for p in self.list(AngleValueProperty) if p.degree == 0]
+                return list(self.__zero_angles)
         return self.__angle_ratios.value_properties_for_degree(degree, condition)
 
+    def zero_angle_value_properties(self, vertex):
+        lst = self.__zero_angles_by_vertex.get(vertex)
+        return list(lst) if lst else []
+
+    def zero_angle_value_properties_by_vertex(self):
+        return [list(lst) for vertex, lst in self.__zero_angles_by_vertex.items() if vertex]
+
+    def zero_angle_value_properties_by_point_set(self):
+        return [list(lst) for lst in self.__zero_angles_by_point_set.values()]
+
+    def __update_angle_value_indexes(self):
+        values, self.__angle_values_cursor = self.__angle_ratios.angle_values_since(self.__angle_values_cursor)
+        for angle, degree in values:
+            if angle.vertex is None:
+                continue
+            if degree == 180:
+                segment = angle.endpoints[0].segment(angle.endpoints[1])
+                lst = self.__inside_segment.get(segment)
+                if lst:
+                    lst.append(angle.vertex)
+                else:
+                    self.__inside_segment[segment] = [angle.vertex]
+            elif degree != 0:
+                self.__triangles.add_angle(angle)
+                # the angles with the same rays get values too, see angle_value_property()
+                for pt in angle.endpoints:
+                    for other in self.same_ray_points(angle.vertex, pt):
+                        if other != pt:
+                            self.__triangles.touch_side(angle.vertex, other)
+
+    def triangle_changes(self, since):
+        # Returns (summaries, cursor); the summaries are the triangles whose angle values
+        # could have changed after the `since` cursor was returned.
+        self.__update_angle_value_indexes()
+        return self.__triangles.changes_since(since)
+
     def points_inside_segment(self, segment):
-        return [pt for pt in self.collinear_points(segment) if self.__angle_ratios.value(pt.angle(*segment.points)) == 180]
+        self.__update_angle_value_indexes()
+        candidates = self.__inside_segment.get(segment)
+        if not candidates:
+            return []
+        return [pt for pt in candidates if self.is_collinear_point(segment, pt)]
+
+    def point_inside_segment_property(self, point, segment):
+        prop = self.angle_value_property(point.angle(*segment.points))
+        return prop if prop and prop.degree == 180 else None
+
+    def same_ray_points(self, vertex, point):
+        return self.__rays.same_ray_points(vertex, point)
+
+    def same_ray_property(self, vertex, point0, point1):
+        if point0 == point1 or not self.__rays.same_ray(vertex, point0, point1):
+            return None
+        return self.__rays.ray_property(vertex, point0, point1)
+
+    def __same_ray_premises(self, vertex, point0, point1):
+        if point0 == point1:
+            return []
+        return self.__rays.premises(vertex, point0, point1)
 
     def angle_value_properties(self):
-        return [p for p in self.list(AngleValueProperty) if p.degree == 0] + self.nondegenerate_angle_value_properties()
+        return self.__zero_angles + self.nondegenerate_angle_value_properties()
 
     def angle_ratio_property(self, angle0, angle1):
         return self.__angle_ratios.ratio_property(angle0, angle1)
@@ -1391,6 +2251,9 @@ class PropertySet(LineSet):
     def congruent_angles_with_vertex(self):
         return self.__angle_ratios.congruent_angles_with_vertex()
 
+    def triangles_with_two_congruent_angles(self):
+        return self.__angle_ratios.triangles_with_two_congruent_angles()
+
     def congruent_angles_for(self, angle):
         return self.__angle_ratios.congruent_angles_for(angle)
 
@@ -1440,11 +2303,16 @@ class PropertySet(LineSet):
         return prop if value == 1 else None
 
     def triangles_are_similar(self, points0, points1):
-        triples = self.__similar_triangles.get(points0)
-        return triples and points1 in triples
+        # the correspondence set does not depend on the order of vertices,
+        # the reversed one covers the facts stated in the opposite direction
+        return frozenset(zip(points0, points1)) in self.__similar_triangles or \
+            frozenset(zip(points1, points0)) in self.__similar_triangles
 
     def two_points_relative_to_line_property(self, segment, point0, point1):
-        return self.__two_points_relative_to_line.get(SameOrOppositeSideProperty.unique_key(segment, point0, point1))
+        prop = self.__two_points_relative_to_line.get(SameOrOppositeSideProperty.unique_key(segment, point0, point1))
+        if prop:
+            return prop
+        return self.__relative_positions.relative_position_property(segment, point0, point1)
 
     def length_ratios_are_equal(self, segment0, segment1, segment2, segment3):
         return self.__length_ratios.contains((segment0, segment1), (segment2, segment3))
@@ -1463,10 +2331,19 @@ class PropertySet(LineSet):
         existing = self.__full_set.get(prop)
         if existing:
             return existing
-        comment, premises = self.__cyclic_orders.explanation(cycle0, cycle1)
-        if comment:
-            return _synthetic_property(prop, comment, premises)
-        return None
+        return self.__cyclic_orders.same_order_property(cycle0, cycle1)
+
+    def parallel_segments_property(self, segment0, segment1):
+        prop = self.__full_set.get(ParallelSegmentsProperty(segment0, segment1))
+        return prop if prop else self.direction_property(segment0, segment1, True)
+
+    def perpendicular_segments_property(self, segment0, segment1):
+        prop = self.__full_set.get(PerpendicularSegmentsProperty(segment0, segment1))
+        if prop is None:
+            prop = self.direction_property(segment0, segment1, False)
+        if prop is None and self.line_level_perpendiculars:
+            prop = self.perpendicular_lines_property(segment0, segment1)
+        return prop
 
     def foot_of_perpendicular(self, point, segment):
         #TODO: cache not-None values (?)
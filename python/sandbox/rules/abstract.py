@@ -1,3 +1,5 @@
+import itertools
+
 class AbstractRule:
     @classmethod
     def priority(clazz):
@@ -26,6 +28,8 @@ class PredefinedPropertyRule(AbstractRule):
         return 0.5
 
 class Rule(AbstractRule):
+    generation_sensitive = False
+
     def __init__(self, context):
         self.context = context
 
@@ -49,7 +53,104 @@ class source_type:
         return type(
             clazz.__name__,
             (clazz,),
-            {'sources': lambda inst: inst.context.list(self.property_type)}
+            {'sources': lambda inst: inst.context.iterate(self.property_type)}
+        )
+
+class incremental_source_type(source_type):
+    # Declarative form for a rule with a single source type, replaces
+    # @source_type + @processed_cache(set()) + @accepts_auto.
+    # A source stays in the rule's memory until the rule adds it to
+    # self.processed, and is offered again in the next generation;
+    # the processed sources are never re-enumerated.
+    def __call__(self, clazz):
+        assert not hasattr(clazz, 'sources'), 'Cannot use @%s on class with sources() method' % type(self).__name__
+        property_type = self.property_type
+
+        def __init__(inst, context):
+            clazz.__init__(inst, context)
+            inst.processed = set()
+            inst.pending = []
+            inst.cursor = 0
+
+        def sources(inst):
+            start, inst.cursor = inst.cursor, inst.context.count(property_type)
+            inst.pending = [src for src in inst.pending if src not in inst.processed] + \
+                list(inst.context.iterate(property_type, since=start))
+            return inst.pending
+
+        return type(
+            clazz.__name__,
+            (clazz,),
+            {'__init__': __init__, 'sources': sources}
+        )
+
+class join_sources:
+    # Declarative form for a rule with two source properties that share a key,
+    # replaces hand-written sources() + @processed_cache(set()).
+    # key(prop) lists the join keys of a property, guard(prop0, prop1) rejects
+    # the pairs that never match. A new property is put into the alpha memory
+    # of its type (key => properties) and joined with the memory of the other type
+    # (the same memory for a self-join), so every pair is built once, when its
+    # later member comes. The pairs stay in the beta memory and are offered again
+    # in the next generations until the rule adds frozenset(pair) to self.processed.
+    def __init__(self, property_type0, property_type1=None, key=None, guard=None):
+        from ..property import Property
+        types = (property_type0, ) if property_type1 in (None, property_type0) else (property_type0, property_type1)
+        assert all(issubclass(t, Property) for t in types), 'Source type must be subclass of Property'
+        assert key is not None, 'Join key is not specified'
+        self.property_types = types
+        self.key = key
+        self.guard = guard
+
+    def __call__(self, clazz):
+        assert not hasattr(clazz, 'sources'), 'Cannot use @%s on class with sources() method' % type(self).__name__
+        types, key, guard = self.property_types, self.key, self.guard
+
+        def __init__(inst, context):
+            clazz.__init__(inst, context)
+            inst.processed = set()
+            inst.pending = []
+            inst.cursors = [0] * len(types)
+            inst.memories = [{} for _ in types]
+
+        def join(inst):
+            # the ranges are fixed before the join, the rule extends the context
+            # while the pairs are consumed
+            ranges = []
+            for index, property_type in enumerate(types):
+                start, inst.cursors[index] = inst.cursors[index], inst.context.count(property_type)
+                ranges.append((start, inst.cursors[index]))
+            pairs = []
+            for index, (property_type, (start, end)) in enumerate(zip(types, ranges)):
+                own = inst.memories[index]
+                other = inst.memories[-1 - index]
+                for prop in itertools.islice(inst.context.iterate(property_type, since=start), end - start):
+                    keys = key(prop)
+                    matched = set()
+                    for k in keys:
+                        for known in other.get(k, ()):
+                            if known in matched:
+                                continue
+                            matched.add(known)
+                            pair = (prop, known) if index == 0 and len(types) == 2 else (known, prop)
+                            if guard is None or guard(*pair):
+                                pairs.append(pair)
+                    for k in keys:
+                        lst = own.get(k)
+                        if lst:
+                            lst.append(prop)
+                        else:
+                            own[k] = [prop]
+            return pairs
+
+        def sources(inst):
+            inst.pending = [pair for pair in inst.pending if frozenset(pair) not in inst.processed] + join(inst)
+            return inst.pending
+
+        return type(
+            clazz.__name__,
+            (clazz,),
+            {'__init__': __init__, 'sources': sources}
         )
 
 class source_types:
@@ -59,10 +160,7 @@ class source_types:
         self.property_types = property_types
 
     def sources(self, inst):
-        full = []
-        for t in self.property_types:
-            full += inst.context.list(t)
-        return full
+        return itertools.chain(*[inst.context.iterate(t) for t in self.property_types])
 
     def __call__(self, clazz):
         assert not hasattr(clazz, 'sources'), 'Cannot use @%s on class with sources() method' % type(self).__name__
@@ -83,6 +181,16 @@ class processed_cache:
             {'processed': self.cache_object}
         )
 
+def generation_sensitive(clazz):
+    # The rule skips the source combinations with obsolete reasons,
+    # so it must be called in every generation; such rules are never deferred
+    # by the adaptive scheduler
+    return type(
+        clazz.__name__,
+        (clazz,),
+        {'generation_sensitive': True}
+    )
+
 def accepts_auto(clazz):
     #assert not hasattr(clazz, 'accepts'), 'Cannot use @accepts_auto on class with accepts()'
     return type(
@@ -4,7 +4,7 @@ from .. import Scene
 from ..property import AngleValueProperty, IsoscelesTriangleProperty, LengthRatioProperty, ProportionalLengthsProperty, PerpendicularSegmentsProperty, PointsCollinearityProperty
 from ..util import Comment
 
-from .abstract import Rule, accepts_auto, processed_cache, source_type
+from .abstract import Rule, incremental_source_type, processed_cache, source_type
 
 @source_type(PerpendicularSegmentsProperty)
 class RightAngledTriangleMedianRule(Rule):
@@ -40,8 +40,14 @@ class Triangle30_60_90SidesRule(Rule):
     """
     Sides ratios in a right-angled triangle with angles 60º and 30º
     """
+    def __init__(self, context):
+        super().__init__(context)
+        self.cursor = 0
+
     def sources(self):
-        return self.context.angle_value_properties_for_degree(90, lambda a: a.vertex)
+        triangles, self.cursor = self.context.triangle_changes(self.cursor)
+        props = [self.context.angle_value_property(angle) for tr in triangles for angle in tr.angles]
+        return [p for p in props if p.degree == 90]
 
     def apply(self, prop):
         mask = self.processed.get(prop, 0)
@@ -99,9 +105,7 @@ class Triangle30_60_90SidesRule(Rule):
         if mask != original:
             self.processed[prop] = mask
 
-@source_type(IsoscelesTriangleProperty)
-@processed_cache(set())
-@accepts_auto
+@incremental_source_type(IsoscelesTriangleProperty)
 class Triangle30_30_120SidesRule(Rule):
     """
     Sides ratios in an isosceles triangle with base angles 30º
@@ -123,9 +127,7 @@ class Triangle30_30_120SidesRule(Rule):
                 [prop, value]
             )
 
-@source_type(IsoscelesTriangleProperty)
-@processed_cache(set())
-@accepts_auto
+@incremental_source_type(IsoscelesTriangleProperty)
 class Triangle72_72_36SidesRule(Rule):
     """
     Sides ratios in an isosceles triangle with base angles 72º
@@ -147,9 +149,7 @@ class Triangle72_72_36SidesRule(Rule):
                 [prop, value]
             )
 
-@source_type(IsoscelesTriangleProperty)
-@processed_cache(set())
-@accepts_auto
+@incremental_source_type(IsoscelesTriangleProperty)
 class Triangle36_36_108SidesRule(Rule):
     """
     Sides ratios in an isosceles triangle with base angles 36º
@@ -4,7 +4,7 @@ from ..property import *
 from ..scene import Scene
 from ..util import LazyComment, Comment, divide, common_endpoint, other_point
 
-from .abstract import Rule, accepts_auto, processed_cache, source_type
+from .abstract import Rule, generation_sensitive, incremental_source_type, join_sources, processed_cache, source_type
 
 @source_type(PointInsideAngleProperty)
 @processed_cache(set())
@@ -58,9 +58,7 @@ class AngleTypeAndPerpendicularRule(Rule):
             for p in new_props:
                 yield (p, comment, [prop] + premises)
 
-@source_type(PointInsideAngleProperty)
-@processed_cache(set())
-@accepts_auto
+@incremental_source_type(PointInsideAngleProperty)
 class PointInsideAngleConfigurationRule(Rule):
     def apply(self, prop):
         self.processed.add(prop)
@@ -101,9 +99,7 @@ class PointInsideAngleConfigurationRule(Rule):
             [prop]
         )
 
-@source_type(PointInsideAngleProperty)
-@processed_cache(set())
-@accepts_auto
+@incremental_source_type(PointInsideAngleProperty)
 class SegmentWithEndpointsOnAngleSidesRule(Rule):
     def apply(self, prop):
         A = prop.angle.vertex
@@ -206,8 +202,30 @@ class LengthRatioTransitivityRule(Rule):
         |seg1| = B |seg2|
     we conclude that |seg0| = A B |seg2|
     """
+    def __init__(self, context):
+        super().__init__(context)
+        self.known = set()
+        self.segment_to_props = {} # segment => [props seen in the previous calls]
+
     def sources(self):
-        return itertools.combinations(self.context.length_ratio_properties(allow_zeroes=True), 2)
+        # only the pairs with a common segment and at least one new property
+        current = {prop: prop for prop in self.context.length_ratio_properties(allow_zeroes=True)}
+        for prop in current:
+            if prop in self.known:
+                continue
+            self.known.add(prop)
+            segments = (prop.segment0, prop.segment1)
+            for seg in segments:
+                for known in self.segment_to_props.get(seg, []):
+                    known = current.get(known)
+                    if known:
+                        yield (known, prop)
+            for seg in segments:
+                lst = self.segment_to_props.get(seg)
+                if lst:
+                    lst.append(prop)
+                else:
+                    self.segment_to_props[seg] = [prop]
 
     def apply(self, src):
         key = frozenset(src)
@@ -262,12 +280,12 @@ class LengthRatioTransitivityRule(Rule):
                 [lr0, lr1]
             )
 
-@processed_cache(set())
+@join_sources(
+    PointsCoincidenceProperty,
+    key=lambda prop: prop.points,
+    guard=lambda co0, co1: co0.coincident or co1.coincident
+)
 class CoincidenceTransitivityRule(Rule):
-    def sources(self):
-        #TODO: use self.context.non_coincident_points()
-        return itertools.combinations(self.context.list(PointsCoincidenceProperty), 2)
-
     def apply(self, src):
         key = frozenset(src)
         if key in self.processed:
@@ -288,6 +306,7 @@ class CoincidenceTransitivityRule(Rule):
             [co0, co1]
         )
 
+@generation_sensitive
 @source_type(PointsCollinearityProperty)
 class TwoPointsBelongsToTwoLinesRule(Rule):
     """
@@ -342,8 +361,13 @@ class TwoPointsBelongsToTwoLinesRule(Rule):
 
 @processed_cache({})
 class AngleInTriangleWithTwoKnownAnglesRule(Rule):
+    def __init__(self, context):
+        super().__init__(context)
+        self.cursor = 0
+
     def sources(self):
-        return [p for p in self.context.angle_value_properties() if p.angle.vertex and p.degree not in (0, 180)];
+        triangles, self.cursor = self.context.triangle_changes(self.cursor)
+        return [self.context.angle_value_property(angle) for tr in triangles for angle in tr.angles]
 
     def apply(self, prop):
         mask = self.processed.get(prop, 0)
@@ -434,9 +458,8 @@ class SumOfThreeAnglesInTriangleRule(Rule):
 @processed_cache(set())
 class SumOfThreeAnglesOnLineRule(Rule):
     def sources(self):
-        avs = self.context.angle_value_properties_for_degree(0, lambda angle: angle.vertex)
-        for av0, av1 in itertools.combinations(avs, 2):
-            if av0.angle.point_set == av1.angle.point_set:
+        for avs in self.context.zero_angle_value_properties_by_point_set():
+            for av0, av1 in itertools.combinations(avs, 2):
                 yield (av0, av1)
 
     def apply(self, src):
@@ -477,6 +500,7 @@ class SumOfThreeAnglesOnLineRule2(Rule):
                 [prop]
             )
 
+@generation_sensitive
 @source_type(ProportionalLengthsProperty)
 class LengthRatioRule(Rule):
     def apply(self, prop):
@@ -523,6 +547,7 @@ class LengthRatioRule(Rule):
                 [prop, ne]
             )
 
+@generation_sensitive
 @source_type(ParallelVectorsProperty)
 class ParallelVectorsRule(Rule):
     def apply(self, para):
@@ -544,9 +569,7 @@ class ParallelVectorsRule(Rule):
                 [para, ne0, ne1]
             )
 
-@source_type(PerpendicularSegmentsProperty)
-@processed_cache(set())
-@accepts_auto
+@incremental_source_type(PerpendicularSegmentsProperty)
 class PerpendicularSegmentsRule(Rule):
     def apply(self, pv):
         seg0 = pv.segments[0]
@@ -625,33 +648,8 @@ class Degree90ToPerpendicularSegmentsRule2(Rule):
                     [prop, self.context.point_on_line_property(seg1, pt)]
                 )
 
-class CommonPerpendicularRule(Rule):
-    def sources(self):
-        return self.context.angle_value_properties_for_degree(0)
-
-    def apply(self, prop):
-        segments = (prop.angle.vectors[0].as_segment, prop.angle.vectors[1].as_segment)
-        for seg0, seg1 in (segments, reversed(segments)):
-            for perp in self.context.list(PerpendicularSegmentsProperty, [seg0]):
-                if prop.reason.obsolete and perp.reason.obsolete:
-                    continue
-                other = perp.segments[1] if seg0 == perp.segments[0] else perp.segments[0]
-                if prop.angle.vertex:
-                    pattern = '$%{line:line0}$ is the same line as $%{line:line1}$'
-                else:
-                    pattern = 'any line perpendicular to $%{line:line0}$ is also perpendicular to $%{line:line1}$'
-                comment = Comment(pattern, {'line0': seg0, 'line1': seg1})
-                yield (
-                    PerpendicularSegmentsProperty(seg1, other),
-                    comment,
-                    [perp, prop]
-                )
-
-@processed_cache(set())
+@join_sources(PerpendicularSegmentsProperty, key=lambda prop: prop.segments)
 class TwoPointsBelongsToTwoPerpendicularsRule(Rule):
-    def sources(self):
-        return itertools.combinations(self.context.list(PerpendicularSegmentsProperty), 2)
-
     def apply(self, src):
         key = frozenset(src)
         if key in self.processed:
@@ -680,47 +678,63 @@ class TwoPointsBelongsToTwoPerpendicularsRule(Rule):
         )
 
 @processed_cache(set())
-class PerpendicularTransitivityRule(Rule):
+class ParallelAndPerpendicularTransitivityRule(Rule):
+    """
+    Lines parallel or perpendicular to the same line
+    """
+    def __init__(self, context):
+        super().__init__(context)
+        self.cursor = 0
+        self.pending = {} # frozenset of two segments => (segment, segment)
+
     def sources(self):
-        return itertools.combinations(self.context.list(PerpendicularSegmentsProperty), 2)
+        # the segment pairs of the direction families that changed since the previous call
+        families, self.cursor = self.context.direction_segments(self.cursor)
+        for segments in families:
+            for pair in itertools.combinations(segments, 2):
+                key = frozenset(pair)
+                if key not in self.processed:
+                    self.pending[key] = pair
+        return list(self.pending.values())
 
     def apply(self, src):
         key = frozenset(src)
-        if key in self.processed:
-            return
-
-        perp0, perp1 = src
-        common = next((seg for seg in perp0.segments if seg in perp1.segments), None)
-        if common is None:
-            self.processed.add(key)
-            return
-        seg0 = next(seg for seg in perp0.segments if seg != common)
-        seg1 = next(seg for seg in perp1.segments if seg != common)
-        common_point = next((pt for pt in seg0.points if pt in seg1.points), None)
-        if common_point is None:
+        seg0, seg1 = src
+        if self.context.lines_coincidence(seg0, seg1):
             self.processed.add(key)
+            del self.pending[key]
             return
-        ne = self.context.not_equal_property(*common.points)
-        if ne is None:
+        prop = self.context.parallel_segments_property(seg0, seg1)
+        if prop is None:
+            prop = self.context.perpendicular_segments_property(seg0, seg1)
+        if prop is None:
+            # not linked yet, or the chain goes via a segment of unknown length
             return
         self.processed.add(key)
-        pt0 = next(pt for pt in seg0.points if pt != common_point)
-        pt1 = next(pt for pt in seg1.points if pt != common_point)
-        comment = Comment(
-            '$%{segment:seg0}$ and $%{segment:seg1}$ are perpendiculars to line $%{line:line}$',
-            {'seg0': seg0, 'seg1': seg1, 'line': common}
-        )
-        yield (
-            PerpendicularSegmentsProperty(common, pt0.segment(pt1)),
-            comment,
-            [perp0, perp1, ne]
-        )
+        del self.pending[key]
+        if prop in self.context:
+            premises = [prop]
+        else:
+            premises = prop.reason.premises
+            yield (type(prop)(seg0, seg1), prop.reason.comment, premises)
+
+        if not isinstance(prop, ParallelSegmentsProperty):
+            return
+        common = next((pt for pt in seg0.points if pt in seg1.points), None)
+        if common is None:
+            return
+        pt0 = next(pt for pt in seg0.points if pt != common)
+        pt1 = next(pt for pt in seg1.points if pt != common)
         yield (
-            PointsCollinearityProperty(common_point, pt0, pt1, True),
-            comment,
-            [perp0, perp1, ne]
+            PointsCollinearityProperty(common, pt0, pt1, True),
+            Comment(
+                '$%{line:line0}$ and $%{line:line1}$ are parallel lines with common point $%{point:common}$',
+                {'line0': seg0, 'line1': seg1, 'common': common}
+            ),
+            premises
         )
 
+@generation_sensitive
 @source_type(PerpendicularSegmentsProperty)
 class PerpendicularToEquidistantRule(Rule):
     def apply(self, prop):
@@ -747,6 +761,7 @@ class PerpendicularToEquidistantRule(Rule):
                     [prop, cs]
                 )
 
+@generation_sensitive
 class EquidistantToPerpendicularRule(Rule):
     def sources(self):
         return itertools.combinations([p for p in self.context.length_ratio_properties(allow_zeroes=True) if p.value == 1], 2)
@@ -930,7 +945,7 @@ class SameSidePointInsideSegmentRule(Rule):
             if key in self.processed:
                 continue
             self.processed.add(key)
-            inside_prop = self.context.angle_value_property(inside.angle(*prop.points))
+            inside_prop = self.context.point_inside_segment_property(inside, segment)
             for endpoint in prop.points:
                 yield (
                     SameOrOppositeSideProperty(prop.segment, endpoint, inside, True),
@@ -959,7 +974,7 @@ class PointInsideSegmentRelativeToLineRule(Rule):
                     pattern = '$%{point:pt_not_on}$ and $%{point:pt2}$ are on the same side of $%{line:line}$ and $%{point:inside}$ lies inside $%{segment:segment}$'
                 else:
                     pattern = '$%{point:pt_not_on}$ and $%{point:pt2}$ are on opposide sides of $%{line:line}$ and $%{point:inside}$ lies inside $%{segment:segment}$'
-                inside_prop = self.context.angle_value_property(inside.angle(*segment.points))
+                inside_prop = self.context.point_inside_segment_property(inside, segment)
                 yield (
                     SameOrOppositeSideProperty(prop.segment, inside, pt2, prop.same),
                     Comment(pattern, {
@@ -972,6 +987,7 @@ class PointInsideSegmentRelativeToLineRule(Rule):
                     [prop, inside_prop]
                 )
 
+@generation_sensitive
 @source_type(SameOrOppositeSideProperty)
 class TwoPerpendicularsRule(Rule):
     """
@@ -995,39 +1011,6 @@ class TwoPerpendicularsRule(Rule):
             premises
         )
 
-@processed_cache(set())
-class TwoPerpendicularsRule2(Rule):
-    """
-    Two perpendiculars to the same line are parallel
-    """
-    def sources(self):
-        return itertools.combinations(self.context.list(PerpendicularSegmentsProperty), 2)
-
-    def apply(self, src):
-        key = frozenset(src)
-        if key in self.processed:
-            return
-
-        perp0, perp1 = src
-        common = next((seg for seg in perp0.segments if seg in perp1.segments), None)
-        if common is None:
-            self.processed.add(key)
-            return
-        ne = self.context.not_equal_property(*common.points)
-        if ne is None:
-            return
-        self.processed.add(key)
-        other0 = next(seg for seg in perp0.segments if seg != common)
-        other1 = next(seg for seg in perp1.segments if seg != common)
-        yield (
-            ParallelSegmentsProperty(other0, other1),
-            Comment(
-                '$%{segment:seg0} \\perp %{segment:seg1} \\perp %{segment:seg2}$',
-                {'seg0': other0, 'seg1': common, 'seg2': other1}
-            ),
-            [perp0, perp1, ne]
-        )
-
 @source_type(ParallelSegmentsProperty)
 @processed_cache({})
 class ParallelSameSideRule(Rule):
@@ -1134,6 +1117,7 @@ class PointInsidePartOfAngleRule(Rule):
                     [prop1, prop]
                 )
 
+@generation_sensitive
 @source_type(PointInsideAngleProperty)
 class PartOfAcuteAngleIsAcuteRule(Rule):
     def apply(self, prop):
@@ -1154,6 +1138,7 @@ class PartOfAcuteAngleIsAcuteRule(Rule):
                 [prop, kind]
             )
 
+@generation_sensitive
 class AngleTypeByDegreeRule(Rule):
     def sources(self):
         return self.context.nondegenerate_angle_value_properties()
@@ -1183,6 +1168,7 @@ class AngleTypeByDegreeRule(Rule):
                 prop.reason.premises
             )
 
+@generation_sensitive
 class PointsCollinearityByAngleDegreeRule(Rule):
     def sources(self):
         return self.context.angle_value_properties()
@@ -1199,15 +1185,19 @@ class PointsCollinearityByAngleDegreeRule(Rule):
             [prop]
         )
 
-@source_type(AngleKindProperty)
-@processed_cache(set())
 class RightAngleDegreeRule(Rule):
+    def __init__(self, context):
+        super().__init__(context)
+        self.cursor = 0
+
+    def sources(self):
+        start, self.cursor = self.cursor, self.context.count(AngleKindProperty)
+        return self.context.iterate(AngleKindProperty, since=start)
+
     def accepts(self, prop):
-        return prop.kind == AngleKindProperty.Kind.right and prop not in self.processed
+        return prop.kind == AngleKindProperty.Kind.right
 
     def apply(self, prop):
-        self.processed.add(prop)
-
         yield (
             AngleValueProperty(prop.angle, 90),
             prop.reason.comment,
@@ -1236,6 +1226,7 @@ class AngleTypesInObtuseangledTriangleRule(Rule):
                 [prop]
             )
 
+@generation_sensitive
 class VerticalAnglesRule(Rule):
     def sources(self):
         return itertools.combinations(self.context.angle_value_properties_for_degree(180, lambda a: a.vertex), 2)
@@ -1368,6 +1359,7 @@ class CorrespondingAndAlternateAnglesRule(Rule):
         if mask != original:
             self.processed[prop] = mask
 
+@generation_sensitive
 class SupplementaryAnglesRule(Rule):
     def sources(self):
         return self.context.angle_value_properties_for_degree(180, lambda a: a.vertex)
@@ -1390,6 +1382,7 @@ class SupplementaryAnglesRule(Rule):
                 [prop, ne]
             )
 
+@generation_sensitive
 class TransversalRule(Rule):
     def sources(self):
         return self.context.angle_value_properties_for_degree(0) + self.context.angle_value_properties_for_degree(180)
@@ -1569,7 +1562,7 @@ class TwoPointsOnRayRule(Rule):
 @processed_cache(set())
 class SameAngleRule(Rule):
     def sources(self):
-        return itertools.combinations([av for av in self.context.list(AngleValueProperty) if av.angle.vertex and av.degree == 0], 2)
+        return itertools.chain(*[itertools.combinations(avs, 2) for avs in self.context.zero_angle_value_properties_by_vertex()])
 
     def apply(self, src):
         if src in self.processed:
@@ -1579,8 +1572,6 @@ class SameAngleRule(Rule):
         av0, av1 = src
         ng0 = av0.angle
         ng1 = av1.angle
-        if ng0.vertex != ng1.vertex:
-            return
         if len(ng0.point_set.union(ng1.point_set)) != 5:
             return
 
@@ -1662,7 +1653,7 @@ class SameAngleDegreeRule(Rule):
                     continue
                 self.processed.add(key)
 
-                inside_prop = self.context.angle_value_property(inside.angle(*vec0.points))
+                inside_prop = self.context.point_inside_segment_property(inside, vec0.as_segment)
                 yield (
                     AngleValueProperty(vec1.angle(vec0.start.vector(pt)), prop.degree),
                     Comment(
@@ -1672,6 +1663,7 @@ class SameAngleDegreeRule(Rule):
                     [prop, inside_prop]
                 )
 
+@generation_sensitive
 @source_type(SameOrOppositeSideProperty)
 class PlanePositionsToLinePositionsRule(Rule):
     def apply(self, prop):
@@ -1694,6 +1686,7 @@ class PlanePositionsToLinePositionsRule(Rule):
             [prop] + reasons
         )
 
+@generation_sensitive
 class CeviansIntersectionRule(Rule):
     def sources(self):
         return itertools.combinations(self.context.angle_value_properties_for_degree(180, lambda a: a.vertex), 2)
@@ -1746,6 +1739,7 @@ class CeviansIntersectionRule(Rule):
             [ncl, av0, av1] + reasons
         )
 
+@generation_sensitive
 @source_type(PointInsideAngleProperty)
 class TwoAnglesWithCommonSideRule(Rule):
     def apply(self, prop):
@@ -1864,14 +1858,8 @@ class SameSideToInsideAngleRule(Rule):
         if mask != original:
             self.processed[prop] = mask
 
-@processed_cache(set())
+@join_sources(SameOrOppositeSideProperty, key=lambda prop: [(prop.segment, pt) for pt in prop.points])
 class TwoPointsRelativeToLineTransitivityRule(Rule):
-    def sources(self):
-        for p0 in self.context.list(SameOrOppositeSideProperty):
-            for p1 in self.context.list(SameOrOppositeSideProperty, [p0.segment]):
-                if p0 != p1:
-                    yield (p0, p1)
-
     def apply(self, src):
         key = frozenset(src)
         if key in self.processed:
@@ -2044,7 +2032,7 @@ class PerpendicularToSideOfObtuseAngledRule(Rule):
                 key = (prop.angle, inside)
                 if key in self.processed:
                     continue
-                inside_prop = self.context.angle_value_property(inside.angle(*seg.points))
+                inside_prop = self.context.point_inside_segment_property(inside, seg)
                 for pt in self.context.collinear_points(long_side):
                     perp_line = pt.segment(inside)
                     perp = self.context[PerpendicularSegmentsProperty(seg, perp_line)]
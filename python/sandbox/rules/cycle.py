@@ -1,11 +1,9 @@
 from ..property import *
 from ..util import Comment
 
-from .abstract import Rule, accepts_auto, processed_cache, source_type
+from .abstract import Rule, incremental_source_type, processed_cache
 
-@source_type(SameOrOppositeSideProperty)
-@processed_cache(set())
-@accepts_auto
+@incremental_source_type(SameOrOppositeSideProperty)
 class CyclicOrderRule(Rule):
     def apply(self, prop):
         self.processed.add(prop)
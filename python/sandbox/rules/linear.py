@@ -3,11 +3,9 @@ import itertools
 from ..property import *
 from ..util import Comment, divide
 
-from .abstract import Rule, accepts_auto, processed_cache, source_type
+from .abstract import Rule, incremental_source_type, processed_cache, source_type
 
-@source_type(SumOfTwoAnglesProperty)
-@processed_cache(set())
-@accepts_auto
+@incremental_source_type(SumOfTwoAnglesProperty)
 class AngleFromSumOfTwoAnglesRule(Rule):
     def apply(self, prop):
         for a0, a1 in (prop.angles, reversed(prop.angles)):
@@ -98,9 +96,7 @@ class AngleBySumOfThreeRule(Rule):
         if mask != original:
             self.processed[prop] = mask
 
-@source_type(SumOfTwoAnglesProperty)
-@processed_cache(set())
-@accepts_auto
+@incremental_source_type(SumOfTwoAnglesProperty)
 class SumAndRatioOfTwoAnglesRule(Rule):
     """
     If the sum and the ratio of two angles are known, we can find the values
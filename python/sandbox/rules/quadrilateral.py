@@ -4,7 +4,7 @@ import sympy as sp
 from ..property import *
 from ..util import Comment
 
-from .abstract import Rule, accepts_auto, processed_cache, source_type
+from .abstract import Rule, incremental_source_type, processed_cache, source_type
 
 @processed_cache(set())
 class ConvexQuadrilateralRule(Rule):
@@ -122,9 +122,7 @@ class SquareDegeneracyRule(Rule):
         if mask != original:
             self.processed[prop] = mask
 
-@source_type(NondegenerateSquareProperty)
-@processed_cache(set())
-@accepts_auto
+@incremental_source_type(NondegenerateSquareProperty)
 class NondegenerateSquareRule(Rule):
     def apply(self, prop):
         self.processed.add(prop)
@@ -4,7 +4,7 @@ import sympy as sp
 from ..property import *
 from ..util import Comment
 
-from .abstract import Rule, accepts_auto, processed_cache, source_type
+from .abstract import Rule, incremental_source_type, processed_cache, source_type
 
 @source_type(SimilarTrianglesProperty)
 @processed_cache({})
@@ -90,9 +90,7 @@ class CorrespondingAnglesInSimilarTrianglesRule(Rule):
         if original != mask:
             self.processed[prop] = mask
 
-@source_type(IsoscelesTriangleProperty)
-@processed_cache(set())
-@accepts_auto
+@incremental_source_type(IsoscelesTriangleProperty)
 class BaseAnglesOfIsoscelesRule(Rule):
     def apply(self, prop):
         neq = self.context.coincidence_property(*prop.base.points)
@@ -111,9 +109,7 @@ class BaseAnglesOfIsoscelesRule(Rule):
             [prop, neq]
         )
 
-@source_type(IsoscelesTriangleProperty)
-@processed_cache(set())
-@accepts_auto
+@incremental_source_type(IsoscelesTriangleProperty)
 class BaseAnglesOfIsoscelesWithKnownApexAngleRule(Rule):
     def apply(self, prop):
         av = self.context.angle_value_property(prop.apex.angle(*prop.base.points))
@@ -136,9 +132,7 @@ class BaseAnglesOfIsoscelesWithKnownApexAngleRule(Rule):
                 [prop, av]
             )
 
-@source_type(IsoscelesTriangleProperty)
-@processed_cache(set())
-@accepts_auto
+@incremental_source_type(IsoscelesTriangleProperty)
 class LegsOfIsoscelesRule(Rule):
     def apply(self, prop):
         self.processed.add(prop)
@@ -188,9 +182,7 @@ class CorrespondingAnglesInCongruentTrianglesRule(Rule):
         if mask != original:
             self.processed[prop] = mask
 
-@source_type(CongruentTrianglesProperty)
-@processed_cache(set())
-@accepts_auto
+@incremental_source_type(CongruentTrianglesProperty)
 class CorrespondingSidesInCongruentTrianglesRule(Rule):
     def apply(self, prop):
         self.processed.add(prop)
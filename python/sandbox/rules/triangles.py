@@ -4,22 +4,11 @@ from .. import Scene
 from ..property import *
 from ..util import LazyComment, Comment, common_endpoint, other_point
 
-from .abstract import Rule, accepts_auto, processed_cache, source_type
+from .abstract import Rule, generation_sensitive, incremental_source_type, processed_cache
 
 @processed_cache(set())
 class SimilarTrianglesByTwoAnglesRule(Rule):
     def sources(self):
-        groups = {}
-        for a0, a1 in self.context.congruent_angles_with_vertex():
-            if a0.point_set == a1.point_set:
-                continue
-            key = frozenset([a0.point_set, a1.point_set])
-            lst = groups.get(key)
-            if lst:
-                lst.append((a0, a1))
-            else:
-                groups[key] = [(a0, a1)]
-
         pair_to_prop = {}
         def prop_for(pair):
             prop = pair_to_prop.get(pair)
@@ -28,15 +17,11 @@ class SimilarTrianglesByTwoAnglesRule(Rule):
                 pair_to_prop[pair] = prop
             return prop
 
-        for group in groups.values():
-            for pair0, pair1 in itertools.combinations(group, 2):
-                key = frozenset((pair0, pair1))
-                if key in self.processed:
-                    continue
-                common = next((angle for angle in pair0 if angle in pair1), None)
-                if common:
-                    continue
-                yield (prop_for(pair0), prop_for(pair1), key)
+        for pair0, pair1 in self.context.triangles_with_two_congruent_angles():
+            key = frozenset((frozenset(pair0), frozenset(pair1)))
+            if key in self.processed:
+                continue
+            yield (prop_for(pair0), prop_for(pair1), key)
 
     def apply(self, src):
         ca0, ca1, key = src
@@ -236,9 +221,7 @@ class SimilarTrianglesByAngleAndTwoSidesRule(Rule):
                     [elr, ca]
                 )
 
-@source_type(SimilarTrianglesProperty)
-@processed_cache(set())
-@accepts_auto
+@incremental_source_type(SimilarTrianglesProperty)
 class SimilarTrianglesWithCongruentSideRule(Rule):
     def apply(self, prop):
         sides0 = prop.triangle0.sides
@@ -282,6 +265,7 @@ class SimilarTrianglesWithCongruentSideRule(Rule):
             )
             return
 
+@generation_sensitive
 class CongruentTrianglesByThreeSidesRule(Rule):
     def sources(self):
         congruent_segments = [p for p in self.context.length_ratio_properties(allow_zeroes=True) if p.value == 1]
@@ -392,6 +376,7 @@ class SimilarTrianglesByThreeSidesRule(Rule):
             [ps0, ps1, ps2, ncl]
         )
 
+@generation_sensitive
 class EquilateralTriangleByThreeSidesRule(Rule):
     def sources(self):
         return [p for p in self.context.length_ratio_properties(allow_zeroes=True) if p.value == 1]
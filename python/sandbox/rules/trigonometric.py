@@ -12,8 +12,14 @@ class LawOfSinesRule(Rule):
     """
     The law of sines
     """
+    def __init__(self, context):
+        super().__init__(context)
+        self.cursor = 0
+
     def sources(self):
-        return [p for p in self.context.nondegenerate_angle_value_properties() if p.angle.vertex and p.degree not in (0, 180) and p not in self.processed]
+        triangles, self.cursor = self.context.triangle_changes(self.cursor)
+        props = [self.context.angle_value_property(angle) for tr in triangles for angle in tr.angles]
+        return [p for p in props if p not in self.processed]
 
     def apply(self, av0):
         triangle = Scene.Triangle(av0.angle.vertex, *av0.angle.endpoints)
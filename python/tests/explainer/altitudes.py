@@ -27,6 +27,10 @@ class AltitudesAndSimilarityAcuteTest(ExplainerTest):
         prop = SimilarTrianglesProperty((A, B, C), (A1, B1, C))
         self.assertIn(prop, self.explainer.context)
 
+class AltitudesAndSimilarityAcuteLineLevelPerpendicularsTest(AltitudesAndSimilarityAcuteTest):
+    def explainer_options(self):
+        return {'line_level_perpendiculars': True}
+
 class AltitudesAndSimilarityObtuseTest(ExplainerTest):
     def createScene(self):
         scene = Scene()
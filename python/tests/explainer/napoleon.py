@@ -69,3 +69,7 @@ class NapoleonInwardPlusAdvanced(NapoleonInward):
     def testEquilateral(self):
         prop = EquilateralTriangleProperty((self.scene.get('A2'), self.scene.get('B2'), self.scene.get('C2')))
         self.assertIn(prop, self.explainer.context)
+
+class NapoleonInwardPlusTrigonometryAdaptive(NapoleonInwardPlusTrigonometry):
+    def explainer_options(self):
+        return {'trigonometric': True, 'adaptive_scheduling': True}
@@ -4,6 +4,7 @@ import unittest
 from sandbox import Scene
 from sandbox.property import EqualLengthRatiosProperty, LengthRatioProperty
 from sandbox.propertyset import LengthRatioPropertySet
+from sandbox.reason import Reason
 
 class LengthRatioPropertySetTest(unittest.TestCase):
     def setUp(self):
@@ -86,3 +87,21 @@ class LengthRatioPropertySetTest(unittest.TestCase):
 
         self.assertEqual(str(comment), '|E F| / |G H| = |A B| / |C D| = 1 = |C D| / |A B| = |G H| / |E F|')
         self.assertEqual(len(premises), 4)
+
+    def test7(self):
+        def given(prop):
+            prop.reason = Reason(0, 'given', [])
+            prop.reason.obsolete = False
+            return prop
+
+        ratios = LengthRatioPropertySet()
+        ratios.add(given(EqualLengthRatiosProperty(self.AB, self.CD, self.EF, self.GH)))
+        ratios.add(given(LengthRatioProperty(self.AB, self.CD, 2)))
+        props = [p for p in ratios.value_properties() if p.segment0 == self.EF]
+        self.assertEqual(len(props), 1)
+        self.assertIs(props[0], next(p for p in ratios.value_properties() if p.segment0 == self.EF))
+
+        ratios.add(given(LengthRatioProperty(self.EF, self.GH, 2)))
+        prop = next(p for p in ratios.value_properties() if p.segment0 == self.EF)
+        self.assertIsNot(prop, props[0])
+        self.assertEqual(len(prop.reason.premises), 0)
@@ -0,0 +1,264 @@
+import unittest
+
+from sandbox import Scene
+from sandbox.property import AngleRatioProperty, AngleValueProperty, Cycle, LinesCoincidenceProperty, ParallelSegmentsProperty, ParallelVectorsProperty, \
+    PerpendicularSegmentsProperty, PointOnLineProperty, PointsCoincidenceProperty, \
+    PointsCollinearityProperty, SameCyclicOrderProperty, SameOrOppositeSideProperty
+from sandbox.propertyset import PropertySet
+from sandbox.reason import Reason
+from sandbox.rules.basic import ParallelAndPerpendicularTransitivityRule, TwoPerpendicularsRule, \
+    TwoPointsRelativeToLineTransitivityRule
+from sandbox.rules.cycle import CyclicOrderRule
+
+class PropertySetTest(unittest.TestCase):
+    def setUp(self):
+        self.scene = Scene()
+        for label in ('A', 'B', 'C', 'D', 'E'):
+            self.scene.free_point(label=label)
+        self.context = PropertySet(self.scene.points())
+
+    def point(self, label):
+        return self.scene.get(label)
+
+    def segment(self, label):
+        return self.point(label[0]).segment(self.point(label[1]))
+
+    def given(self, prop, generation=0):
+        prop.reason = Reason(generation, 'given', [])
+        prop.reason.obsolete = False
+        self.context.add(prop)
+        return prop
+
+    def test_memoized_synthetic_generation(self):
+        AB, BC, CD = self.segment('AB'), self.segment('BC'), self.segment('CD')
+        first = self.given(LinesCoincidenceProperty(AB, BC, True))
+        self.given(LinesCoincidenceProperty(BC, CD, True))
+        prop = self.context.lines_coincidence_property(AB, CD)
+        self.assertEqual(prop.reason.generation, 1)
+        self.assertEqual(prop.reason.cost, 2)
+
+        # a premise gets another reason, the memoized property follows it
+        base = self.given(LinesCoincidenceProperty(self.segment('DE'), self.segment('EA'), False), 3)
+        first.reason = Reason(4, 'other', [base])
+        first.reason.obsolete = False
+        same = self.context.lines_coincidence_property(AB, CD)
+        self.assertIs(same, prop)
+        self.assertEqual(same.reason.generation, 5)
+        self.assertEqual(same.reason.cost, 3)
+
+    def test_unknown_collinearity(self):
+        A, B, C = self.point('A'), self.point('B'), self.point('C')
+        self.assertIsNone(self.context.collinearity_property(A, B, C))
+        # the cached unknown result is dropped after a fact on C
+        self.given(PointOnLineProperty(C, self.segment('AB'), True))
+        prop = self.context.collinearity_property(A, B, C)
+        self.assertIsNotNone(prop)
+        self.assertTrue(prop.collinear)
+        self.assertIsNone(self.context.collinearity_property(A, B, self.point('D')))
+
+    def test_since_cursor(self):
+        AB, BC, CD, DE = (self.segment(s) for s in ('AB', 'BC', 'CD', 'DE'))
+        old = self.given(LinesCoincidenceProperty(AB, BC, True))
+        cursor = self.context.count(LinesCoincidenceProperty)
+        iterator = self.context.iterate(LinesCoincidenceProperty, since=cursor)
+        new = self.given(LinesCoincidenceProperty(CD, DE, False))
+        # the properties added after the iterator is created are not included
+        self.assertEqual(list(iterator), [])
+        self.assertEqual(list(self.context.iterate(LinesCoincidenceProperty, since=cursor)), [new])
+        self.assertEqual(list(self.context.iterate(LinesCoincidenceProperty)), [old, new])
+        self.assertEqual(self.context.count(LinesCoincidenceProperty), 2)
+
+    def test_derived_side_feeds_cyclic_order(self):
+        A, B, C, D, E = (self.point(label) for label in ('A', 'B', 'C', 'D', 'E'))
+        AB = self.segment('AB')
+        self.given(SameOrOppositeSideProperty(AB, C, D, True))
+        self.given(SameOrOppositeSideProperty(AB, D, E, False))
+        # the family answers the lookup, but does not block the derived fact
+        self.assertFalse(self.context.two_points_relative_to_line_property(AB, C, E).same)
+        self.assertIsNone(self.context[SameOrOppositeSideProperty(AB, C, E, False)])
+
+        derived = [prop for prop, comment, premises in TwoPointsRelativeToLineTransitivityRule(self.context).generate()]
+        self.assertEqual(derived, [SameOrOppositeSideProperty(AB, C, E, False)])
+        self.given(derived[0], 1)
+
+        orders = [prop for prop, comment, premises in CyclicOrderRule(self.context).generate() if premises == derived]
+        self.assertIn(SameCyclicOrderProperty(Cycle(A, B, C), Cycle(A, B, E).reversed), orders)
+
+    def test_perpendicular_chain(self):
+        B, C = self.point('B'), self.point('C')
+        AB, BC, CD = self.segment('AB'), self.segment('BC'), self.segment('CD')
+        self.given(PerpendicularSegmentsProperty(AB, BC))
+        self.given(PerpendicularSegmentsProperty(BC, CD))
+        # BC might be of zero length
+        self.assertIsNone(self.context.parallel_segments_property(AB, CD))
+        ne = self.given(PointsCoincidenceProperty(B, C, False))
+        prop = self.context.parallel_segments_property(AB, CD)
+        self.assertIsNotNone(prop)
+        self.assertIn(ne, prop.reason.premises)
+        self.assertIsNone(self.context.perpendicular_segments_property(AB, CD))
+        # the lookups do not answer derived facts, the rules insert them
+        self.assertIsNone(self.context[ParallelSegmentsProperty(AB, CD)])
+
+    def test_direction_chain_via_same_line(self):
+        B, C, E = self.point('B'), self.point('C'), self.point('E')
+        AB, BC, BE, DE = (self.segment(s) for s in ('AB', 'BC', 'BE', 'DE'))
+        self.given(PerpendicularSegmentsProperty(AB, BC))
+        self.given(ParallelSegmentsProperty(BE, DE))
+        self.given(PointsCoincidenceProperty(B, C, False))
+        self.given(PointsCoincidenceProperty(B, E, False))
+        self.assertIsNone(self.context.perpendicular_segments_property(AB, DE))
+        # the families are merged with the lines
+        same = self.given(LinesCoincidenceProperty(BC, BE, True))
+        prop = self.context.perpendicular_segments_property(AB, DE)
+        self.assertIsNotNone(prop)
+        self.assertIn(same, prop.reason.premises)
+        self.assertIsNone(self.context.parallel_segments_property(AB, DE))
+
+    def test_direction_rule(self):
+        A, B, C, D = (self.point(label) for label in ('A', 'B', 'C', 'D'))
+        AB, BC, BD = self.segment('AB'), self.segment('BC'), self.segment('BD')
+        self.given(PerpendicularSegmentsProperty(BC, AB))
+        self.given(PerpendicularSegmentsProperty(AB, BD))
+        rule = ParallelAndPerpendicularTransitivityRule(self.context)
+        # the pair is kept until the length of AB is known
+        self.assertEqual(list(rule.generate()), [])
+        self.given(PointsCoincidenceProperty(A, B, False))
+        derived = [prop for prop, comment, premises in rule.generate()]
+        self.assertEqual(derived, [ParallelSegmentsProperty(BC, BD), PointsCollinearityProperty(B, C, D, True)])
+        self.assertEqual(list(rule.generate()), [])
+
+    def test_same_rays_angle_value(self):
+        A, B, C, D, E = (self.point(label) for label in ('A', 'B', 'C', 'D', 'E'))
+        self.given(AngleValueProperty(A.angle(B, C), 0))
+        self.given(AngleValueProperty(A.angle(B, D), 40))
+        angle = A.angle(C, D)
+        prop = self.context.angle_value_property(angle)
+        self.assertEqual(prop.degree, 40)
+        self.assertEqual(self.context.angle_value(angle), 40)
+        self.assertIs(self.context.angle_value_property(angle), prop)
+
+        # a new ray gives a value to another angle
+        self.assertIsNone(self.context.angle_value(A.angle(C, E)))
+        self.given(AngleValueProperty(A.angle(D, E), 0))
+        self.assertEqual(self.context.angle_value(A.angle(C, E)), 40)
+
+    def test_opposite_rays(self):
+        A, B, C, D, E = (self.point(label) for label in ('A', 'B', 'C', 'D', 'E'))
+        first = self.given(AngleValueProperty(A.angle(B, C), 180))
+        second = self.given(AngleValueProperty(A.angle(C, D), 180))
+        # B and D are on the ray opposite to AC
+        self.assertEqual(self.context.same_ray_points(A, B), {B, D})
+        self.assertEqual(self.context.same_ray_points(A, C), {C})
+        prop = self.context.same_ray_property(A, B, D)
+        self.assertEqual(prop, AngleValueProperty(A.angle(B, D), 0))
+        self.assertEqual(set(prop.reason.premises), {first, second})
+        self.assertIsNone(self.context.same_ray_property(A, B, C))
+
+        self.given(AngleValueProperty(A.angle(B, E), 40))
+        self.assertEqual(self.context.angle_value(A.angle(D, E)), 40)
+
+    def test_triangles_with_two_congruent_angles(self):
+        A, B, C, D, E = (self.point(label) for label in ('A', 'B', 'C', 'D', 'E'))
+        a0, b0 = A.angle(B, C), B.angle(A, C)
+        a1, b1 = D.angle(C, E), E.angle(C, D)
+        def candidates():
+            return {
+                frozenset((frozenset(pair0), frozenset(pair1))) for pair0, pair1 in self.context.triangles_with_two_congruent_angles()
+            }
+
+        self.given(AngleRatioProperty(a0, a1, 1))
+        self.assertEqual(candidates(), set())
+        self.given(AngleRatioProperty(b1, b0, 1))
+        self.assertEqual(candidates(), {frozenset((frozenset((a0, a1)), frozenset((b0, b1))))})
+        # the families are merged, all four angles are in the same class
+        self.given(AngleRatioProperty(a0, b1, 1))
+        self.assertEqual(candidates(), {
+            frozenset((frozenset((a0, a1)), frozenset((b0, b1)))),
+            frozenset((frozenset((a0, b1)), frozenset((b0, a1))))
+        })
+
+    def test_line_level_perpendiculars(self):
+        self.context = PropertySet(self.scene.points(), line_level_perpendiculars=True)
+        A, B, D, E = (self.point(label) for label in ('A', 'B', 'D', 'E'))
+        AB, AD = self.segment('AB'), self.segment('AD')
+        given = [
+            self.given(PerpendicularSegmentsProperty(AB, self.segment('AC'))),
+            self.given(LinesCoincidenceProperty(self.segment('AC'), AD, True)),
+            self.given(PerpendicularSegmentsProperty(AB, self.segment('BE'))),
+            self.given(SameOrOppositeSideProperty(AB, D, E, True))
+        ]
+        def line_level(segment0, segment1):
+            return next(p for p in self.context.list(PerpendicularSegmentsProperty, [segment0]) if p.segments[1] == segment1)
+        perp = line_level(AB, AD)
+        # the synthetic properties are memoized per line version
+        self.assertIs(line_level(AB, AD), perp)
+        self.assertIs(self.context.perpendicular_lines_property(AB, AD), perp)
+
+        rule = TwoPerpendicularsRule(self.context)
+        reasons = list(rule.generate())
+        self.assertEqual([prop for prop, comment, premises in reasons], [ParallelVectorsProperty(A.vector(D), B.vector(E))])
+        self.assertIn(perp, reasons[0][2])
+
+        # next generation, the rule skips the sources with obsolete reasons
+        for prop in given:
+            prop.reason.obsolete = True
+        self.assertEqual(list(rule.generate()), [])
+        self.assertTrue(perp.reason.obsolete)
+
+    def test_triangle_changes(self):
+        A, B, C, D = (self.point(label) for label in ('A', 'B', 'C', 'D'))
+        self.given(AngleValueProperty(A.angle(B, C), 60))
+        changes, cursor = self.context.triangle_changes(0)
+        self.assertEqual([summary.points for summary in changes], [frozenset((A, B, C))])
+        self.given(AngleValueProperty(B.angle(D, C), 50))
+        changes, cursor = self.context.triangle_changes(cursor)
+        self.assertEqual([summary.points for summary in changes], [frozenset((B, C, D))])
+        self.assertEqual(self.context.triangle_changes(cursor), ([], cursor))
+
+        # BA and BD are the same ray, so the angle ABC is known now
+        self.assertIsNone(self.context.angle_value_property(B.angle(A, C)))
+        self.given(AngleValueProperty(B.angle(A, D), 0))
+        changes, cursor = self.context.triangle_changes(cursor)
+        self.assertEqual({summary.points for summary in changes}, {frozenset((A, B, C)), frozenset((B, C, D))})
+        self.assertEqual(self.context.angle_value_property(B.angle(A, C)).degree, 50)
+        self.assertEqual(self.context.triangle_changes(cursor), ([], cursor))
+
+    def test_points_inside_segment(self):
+        A, B, C, D = (self.point(label) for label in ('A', 'B', 'C', 'D'))
+        AC = self.segment('AC')
+        inside = self.given(AngleValueProperty(B.angle(A, C), 180))
+        # the collinearity is not known yet
+        self.assertEqual(self.context.points_inside_segment(AC), [])
+        self.given(PointOnLineProperty(B, AC, True))
+        self.assertEqual(self.context.points_inside_segment(AC), [B])
+        self.assertEqual(self.context.points_inside_segment(self.segment('CA')), [B])
+
+        self.assertIs(self.context.point_inside_segment_property(B, AC), inside)
+        self.assertIs(self.context.point_inside_segment_property(B, self.segment('CA')), inside)
+        self.given(AngleValueProperty(D.angle(A, C), 0))
+        self.assertIsNone(self.context.point_inside_segment_property(D, AC))
+
+    def test_coincidence_after_line_merge(self):
+        F = self.scene.free_point(label='F')
+        self.context = PropertySet(self.scene.points())
+        A, B, C, D, E = (self.point(label) for label in ('A', 'B', 'C', 'D', 'E'))
+        AB, CE = self.segment('AB'), self.segment('CE')
+        self.given(PointOnLineProperty(C, AB, True))
+        self.given(PointOnLineProperty(D, AB, False))
+        self.given(PointOnLineProperty(F, CE, False))
+        self.given(PointsCoincidenceProperty(D, F, False))
+        self.assertEqual(set(self.context.non_coincident_points(F)), {C, D, E})
+        self.assertEqual(set(self.context.non_coincident_points(A)), {D})
+        self.assertIsNone(self.context.coincidence_property(A, F))
+
+        self.given(LinesCoincidenceProperty(AB, CE, True))
+        self.assertEqual(set(self.context.non_coincident_points(A)), {D, F})
+        self.assertEqual(set(self.context.non_coincident_points(E)), {D, F})
+        self.assertEqual(set(self.context.non_coincident_points(F)), {A, B, C, D, E})
+        self.assertEqual(set(self.context.non_coincident_points(D)), {A, B, C, E, F})
+        # A and F are different points since A lies on CE and F does not
+        for pt0, pt1 in ((A, F), (F, A), (E, D)):
+            prop = self.context.coincidence_property(pt0, pt1)
+            self.assertIsNotNone(prop)
+            self.assertFalse(prop.coincident)
+        self.assertIsNone(self.context.coincidence_property(A, E))
@@ -0,0 +1,78 @@
+import itertools
+import unittest
+
+from sandbox import Scene
+from sandbox.property import PointsCoincidenceProperty, ProportionalLengthsProperty
+from sandbox.propertyset import PropertySet
+from sandbox.reason import Reason
+from sandbox.rules.basic import CoincidenceTransitivityRule, LengthRatioTransitivityRule
+
+class JoinTransitivityTest(unittest.TestCase):
+    # the rules join the new properties with the known ones on a common key,
+    # the results must be the same as for the enumeration of all the pairs
+    def setUp(self):
+        self.scene = Scene()
+        for label in ('A', 'B', 'C', 'D', 'E', 'F'):
+            self.scene.free_point(label=label)
+        self.context = PropertySet(self.scene.points())
+
+    def point(self, label):
+        return self.scene.get(label)
+
+    def segment(self, label):
+        return self.point(label[0]).segment(self.point(label[1]))
+
+    def given(self, prop):
+        prop.reason = Reason(0, 'given', [])
+        prop.reason.obsolete = False
+        self.context.add(prop)
+
+    @staticmethod
+    def results(reasons):
+        return sorted((str(prop), tuple(str(p) for p in premises)) for prop, comment, premises in reasons)
+
+    def check(self, rule_class, sources, stages):
+        rule = rule_class(self.context)
+        rule.processed = set()
+        joined = []
+        for stage in stages:
+            for prop in stage:
+                self.given(prop)
+            joined += list(rule.generate())
+
+        baseline = rule_class(self.context)
+        baseline.processed = set()
+        enumerated = []
+        for src in itertools.combinations(sources(), 2):
+            enumerated += list(baseline.apply(src))
+
+        self.assertTrue(enumerated)
+        self.assertEqual(self.results(joined), self.results(enumerated))
+
+    def test_length_ratio_transitivity(self):
+        def prop(seg0, seg1, value):
+            return ProportionalLengthsProperty(self.segment(seg0), self.segment(seg1), value)
+
+        self.check(
+            LengthRatioTransitivityRule,
+            lambda: self.context.length_ratio_properties(allow_zeroes=True),
+            [
+                [prop('AB', 'BC', 1), prop('CD', 'DE', 2)],
+                [prop('BC', 'CD', 3), prop('EF', 'AF', 1)],
+                [prop('DE', 'EF', 1)]
+            ]
+        )
+
+    def test_coincidence_transitivity(self):
+        def prop(pt0, pt1, coincident):
+            return PointsCoincidenceProperty(self.point(pt0), self.point(pt1), coincident)
+
+        self.check(
+            CoincidenceTransitivityRule,
+            lambda: self.context.list(PointsCoincidenceProperty),
+            [
+                [prop('A', 'B', True), prop('C', 'D', False)],
+                [prop('B', 'C', False), prop('D', 'E', True), prop('A', 'F', False)],
+                [prop('E', 'F', True)]
+            ]
+        )
@@ -0,0 +1,126 @@
+import unittest
+import numpy as np
+
+from sandbox import Scene, iterative_placement
+from sandbox import placement as placement_module
+from sandbox.placement import Placement, PlacementFailedError
+
+class TestPlacementDerivatives(unittest.TestCase):
+    def createScene(self):
+        scene = Scene()
+
+        triangle = scene.nondegenerate_triangle(labels=('A', 'B', 'C'))
+        A, B, C = triangle.points
+        A.distance_constraint('B', 5)
+        C.distance_constraint('B', 4)
+        C.distance_constraint('A', 3)
+        scene.incircle(triangle, label='incircle')
+        M = A.segment(B).middle_point(label='M')
+        D = C.line_through(M).free_point(label='D')
+        para = scene.parallel_line(A.line_through(B), D)
+        para.intersection_point(A.line_through(C), label='A1')
+
+        return scene
+
+    def createVerticalLineScene(self):
+        # the line is vertical, the intersection takes the second branch of the formula
+        scene = Scene()
+
+        A = scene.free_point(label='A', x=1, y=0)
+        B = scene.free_point(label='B', x=1, y=3)
+        O = scene.free_point(label='O')
+        circle = O.circle_through(scene.free_point(label='P'))
+        X = circle.intersection_point(A.line_through(B), label='X')
+        X.distance_constraint('A', 2)
+        X.distance_constraint('P', 1)
+
+        return scene
+
+    def test_deviation_gradient(self):
+        self.checkDeviationGradient(self.createScene())
+
+    def test_deviation_gradient_circle_x_line(self):
+        self.checkDeviationGradient(self.createVerticalLineScene())
+
+    def checkDeviationGradient(self, scene):
+        np.random.seed(0)
+        checked = 0
+        while checked < 3:
+            try:
+                placement = Placement(scene)
+            except PlacementFailedError:
+                continue
+            keys = list(placement.params.keys())
+            data = np.array([placement.params[k] for k in keys])
+            gradient = placement.deviation_gradient(keys)
+
+            def deviation(delta):
+                return Placement(scene, dict(zip(keys, data + delta)), plan=placement.plan).deviation()
+            step = 1e-6
+            for index in range(0, len(keys)):
+                delta = np.zeros(len(keys))
+                delta[index] = step
+                numeric = (deviation(delta) - deviation(-delta)) / 2 / step
+                self.assertLess(np.fabs(numeric - gradient[index]), 1e-4 * (1 + np.fabs(numeric)), keys[index])
+            checked += 1
+
+    def test_residuals_jacobian(self):
+        scene = self.createScene()
+        np.random.seed(0)
+        checked = 0
+        while checked < 3:
+            try:
+                placement = Placement(scene)
+            except PlacementFailedError:
+                continue
+            keys = placement.plan.parameters
+            data = np.array([placement.params[k] for k in keys])
+            scale = placement.residual_scale()
+            jacobian = placement.residuals_jacobian(keys, scale)
+            sparsity = placement.plan.jacobian_sparsity()
+            self.assertEqual(jacobian.shape, sparsity.shape)
+            self.assertFalse(np.any((jacobian != 0) & ~sparsity))
+
+            def residuals(delta):
+                return Placement(scene, dict(zip(keys, data + delta)), plan=placement.plan).residuals(scale)
+            step = 1e-6
+            for index in range(0, len(keys)):
+                delta = np.zeros(len(keys))
+                delta[index] = step
+                numeric = (residuals(delta) - residuals(-delta)) / 2 / step
+                self.assertLess(np.max(np.fabs(numeric - jacobian[:, index])), 1e-4 * (1 + np.max(np.fabs(numeric))), keys[index])
+            checked += 1
+
+    def test_residuals_sparse_jacobian(self):
+        scene = self.createScene()
+        np.random.seed(0)
+        checked = 0
+        while checked < 3:
+            try:
+                placement = Placement(scene)
+            except PlacementFailedError:
+                continue
+            keys = placement.plan.parameters
+            scale = placement.residual_scale()
+            dense = placement.residuals_jacobian(keys, scale)
+            sparse = placement.residuals_sparse_jacobian(keys, scale)
+            self.assertEqual(sparse.shape, dense.shape)
+            self.assertLess(np.max(np.fabs(sparse.toarray() - dense)), 1e-12)
+            checked += 1
+
+    def test_least_squares_sparse(self):
+        threshold = placement_module.SPARSE_JACOBIAN_THRESHOLD
+        placement_module.SPARSE_JACOBIAN_THRESHOLD = 0
+        try:
+            np.random.seed(0)
+            placement = iterative_placement(self.createScene(), method='least_squares')
+        finally:
+            placement_module.SPARSE_JACOBIAN_THRESHOLD = threshold
+        self.assertIsNotNone(placement)
+        self.assertLess(placement.deviation(), 1e-14)
+
+    def test_least_squares(self):
+        np.random.seed(0)
+        placement = iterative_placement(self.createScene(), method='least_squares')
+        self.assertIsNotNone(placement)
+        self.assertLess(placement.deviation(), 1e-14)
@@ -0,0 +1,164 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+
+from sandbox import Scene, iterative_placement, incremental_placement
+from sandbox.placement import BatchPlacement, ConstructionPlan, Placement, PlacementCache, scene_fingerprint
+
+class TestMultiStartPlacement(unittest.TestCase):
+    def createScene(self):
+        scene = Scene()
+        triangle = scene.nondegenerate_triangle(labels=('A', 'B', 'C'))
+        A, B, C = triangle.points
+        A.distance_constraint('B', 5)
+        C.distance_constraint('B', 4)
+        C.distance_constraint('A', 3)
+        scene.incircle(triangle, label='incircle')
+        return scene
+
+    def test_parallel_first_success(self):
+        scene = self.createScene()
+        np.random.seed(0)
+        attempts = []
+        placement = iterative_placement(scene, processes=2, attempts=attempts)
+        self.assertIsNotNone(placement)
+        self.assertLess(placement.deviation(), 1e-14)
+        self.assertLess(np.fabs(placement.radius(scene.get('incircle')) - 1), 1e-5)
+        successful = [att for att in attempts if att.success]
+        self.assertGreaterEqual(len(successful), 1)
+        self.assertEqual(len(set(att.seed for att in attempts)), len(attempts))
+
+    def test_batch(self):
+        scene = self.createScene()
+        np.random.seed(0)
+        attempts = []
+        placement = iterative_placement(scene, batch_size=64, attempts=attempts)
+        self.assertIsNotNone(placement)
+        self.assertLess(placement.deviation(), 1e-14)
+        self.assertLess(np.fabs(placement.radius(scene.get('incircle')) - 1), 1e-5)
+        self.assertTrue(attempts[-1].success)
+
+    def test_batch_vertical_line(self):
+        scene = Scene()
+        A = scene.free_point(label='A', x=1, y=0)
+        B = scene.free_point(label='B', x=1, y=3)
+        O = scene.free_point(label='O')
+        circle = O.circle_through(scene.free_point(label='P'))
+        circle.intersection_point(A.line_through(B), label='X')
+        scene.freeze()
+        plan = ConstructionPlan(scene)
+        data = np.array([[0.5, 1, 3, 2], [2, 1, 0, 1.5]])
+        batch = BatchPlacement(plan, data)
+        self.assertTrue(np.all(batch.valid))
+        for item, row in zip(batch.xy, data):
+            placement = Placement(scene, dict(zip(plan.parameters, row)), plan=plan)
+            for (p, origin, operands), xy in zip(plan.steps, item):
+                loc = placement.location(p)
+                self.assertLess(np.hypot(loc.x - xy[0], loc.y - xy[1]), 1e-12, p.label)
+
+    def test_decomposed(self):
+        scene = self.createScene()
+        np.random.seed(0)
+        placement = iterative_placement(scene, decompose=True)
+        self.assertIsNotNone(placement)
+        self.assertLess(placement.deviation(), 1e-14)
+        self.assertLess(np.fabs(placement.radius(scene.get('incircle')) - 1), 1e-5)
+
+    def test_clusters(self):
+        scene = Scene()
+        A = scene.free_point(label='A')
+        B = scene.free_point(label='B')
+        C = scene.free_point(label='C')
+        for label, (pt0, pt1) in (('X', (A, B)), ('Y', (B, C))):
+            apex = scene.free_point(label=label)
+            pt0.segment(apex).congruent_constraint(pt0.segment(pt1))
+            pt1.segment(apex).congruent_constraint(pt0.segment(pt1))
+        scene.freeze()
+        plan = ConstructionPlan(scene)
+        clusters = [(len(rows), [plan.parameters[c] for c in columns]) for rows, columns in plan.clusters()]
+        self.assertEqual(clusters, [(2, ['X.x', 'X.y']), (2, ['Y.x', 'Y.y'])])
+
+    def test_incremental(self):
+        scene = self.createScene()
+        np.random.seed(0)
+        placement = iterative_placement(scene)
+        self.assertIsNotNone(placement)
+        A, B = scene.get('A'), scene.get('B')
+        D = scene.free_point(label='D')
+        A.segment(D).congruent_constraint(A.segment(B))
+        B.segment(D).congruent_constraint(A.segment(B))
+        attempts = []
+        extended = incremental_placement(placement, attempts=attempts)
+        self.assertIsNotNone(extended)
+        self.assertLess(extended.deviation(), 1e-14)
+        for label in ('A', 'B', 'C'):
+            self.assertEqual(extended.location(label), placement.location(label))
+        self.assertLess(np.fabs(extended.distance('A', 'D') - 5), 1e-6)
+
+    def test_incremental_widened(self):
+        scene = Scene()
+        A = scene.free_point(label='A')
+        B = scene.free_point(label='B')
+        C = scene.free_point(label='C')
+        np.random.seed(0)
+        placement = iterative_placement(scene)
+        # a constraint on the placed points cannot be met by the new parameters
+        A.segment(B).congruent_constraint(A.segment(C))
+        scene.free_point(label='D')
+        extended = incremental_placement(placement)
+        self.assertIsNotNone(extended)
+        self.assertLess(extended.deviation(), 1e-14)
+        self.assertLess(np.fabs(extended.distance(A, B) - extended.distance(A, C)), 1e-6)
+
+    def test_seed(self):
+        np.random.seed(0)
+        placement0 = iterative_placement(self.createScene(), seed=5)
+        value = np.random.random()
+        np.random.seed(0)
+        placement1 = iterative_placement(self.createScene(), seed=5)
+        self.assertEqual(np.random.random(), value)
+        self.assertEqual(placement0.params, placement1.params)
+
+    def test_parallel_seed(self):
+        results = []
+        for _ in range(0, 2):
+            attempts = []
+            placement = iterative_placement(self.createScene(), processes=2, seed=5, attempts=attempts)
+            self.assertIsNotNone(placement)
+            first = min(att.index for att in attempts if att.success)
+            # the attempts before the first success are not cancelled
+            self.assertEqual([att.index for att in attempts if att.index <= first], list(range(0, first + 1)))
+            self.assertFalse(any(att.error == 'Cancelled' for att in attempts if att.index < first))
+            results.append(placement.params)
+        self.assertEqual(results[0], results[1])
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            scene = self.createScene()
+            placement = iterative_placement(scene, seed=0, cache=directory)
+            self.assertIsNotNone(placement)
+            self.assertEqual(os.listdir(directory), [scene_fingerprint(scene) + '.json'])
+
+            # the same scene built again
+            scene = self.createScene()
+            attempts = []
+            cached = iterative_placement(scene, cache=PlacementCache(directory), attempts=attempts)
+            self.assertEqual(attempts, [])
+            self.assertEqual(cached.params, placement.params)
+            self.assertLess(cached.deviation(), 1e-14)
+
+            # an invalid entry is not used
+            path = os.path.join(directory, scene_fingerprint(scene) + '.json')
+            with open(path, 'w') as out:
+                out.write('{"params": {"A.x": 0}}')
+            placement = iterative_placement(scene, seed=1, cache=directory, attempts=attempts)
+            self.assertGreater(len(attempts), 0)
+            self.assertLess(placement.deviation(), 1e-14)
+
+    def test_fingerprint(self):
+        scene = self.createScene()
+        fingerprint = scene_fingerprint(scene)
+        self.assertEqual(scene_fingerprint(self.createScene()), fingerprint)
+        scene.get('A').distance_constraint('B', 6)
+        self.assertNotEqual(scene_fingerprint(scene), fingerprint)